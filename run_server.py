@@ -1,6 +1,6 @@
 import uvicorn
-from server.app import app
 import argparse
+import importlib.util
 import os
 from dotenv import load_dotenv
 from rich.console import Console
@@ -13,6 +13,13 @@ if __name__ == "__main__":
     group = parser.add_mutually_exclusive_group()
     group.add_argument("--local", action="store_true", help="使用本地部署的模型")
     group.add_argument("--api", action="store_true", help="使用API访问远端模型")
+    group.add_argument("--stub", action="store_true", help="使用本地桩模型，用于压测")
+    parser.add_argument("--host", default="0.0.0.0", help="监听地址")
+    parser.add_argument("--port", type=int, default=8080, help="监听端口")
+    parser.add_argument("--workers", type=int, default=1, help="worker进程数，生产环境一般设为CPU核数；LLM并发和排队上限按worker数平分")
+    parser.add_argument("--max-requests", type=int, default=0, help="每个worker处理多少请求后平滑重启，0表示不重启")
+    parser.add_argument("--max-requests-jitter", type=int, default=0, help="重启阈值的随机抖动，避免所有worker同时重启")
+    parser.add_argument("--graceful-timeout", type=int, default=30, help="worker退出时等待进行中请求完成的秒数")
     args = parser.parse_args()
     
     # 创建Rich控制台
@@ -26,6 +33,9 @@ if __name__ == "__main__":
     elif args.api:
         os.environ["MODEL_SOURCE"] = "aliyun"
         model_msg = "远端"
+    elif args.stub:
+        os.environ["MODEL_SOURCE"] = "stub"
+        model_msg = "桩模型"
     else:
         # 默认使用本地模式
         os.environ["MODEL_SOURCE"] = "local"
@@ -34,14 +44,24 @@ if __name__ == "__main__":
     # 加载环境变量
     load_dotenv()
     
+    # 每个worker各有一个LLM任务调度器，LLM_MAX_CONCURRENCY、LLM_MAX_QUEUE和各后端的max_concurrency
+    # 是整个服务的上限，worker导入时按该变量平分，避免N个worker向后端发出N倍的请求
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+    
+    # 安装了uvloop/httptools时使用它们，否则退回标准库事件循环和h11
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    
     # 创建面板内容
     panel_content = Text()
     panel_content.append("模型配置: ", style="bold cyan")
     panel_content.append(f"{model_msg}\n", style="green")
+    panel_content.append("运行配置: ", style="bold cyan")
+    panel_content.append(f"{args.workers} 个worker，事件循环 {loop}，HTTP解析 {http}\n", style="green")
     panel_content.append("系统地址: ", style="bold cyan")
-    panel_content.append("http://localhost:8080\n", style="blue underline")
+    panel_content.append(f"http://localhost:{args.port}\n", style="blue underline")
     panel_content.append("文档地址: ", style="bold cyan")
-    panel_content.append("http://localhost:8080/docs", style="blue underline")
+    panel_content.append(f"http://localhost:{args.port}/docs", style="blue underline")
     
     # 显示面板
     console.print(Panel(
@@ -54,4 +74,20 @@ if __name__ == "__main__":
     ))
     
     # 启动服务器
-    uvicorn.run(app, host="0.0.0.0", port=8080)
\ No newline at end of file
+    # 以导入字符串的形式传入应用，每个worker进程在设置好环境变量后各自导入；
+    # 排盘和报告缓存通过共享缓存文件在worker之间共享（见 server/shared_cache.py），
+    # 报告流缓冲区和LLM任务队列仍是每个worker各自的（队列的并发上限已按worker数平分），断线续传需要负载均衡保持会话粘滞。
+    # worker处理满 --max-requests 个请求后停止接收新连接、处理完进行中的请求后退出，由主进程补起新的worker
+    uvicorn.run(
+        "server.app:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=loop,
+        http=http,
+        limit_max_requests=args.max_requests or None,
+        limit_max_requests_jitter=args.max_requests_jitter,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        # 访问日志由应用自己的中间件输出（带请求ID和阶段耗时）
+        access_log=False
+    )
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+响应压缩基准：统计压缩节省的字节数和每个响应的CPU开销
+
+- 报告（SSE）：用桩模型生成一份报告，取未压缩的SSE事件序列，按中间件的方式逐事件压缩并flush；
+  同时给出整体一次性压缩的结果作为下限参考，差值即逐事件flush的代价
+- 排盘结果（JSON）：单个命盘的响应
+- 批量排盘（NDJSON）：--batch 个命盘，逐行flush
+
+安装了brotli时同时测量br。
+
+示例：
+    python scripts/bench_compression.py
+    python scripts/bench_compression.py --report-repeat 20 --batch 200 --rounds 50
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Callable, Dict, List
+
+# 将父目录添加到系统路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("MODEL_SOURCE", "stub")
+os.environ.setdefault("STUB_LLM_TTFT", "0")
+os.environ.setdefault("STUB_LLM_TPS", "0")
+os.environ.setdefault("SHARED_CACHE_PATH", "")
+os.environ.setdefault("CHART_DB_PATH", "")
+
+import logging
+
+from fastapi.testclient import TestClient
+
+from server.compression import StreamCompressor, brotli
+from server.stub_model import DEFAULT_STUB_TEXT
+
+IDENTITY = {"Accept-Encoding": "identity"}
+
+
+def split_events(body: bytes, delimiter: bytes) -> List[bytes]:
+    """按分隔符切分为事件，每个事件保留分隔符"""
+    parts = body.split(delimiter)
+    return [part + delimiter for part in parts[:-1]] + ([parts[-1]] if parts[-1] else [])
+
+
+def stream_compress(events: List[bytes], encoding: str, level: int) -> bytes:
+    """与中间件相同：连续压缩，每个事件后flush"""
+    if encoding == "br":
+        compressor = StreamCompressor(encoding, brotli_quality=level)
+    else:
+        compressor = StreamCompressor(encoding, gzip_level=level)
+    out = [compressor.compress(event) + compressor.flush() for event in events]
+    out.append(compressor.finish())
+    return b"".join(out)
+
+
+def whole_compress(events: List[bytes], encoding: str, level: int) -> bytes:
+    if encoding == "br":
+        compressor = StreamCompressor(encoding, brotli_quality=level)
+    else:
+        compressor = StreamCompressor(encoding, gzip_level=level)
+    return compressor.compress(b"".join(events)) + compressor.finish()
+
+
+def cpu_us(fn: Callable[[], bytes], rounds: int) -> float:
+    start = time.process_time()
+    for _ in range(rounds):
+        fn()
+    return (time.process_time() - start) / rounds * 1e6
+
+
+def measure(events: List[bytes], rounds: int) -> Dict:
+    original = sum(len(event) for event in events)
+    settings = [("gzip", 1), ("gzip", 6)] + ([("br", 4), ("br", 5)] if brotli is not None else [])
+    rows = []
+    for encoding, level in settings:
+        streamed = stream_compress(events, encoding, level)
+        whole = whole_compress(events, encoding, level)
+        rows.append({
+            "encoding": f"{encoding}-{level}",
+            "bytes": len(streamed),
+            "saved": round(1 - len(streamed) / original, 3),
+            "whole_bytes": len(whole),
+            "cpu_us": round(cpu_us(lambda: stream_compress(events, encoding, level), rounds), 1),
+        })
+    return {"events": len(events), "original_bytes": original, "results": rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="响应压缩基准")
+    parser.add_argument("--report-repeat", type=int, default=15, help="桩模型报告文本重复次数，用于模拟真实报告长度")
+    parser.add_argument("--batch", type=int, default=100, help="批量排盘的命盘数")
+    parser.add_argument("--rounds", type=int, default=20, help="CPU耗时测量轮数")
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    args = parser.parse_args()
+
+    os.environ.setdefault("STUB_LLM_TEXT", DEFAULT_STUB_TEXT * args.report_repeat)
+    logging.disable(logging.CRITICAL)
+    from server.app import app
+    client = TestClient(app)
+
+    birth = {"year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 0, "gender": "male"}
+    report = client.post("/api/fate_report", json=birth, headers=IDENTITY).content
+    chart = client.post("/api/calculate_bazi", json=birth, headers=IDENTITY).content
+    rng = random.Random(1)
+    records = [{"year": rng.randint(1950, 2010), "month": rng.randint(1, 12), "day": rng.randint(1, 28),
+                "hour": rng.randint(0, 23), "minute": 0, "gender": rng.choice(["male", "female"])} for _ in range(args.batch)]
+    batch = client.post("/api/calculate_bazi/batch", json=records, headers=IDENTITY).content
+
+    cases = {
+        "report_sse": measure(split_events(report, b"\n\n"), args.rounds),
+        "chart_json": measure([chart], args.rounds),
+        f"batch_{args.batch}_ndjson": measure(split_events(batch, b"\n"), args.rounds),
+    }
+    if args.json:
+        print(json.dumps(cases, ensure_ascii=False, indent=2))
+        return
+    print(f"brotli {'已安装' if brotli is not None else '未安装，只测gzip'}")
+    for name, case in cases.items():
+        print(f"\n{name}：{case['events']} 个事件，原始 {case['original_bytes']} 字节")
+        print(f"{'编码':<10}{'压缩后':>10}{'节省':>8}{'整体压缩':>10}{'CPU(µs)':>10}")
+        for row in case["results"]:
+            print(f"{row['encoding']:<10}{row['bytes']:>10}{row['saved']:>8.1%}{row['whole_bytes']:>10}{row['cpu_us']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
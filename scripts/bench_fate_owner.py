@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+命主排盘结果构建基准：比较排盘引擎输出的字典转换为BaziInfo的两种写法
+
+- before：原来的写法，逐字段校验构造 PillarInfo/TenGodInfo/DestinyCycleInfo，每个请求新建十几个柱对象
+- after： server.fate_owner.build_bazi_info，model_construct 跳过校验，柱和十神取共享的享元实例
+
+同时给出 FateOwner.calculate_bazi 整体的耗时（其中大部分是历法计算），以及两种写法结果是否一致。
+
+示例：
+    python scripts/bench_fate_owner.py --samples 200 --repeat 5
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from typing import Callable, Dict, List
+
+# 将父目录添加到系统路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server.fate_owner as fate_owner_module
+from server.define import (BaziInfo, DestinyCycleInfo, EarthlyBranch, Gender, HeavenlyStem, PillarInfo,
+                           SolarBirthInfo, StartAge, TenGodInfo, TenGodType)
+from server.fate_owner import FateOwner, build_bazi_info
+from server.terminology import BRANCH, DAY, DECADE_PILLAR, FIVE_ELEMENTS, HIDDEN_STEM, HOUR, MONTH, STEM, TEN_GODS, YEAR
+
+
+def build_bazi_info_validated(bazi_dict: Dict) -> BaziInfo:
+    """原来的写法：逐字段构造并校验每个模型，每柱都新建PillarInfo"""
+    # 构建PillarInfo对象
+    year_pillar = PillarInfo(
+        heavenly_stem=HeavenlyStem(bazi_dict[YEAR][STEM]),
+        earthly_branch=EarthlyBranch(bazi_dict[YEAR][BRANCH]),
+        hidden_stem=[HeavenlyStem(stem) for stem in bazi_dict[YEAR][HIDDEN_STEM]]
+    )
+    month_pillar = PillarInfo(
+        heavenly_stem=HeavenlyStem(bazi_dict[MONTH][STEM]),
+        earthly_branch=EarthlyBranch(bazi_dict[MONTH][BRANCH]),
+        hidden_stem=[HeavenlyStem(stem) for stem in bazi_dict[MONTH][HIDDEN_STEM]]
+    )
+    day_pillar = PillarInfo(
+        heavenly_stem=HeavenlyStem(bazi_dict[DAY][STEM]),
+        earthly_branch=EarthlyBranch(bazi_dict[DAY][BRANCH]),
+        hidden_stem=[HeavenlyStem(stem) for stem in bazi_dict[DAY][HIDDEN_STEM]]
+    )
+    hour_pillar = PillarInfo(
+        heavenly_stem=HeavenlyStem(bazi_dict[HOUR][STEM]),
+        earthly_branch=EarthlyBranch(bazi_dict[HOUR][BRANCH]),
+        hidden_stem=[HeavenlyStem(stem) for stem in bazi_dict[HOUR][HIDDEN_STEM]]
+    )
+    
+    # 构建十神信息
+    ten_gods = {}
+    if TEN_GODS in bazi_dict:
+        for pillar_name, gods in bazi_dict[TEN_GODS].items():
+            ten_gods[pillar_name] = TenGodInfo(
+                heavenly_stem=TenGodType(gods[TEN_GODS]),
+                earthly_branch=TenGodType(gods[BRANCH]),
+                hidden_stems=[TenGodType(god) for god in gods[HIDDEN_STEM]]
+            )
+    
+    # 构建大运信息
+    destiny_cycle = None
+    destiny_dict = bazi_dict.get(DECADE_PILLAR)
+    
+    if destiny_dict:
+        destiny_cycles = [
+            PillarInfo(
+                heavenly_stem=HeavenlyStem(cycle[STEM]),
+                earthly_branch=EarthlyBranch(cycle[BRANCH]),
+                hidden_stem=[HeavenlyStem(stem) for stem in cycle[HIDDEN_STEM]]
+            )
+            for cycle in destiny_dict["cycles"]
+        ]
+        
+        destiny_cycle = DestinyCycleInfo(
+            cycles=destiny_cycles,
+            start_age=StartAge(**destiny_dict["start_age"]),
+            is_forward=destiny_dict["is_forward"]
+        )
+    
+    # 创建八字信息
+    return BaziInfo(
+        year_pillar=year_pillar,
+        month_pillar=month_pillar,
+        day_pillar=day_pillar,
+        hour_pillar=hour_pillar,
+        five_elements=bazi_dict[FIVE_ELEMENTS],
+        ten_gods=ten_gods,
+        destiny_cycle=destiny_cycle
+    )
+
+
+def random_owners(samples: int, seed: int) -> List[FateOwner]:
+    rng = random.Random(seed)
+    owners = []
+    for _ in range(samples):
+        day = date(1900, 2, 1) + timedelta(days=rng.randrange((date(2100, 12, 31) - date(1900, 2, 1)).days))
+        gender = rng.choice(["male", "female"])
+        birth = SolarBirthInfo(gender=gender, year=day.year, month=day.month, day=day.day,
+                               hour=rng.randrange(24), minute=rng.randrange(60))
+        owners.append(FateOwner(gender=Gender.MALE if gender == "male" else Gender.FEMALE, solar_birth_info=birth))
+    return owners
+
+
+def best_of(repeat: int, func: Callable[[], None], count: int) -> float:
+    """多轮中最快一轮的单次耗时（秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        func()
+        best = min(best, (time.perf_counter() - started_at) / count)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BaziInfo构建基准")
+    parser.add_argument("--samples", type=int, default=200, help="随机出生时间的数量")
+    parser.add_argument("--seed", type=int, default=2024, help="随机种子")
+    parser.add_argument("--repeat", type=int, default=5, help="测量轮数，取最快一轮")
+    args = parser.parse_args()
+
+    owners = random_owners(args.samples, args.seed)
+    engine = FateOwner.engine
+    bazi_dicts: List[Dict] = [
+        engine.calculate_bazi_from_lunar(
+            lunar_year=o.lunar_birth_info.year, lunar_month=o.lunar_birth_info.month, lunar_day=o.lunar_birth_info.day,
+            hour=o.lunar_birth_info.hour, minute=o.lunar_birth_info.minute,
+            is_leap_month=o.lunar_birth_info.is_leap_month, gender=str(o.gender)
+        )
+        for o in owners
+    ]
+
+    mismatches = sum(build_bazi_info_validated(d).model_dump() != build_bazi_info(d).model_dump() for d in bazi_dicts)
+
+    before = best_of(args.repeat, lambda: [build_bazi_info_validated(d) for d in bazi_dicts], len(bazi_dicts))
+    after = best_of(args.repeat, lambda: [build_bazi_info(d) for d in bazi_dicts], len(bazi_dicts))
+
+    def calculate_all():
+        for o in owners:
+            o.calculate_bazi()
+
+    fate_owner_module.build_bazi_info = build_bazi_info_validated
+    try:
+        total_before = best_of(args.repeat, calculate_all, len(owners))
+    finally:
+        fate_owner_module.build_bazi_info = build_bazi_info
+    total_after = best_of(args.repeat, calculate_all, len(owners))
+
+    print(f"样本 {len(bazi_dicts)} 个，两种写法结果不一致 {mismatches} 个")
+    print(f"{'项目':<28}{'before(µs)':>12}{'after(µs)':>12}{'加速':>8}")
+    print(f"{'字典 -> BaziInfo':<28}{before * 1e6:>12.1f}{after * 1e6:>12.1f}{before / after:>7.1f}x")
+    print(f"{'FateOwner.calculate_bazi':<28}{total_before * 1e6:>12.1f}{total_after * 1e6:>12.1f}{total_before / total_after:>7.2f}x")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+排盘响应序列化基准：比较排盘接口响应体的三种编码方式，分别测单个命盘和批量命盘（JSON数组）
+
+- before：原来的写法，构造字典后由 FastAPI 经 jsonable_encoder 和 JSONResponse（标准库json）编码
+- orjson：同样构造字典，跳过 jsonable_encoder，直接用 orjson 编码
+- after： server.serialization.encode_chart_response，由预先编码的四柱、十神片段拼接
+
+输出每种方式每个响应的编码耗时（微秒）和字节数，并检查三种方式输出是否一致。排盘本身不计入耗时。
+
+示例：
+    python scripts/bench_json.py --samples 200 --batch 100 --repeat 5
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Tuple
+
+# 将父目录添加到系统路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from server.define import BaziInfo, Gender, SolarBirthInfo
+from server.fate_owner import FateOwner
+from server.serialization import dumps, encode_chart_list, encode_chart_response, orjson
+
+Chart = Tuple[str, str, BaziInfo]
+
+
+def chart_dict(solar_date: str, lunar_date: str, bazi_info: BaziInfo) -> Dict:
+    """原来排盘接口返回的字典"""
+    return {
+        "solar_date": solar_date,
+        "lunar_date": lunar_date,
+        "bazi_string": bazi_info.get_bazi_string(),
+        "chart_code": bazi_info.chart_code,
+        "five_elements": bazi_info.five_elements,
+        "pillars": {
+            "year": {"heavenly_stem": bazi_info.year_pillar.heavenly_stem, "earthly_branch": bazi_info.year_pillar.earthly_branch},
+            "month": {"heavenly_stem": bazi_info.month_pillar.heavenly_stem, "earthly_branch": bazi_info.month_pillar.earthly_branch},
+            "day": {"heavenly_stem": bazi_info.day_pillar.heavenly_stem, "earthly_branch": bazi_info.day_pillar.earthly_branch},
+            "hour": {"heavenly_stem": bazi_info.hour_pillar.heavenly_stem, "earthly_branch": bazi_info.hour_pillar.earthly_branch}
+        },
+        "ten_gods": {
+            pillar: {"heavenly_stem": god.heavenly_stem, "earthly_branch": god.earthly_branch}
+            for pillar, god in bazi_info.ten_gods.items()
+        } if bazi_info.ten_gods else {}
+    }
+
+
+def encode_before(charts: List[Chart]) -> bytes:
+    content = [chart_dict(*chart) for chart in charts]
+    return JSONResponse(jsonable_encoder(content if len(content) > 1 else content[0])).body
+
+
+def encode_orjson(charts: List[Chart]) -> bytes:
+    content = [chart_dict(*chart) for chart in charts]
+    return dumps(content if len(content) > 1 else content[0])
+
+
+def encode_after(charts: List[Chart]) -> bytes:
+    if len(charts) == 1:
+        return encode_chart_response(*charts[0])
+    return encode_chart_list([encode_chart_response(*chart) for chart in charts])
+
+
+METHODS: Dict[str, Callable[[List[Chart]], bytes]] = {
+    "before": encode_before,
+    "orjson": encode_orjson,
+    "after": encode_after,
+}
+
+
+def make_charts(samples: int, seed: int) -> List[Chart]:
+    rng = random.Random(seed)
+    charts = []
+    for _ in range(samples):
+        day = date(1900, 1, 1) + timedelta(days=rng.randrange(200 * 365))
+        gender = rng.choice([Gender.MALE, Gender.FEMALE])
+        birth = SolarBirthInfo(year=day.year, month=day.month, day=day.day, hour=rng.randrange(24),
+                               minute=rng.randrange(60), gender=gender)
+        owner = FateOwner(gender=gender, solar_birth_info=birth)
+        bazi_info = owner.calculate_bazi()
+        bazi_info.chart_code  # 编码在排盘后缓存，不计入序列化耗时
+        charts.append((str(birth), str(owner.lunar_birth_info), bazi_info))
+    return charts
+
+
+def measure(fn: Callable[[List[Chart]], bytes], groups: List[List[Chart]], repeat: int) -> float:
+    """每组的编码耗时（微秒），取多轮的最小值"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for group in groups:
+            fn(group)
+        best = min(best, time.perf_counter() - start)
+    return best / len(groups) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="排盘响应序列化基准")
+    parser.add_argument("--samples", type=int, default=200, help="随机命盘数")
+    parser.add_argument("--batch", type=int, default=100, help="批量响应中的命盘数")
+    parser.add_argument("--repeat", type=int, default=5, help="测量轮数，取最小值")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    args = parser.parse_args()
+
+    charts = make_charts(args.samples, args.seed)
+    cases = {
+        "single": [[chart] for chart in charts],
+        f"batch_{args.batch}": [charts[i:i + args.batch] for i in range(0, len(charts), args.batch)],
+    }
+
+    report = {"orjson": orjson is not None, "cases": {}}
+    for case, groups in cases.items():
+        outputs = {name: [fn(group) for group in groups] for name, fn in METHODS.items()}
+        identical = all(outputs[name] == outputs["before"] for name in METHODS)
+        rows = {}
+        for name, fn in METHODS.items():
+            rows[name] = {
+                "us": round(measure(fn, groups, args.repeat), 2),
+                "bytes": round(sum(len(body) for body in outputs[name]) / len(groups)),
+            }
+        for name in METHODS:
+            rows[name]["speedup"] = round(rows["before"]["us"] / rows[name]["us"], 2)
+        report["cases"][case] = {"identical": identical, "methods": rows}
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    print(f"命盘 {args.samples} 个，orjson {'已安装' if report['orjson'] else '未安装（标准库json）'}")
+    for case, result in report["cases"].items():
+        print(f"\n{case}（输出一致: {result['identical']}）")
+        print(f"{'方式':<10}{'耗时(µs)':>12}{'字节':>10}{'加速':>8}")
+        for name, row in result["methods"].items():
+            print(f"{name:<10}{row['us']:>12.2f}{row['bytes']:>10}{row['speedup']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+日志开销基准：比较一次报告请求在事件循环线程上的日志耗时
+
+- before：原来的写法，logging.basicConfig 同步写出，f-string 在级别被禁用时也会求值
+          （包括 model_dump()、命主对象的repr，以及每个内容块一条DEBUG日志）
+- after： server.logging_config 的写法，调用线程只入队，JSON格式化和写出在后台线程完成，
+          参数惰性格式化，DEBUG日志在级别禁用时直接跳过
+
+日志写到 os.devnull，测得的是调用线程本身的开销；真实终端或磁盘越慢，差距越大。
+
+示例：
+    python scripts/bench_logging.py --requests 2000 --chunks 300
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+# 将父目录添加到系统路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.define import BasicUserInput, Gender
+from server.fate_owner import FateOwner
+from server.logging_config import build_queue_handler, request_id_var
+
+
+def make_logger(name: str, handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+
+def request_before(logger: logging.Logger, user_input, fate_owner, bazi_info, chunks: int) -> None:
+    """原来的日志调用序列"""
+    logger.info("=== 开始处理 basic_report 请求 ===")
+    logger.info(f"请求方法: POST")
+    logger.info(f"请求路径: /api/basic_report")
+    logger.info(f"请求数据: {user_input.model_dump()}")
+    logger.info(f"命主对象创建成功: {fate_owner}")
+    logger.info("开始计算八字...")
+    logger.info(f"八字计算完成: {bazi_info.get_bazi_string()}")
+    logger.info("开始生成命理报告...")
+    for i in range(chunks):
+        content = "命"
+        logger.debug(f"收到内容块: {content}")
+    logger.info("命理报告生成完成")
+
+
+def request_after(logger: logging.Logger, user_input, fate_owner, bazi_info, chunks: int) -> None:
+    """现在的日志调用序列"""
+    logger.info("开始处理 basic_report 请求")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("请求数据: %s", user_input.model_dump())
+    logger.debug("命主对象创建成功: %s", fate_owner)
+    logger.debug("八字计算完成: %s", bazi_info)
+    logger.info("开始生成命理报告...")
+    log_chunks = logger.isEnabledFor(logging.DEBUG)
+    for i in range(chunks):
+        content = "命"
+        if log_chunks:
+            logger.debug("收到内容块: %s", content)
+    logger.info("命理报告生成完成")
+    # 访问日志
+    logger.info("%s %s %d %.1fms", "POST", "/api/basic_report", 200, 12.3,
+                extra={"method": "POST", "path": "/api/basic_report", "status": 200, "duration_ms": 12.3,
+                       "stages": {"validation": 0.4, "charting": 10.2, "prompt_build": 0.1}})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="日志开销基准")
+    parser.add_argument("--requests", type=int, default=2000, help="模拟的请求数")
+    parser.add_argument("--chunks", type=int, default=300, help="每个请求的内容块数")
+    args = parser.parse_args()
+
+    user_input = BasicUserInput(gender="male", year=1990, month=1, day=1, hour=12, minute=0)
+    fate_owner = FateOwner(gender=Gender.MALE, solar_birth_info=user_input.to_solar_birth_info())
+    bazi_info = fate_owner.calculate_bazi()
+
+    with open(os.devnull, "w") as devnull:
+        # 原来：同步StreamHandler
+        sync_handler = logging.StreamHandler(devnull)
+        sync_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        logger = make_logger("bench.before", sync_handler)
+        started_at = time.perf_counter()
+        for _ in range(args.requests):
+            request_before(logger, user_input, fate_owner, bazi_info, args.chunks)
+        before = (time.perf_counter() - started_at) / args.requests
+
+        # 现在：入队 + 后台线程写出JSON；限速关闭，保证两边输出的日志条数可比
+        queue_handler, listener = build_queue_handler("json", devnull, rate_limit=0)
+        logger = make_logger("bench.after", queue_handler)
+        listener.start()
+        token = request_id_var.set("bench")
+        started_at = time.perf_counter()
+        for _ in range(args.requests):
+            request_after(logger, user_input, fate_owner, bazi_info, args.chunks)
+        after = (time.perf_counter() - started_at) / args.requests
+        request_id_var.reset(token)
+        drain_started_at = time.perf_counter()
+        listener.stop()
+        drain = (time.perf_counter() - drain_started_at) / args.requests
+
+    print(f"请求数 {args.requests}，每个请求 {args.chunks} 个内容块")
+    print(f"before（同步写出）        调用线程 {before * 1e6:9.1f} µs/请求")
+    print(f"after （队列 + JSON）     调用线程 {after * 1e6:9.1f} µs/请求，后台线程剩余写出 {drain * 1e6:.1f} µs/请求")
+    print(f"调用线程开销降低 {before / after:.1f}x" if after > 0 else "")
+    print(f"丢弃的日志条数: {queue_handler.dropped}")
+
+
+if __name__ == "__main__":
+    main()
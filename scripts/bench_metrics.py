@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+指标记录开销基准：测量按标签取子指标并记录一次的耗时
+
+- counter：labels(...).inc()
+- histogram：labels(...).observe(...)
+- baseline：同样次数的空循环加一次字典查找，作为本机的参照
+
+输出每次记录的平均耗时（微秒）及相对参照的倍数。耗时与机器和负载有关，只用于比较改动前后的差异。
+
+示例：
+    python scripts/bench_metrics.py
+    python scripts/bench_metrics.py --n 200000 --repeat 5 --json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict
+
+# 将父目录添加到系统路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.metrics import MetricsRegistry
+
+
+def best_of(fn: Callable[[int], None], n: int, repeat: int) -> float:
+    """多次运行取最快的一次，返回每次调用的平均耗时（微秒）"""
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        fn(n)
+        timings.append(time.perf_counter() - started_at)
+    return min(timings) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="指标记录开销基准")
+    parser.add_argument("--n", type=int, default=100000, help="每轮记录次数")
+    parser.add_argument("--repeat", type=int, default=3, help="轮数，取最快的一轮")
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    args = parser.parse_args()
+
+    metrics = MetricsRegistry()
+    histogram = metrics.histogram("overhead_seconds", "开销测试", ["endpoint", "stage"])
+    counter = metrics.counter("overhead_total", "开销测试", ["endpoint", "stage"])
+    lookup = {("fate_report", "charting"): 0}
+
+    def baseline(n: int) -> None:
+        for _ in range(n):
+            lookup.get(("fate_report", "charting"))
+
+    def count(n: int) -> None:
+        for _ in range(n):
+            counter.labels("fate_report", "charting").inc()
+
+    def observe(n: int) -> None:
+        for _ in range(n):
+            histogram.labels("fate_report", "charting").observe(0.003)
+
+    result: Dict[str, float] = {
+        "baseline": best_of(baseline, args.n, args.repeat),
+        "counter": best_of(count, args.n, args.repeat),
+        "histogram": best_of(observe, args.n, args.repeat),
+    }
+
+    if args.json:
+        print(json.dumps({name: round(us, 3) for name, us in result.items()}, indent=2))
+        return
+    print(f"每次记录 {args.n} 次，取 {args.repeat} 轮中最快的一轮")
+    print(f"{'操作':<12}{'耗时(us)':>10}{'相对参照':>10}")
+    for name, us in result.items():
+        print(f"{name:<12}{us:>10.3f}{us / result['baseline']:>10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
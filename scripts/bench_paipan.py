@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+排盘引擎热点路径的微基准测试
+
+覆盖 solar_to_lunar、_calculate_bazi、_calculate_ten_gods、_get_nearest_jieqi_time、
+_calculate_dayun_start_age、FateOwner.calculate_bazi 和 BaziInfo 构造。
+输入为1900-2100年之间固定随机种子生成的出生时间。
+
+每项取多轮中最快一轮的单次耗时，并除以同一进程内纯Python校准循环的耗时，
+得到与机器速度基本无关的相对得分；与仓库中保存的基线（scripts/bench_paipan_baseline.json）比较，
+任一项变慢超过阈值时以非零状态退出。
+
+示例：
+    python scripts/bench_paipan.py                      # 与基线比较
+    python scripts/bench_paipan.py --threshold 0.3      # 允许变慢30%
+    python scripts/bench_paipan.py --update-baseline    # 优化后更新基线
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 将父目录添加到系统路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sxtwl
+
+from server.bazi_calculator import BaziCalculator, DAY, STEM, DECADE_PILLAR
+from server.define import BaziInfo, Gender, SolarBirthInfo
+from server.fate_owner import FateOwner
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_paipan_baseline.json")
+
+DEFAULT_THRESHOLD = 0.2  # 允许的变慢比例
+DEFAULT_SAMPLES   = 100  # 随机出生时间个数
+DEFAULT_REPEAT    = 5    # 每项测量轮数
+MIN_ROUND_SECONDS = 0.2  # 每轮最短测量时间
+DEFAULT_RETRIES   = 2    # 疑似回退的项目最多重测次数
+
+FIRST_DAY = date(1900, 2, 1)   # 避开1900年正月之前无法转换的日期
+LAST_DAY  = date(2100, 12, 31)
+
+
+def random_births(n: int, seed: int) -> List[Dict[str, Any]]:
+    """生成n个随机阳历出生时间"""
+    rng = random.Random(seed)
+    span = (LAST_DAY - FIRST_DAY).days
+    births = []
+    for _ in range(n):
+        d = FIRST_DAY + timedelta(days=rng.randrange(span))
+        births.append({
+            "year": d.year, "month": d.month, "day": d.day,
+            "hour": rng.randint(0, 23), "minute": rng.randint(0, 59),
+            "gender": rng.choice([Gender.MALE, Gender.FEMALE])
+        })
+    return births
+
+
+def _calibrate() -> int:
+    """校准循环：固定的纯Python工作量，用于抵消机器速度差异"""
+    total = 0
+    for i in range(20000):
+        total += i * i % 7
+    return total
+
+
+def measure(func: Callable, args_list: List[Tuple], repeat: int) -> float:
+    """测量单次调用耗时（纳秒），取多轮中最快的一轮"""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            for args in args_list:
+                func(*args)
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_ROUND_SECONDS:
+            break
+        loops *= 2
+
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            for args in args_list:
+                func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best / (loops * len(args_list)) * 1e9
+
+
+def build_cases(samples: int, seed: int) -> Dict[str, Tuple[Callable, List[Tuple]]]:
+    """准备各项基准的函数和输入，输入在计时前全部生成好"""
+    calculator = BaziCalculator()
+    births = random_births(samples, seed)
+
+    lunar_args = []
+    for b in births:
+        lunar = calculator.solar_to_lunar(b["year"], b["month"], b["day"])
+        lunar_args.append((lunar["year"], lunar["month"], lunar["day"], b["hour"], b["minute"], lunar["is_leap_month"], str(b["gender"])))
+
+    bazi_dicts = [calculator._calculate_bazi(*args) for args in lunar_args]
+
+    days = [sxtwl.fromSolar(b["year"], b["month"], b["day"]) for b in births]
+    jieqi_args = [(day, bazi[DECADE_PILLAR]["is_forward"]) for day, bazi in zip(days, bazi_dicts)]
+    start_age_args = [
+        ((b["year"], b["month"], b["day"], b["hour"], b["minute"]), calculator._get_nearest_jieqi_time(*args)[1])
+        for b, args in zip(births, jieqi_args)
+    ]
+
+    owners = [
+        FateOwner(gender=b["gender"], solar_birth_info=SolarBirthInfo(**b))
+        for b in births
+    ]
+    bazi_dumps = [owner.calculate_bazi().model_dump() for owner in owners]
+
+    return {
+        "solar_to_lunar"          : (calculator.solar_to_lunar, [(b["year"], b["month"], b["day"]) for b in births]),
+        "_calculate_bazi"         : (calculator._calculate_bazi, lunar_args),
+        "_calculate_ten_gods"     : (calculator._calculate_ten_gods, [(bazi, bazi[DAY][STEM]) for bazi in bazi_dicts]),
+        "_get_nearest_jieqi_time" : (calculator._get_nearest_jieqi_time, jieqi_args),
+        "_calculate_dayun_start_age": (calculator._calculate_dayun_start_age, start_age_args),
+        "FateOwner.calculate_bazi": (FateOwner.calculate_bazi, [(owner,) for owner in owners]),
+        "BaziInfo"                : (BaziInfo.model_validate, [(dump,) for dump in bazi_dumps]),
+    }
+
+
+def run_cases(cases: Dict[str, Tuple[Callable, List[Tuple]]], repeat: int, only: Optional[List[str]] = None) -> Dict[str, Any]:
+    results = {}
+    for name, (func, args_list) in cases.items():
+        if only and name not in only:
+            continue
+        # 每项前后各校准一次，抵消测量期间机器负载的变化
+        calibration_ns = measure(_calibrate, [()], repeat)
+        ns = measure(func, args_list, repeat)
+        calibration_ns = min(calibration_ns, measure(_calibrate, [()], repeat))
+        results[name] = {
+            "ns_per_op": round(ns, 1),
+            "calibration_ns": round(calibration_ns, 1),
+            "score": round(ns / calibration_ns, 6)
+        }
+    return results
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """与基线比较，返回变慢超过阈值的项目"""
+    regressions = []
+    for name, entry in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        ratio = entry["score"] / base["score"]
+        entry["vs_baseline"] = round(ratio, 3)
+        if ratio > 1 + threshold:
+            regressions.append(name)
+    return regressions
+
+
+def run(samples: int, seed: int, repeat: int, only: Optional[List[str]] = None, baseline: Optional[Dict[str, Any]] = None,
+        threshold: float = DEFAULT_THRESHOLD, retries: int = DEFAULT_RETRIES) -> Tuple[Dict[str, Any], List[str]]:
+    """运行基准并与基线比较
+
+    超过阈值的项目单独重测，保留各项最好的得分，只有多次测量都变慢才判为回退，
+    以免机器负载波动造成误报。
+    """
+    cases = build_cases(samples, seed)
+    current = {"samples": samples, "seed": seed, "results": run_cases(cases, repeat, only)}
+    if baseline is None:
+        return current, []
+
+    regressions = compare(current, baseline, threshold)
+    for _ in range(retries):
+        if not regressions:
+            break
+        for name, entry in run_cases(cases, repeat, regressions).items():
+            if entry["score"] < current["results"][name]["score"]:
+                current["results"][name] = entry
+        regressions = compare(current, baseline, threshold)
+    return current, regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="排盘引擎微基准测试")
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES, help="随机出生时间个数")
+    parser.add_argument("--seed", type=int, default=2024, help="随机种子")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="每项测量轮数")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="允许的变慢比例，如0.2表示20%%")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help="疑似回退的项目最多重测次数")
+    parser.add_argument("--only", nargs="*", help="只运行指定项目")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基线文件路径")
+    parser.add_argument("--update-baseline", action="store_true", help="把本次结果写为新基线")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出结果")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if args.update_baseline:
+        current, _ = run(args.samples, args.seed, args.repeat, args.only)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"基线已写入 {args.baseline}")
+        return
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    else:
+        print(f"未找到基线文件 {args.baseline}，仅输出本次结果")
+    current, regressions = run(args.samples, args.seed, args.repeat, args.only, baseline, args.threshold, args.retries)
+
+    if args.json:
+        print(json.dumps(current, ensure_ascii=False, indent=2))
+    else:
+        print(f"{'项目':<28}{'耗时/次':>14}{'相对基线':>10}")
+        for name, entry in current["results"].items():
+            ratio = entry.get("vs_baseline")
+            ratio_str = f"{ratio:.2f}x" if ratio is not None else "-"
+            flag = "  <- 变慢" if name in regressions else ""
+            print(f"{name:<28}{entry['ns_per_op'] / 1000:>11.2f} µs{ratio_str:>10}{flag}")
+
+    if regressions:
+        print(f"以下项目变慢超过 {args.threshold:.0%}：{', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
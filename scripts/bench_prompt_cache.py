@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+提示词前缀缓存基准：比较报告提示词两种结构下的提示词计算耗时（prompt_eval_duration）和首token时间
+
+- before：原来的单条消息，命主信息在开头，之后是分析要求和藏干表，每个请求的前缀都不同
+- after： 静态的系统消息在前（BAZI_REPORT_SYSTEM_PROMPT），命主信息在最后的用户消息中
+
+依次为一组随机命盘请求报告，每个请求只生成少量token，统计每个请求实际计算的提示词token数、
+prompt_eval_duration 和首token时间（不计第一个请求，它总是完整计算）。
+默认使用桩模型模拟Ollama的前缀缓存；--model local 时连接真实的Ollama。
+
+示例：
+    python scripts/bench_prompt_cache.py --charts 20 --prompt-tps 500
+    python scripts/bench_prompt_cache.py --model local --base-url http://127.0.0.1:11434 --ollama-model deepseek-r1:8b
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from typing import Dict, List
+
+# 将父目录添加到系统路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server.stub_model as stub_model
+from server.define import Gender, SolarBirthInfo
+from server.fate_owner import FateOwner
+from server.model import build_messages, get_chat_model
+from server.prompt_templates import BAZI_REPORT_SYSTEM_PROMPT, get_bazi_report_prompt
+
+def prompt_data(seed: int, n: int) -> List[Dict[str, str]]:
+    rng = random.Random(seed)
+    data = []
+    for _ in range(n):
+        day = date(1950, 1, 1) + timedelta(days=rng.randrange(60 * 365))
+        gender = rng.choice([Gender.MALE, Gender.FEMALE])
+        birth = SolarBirthInfo(year=day.year, month=day.month, day=day.day, hour=rng.randrange(24), gender=gender)
+        owner = FateOwner(gender=gender, solar_birth_info=birth)
+        bazi_info = owner.calculate_bazi()
+        data.append({"gender": gender.value, "lunar_date": str(owner.lunar_birth_info), "bazi": bazi_info.get_bazi_string()})
+    return data
+
+
+def before_messages(data: Dict[str, str]) -> list:
+    """原来的结构：命主信息插在角色说明之后，整个提示词作为一条用户消息"""
+    fields = get_bazi_report_prompt(data).split("\n\n")[0]
+    head, rest = BAZI_REPORT_SYSTEM_PROMPT.split("\n\n", 1)
+    return build_messages(f"{head}\n\n{fields}\n\n{rest}")
+
+
+def after_messages(data: Dict[str, str]) -> list:
+    return build_messages(get_bazi_report_prompt(data), system=BAZI_REPORT_SYSTEM_PROMPT)
+
+
+def run_case(model, messages_list: List[list]) -> Dict:
+    rows = []
+    for messages in messages_list:
+        started_at = time.perf_counter()
+        first_token_at, last = None, None
+        for chunk in model.stream(messages):
+            if first_token_at is None and chunk.content:
+                first_token_at = time.perf_counter()
+            last = chunk
+        metadata = last.response_metadata if last is not None else {}
+        rows.append({
+            "prompt_eval_count": metadata.get("prompt_eval_count", 0),
+            "prompt_eval_ms": metadata.get("prompt_eval_duration", 0) / 1e6,
+            "ttft_ms": ((first_token_at or time.perf_counter()) - started_at) * 1000,
+        })
+    warm = rows[1:] or rows
+    return {
+        "requests": len(rows),
+        "first": {key: round(value, 1) for key, value in rows[0].items()},
+        "prompt_eval_count": round(statistics.mean(r["prompt_eval_count"] for r in warm), 1),
+        "prompt_eval_ms": round(statistics.median(r["prompt_eval_ms"] for r in warm), 1),
+        "ttft_ms": round(statistics.median(r["ttft_ms"] for r in warm), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="报告提示词前缀缓存基准")
+    parser.add_argument("--charts", type=int, default=20, help="请求的命盘数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--model", choices=["stub", "local"], default="stub", help="模型后端")
+    parser.add_argument("--prompt-tps", type=float, default=500, help="桩模型的提示词计算速度（tokens/s）")
+    parser.add_argument("--base-url", default=None, help="Ollama地址（--model local）")
+    parser.add_argument("--ollama-model", default="deepseek-r1:8b", help="Ollama模型名（--model local）")
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    args = parser.parse_args()
+
+    if args.model == "stub":
+        model = get_chat_model("stub", text="好", time_to_first_token=0, tokens_per_second=0,
+                               prompt_tokens_per_second=args.prompt_tps, cache_slots=1)
+    else:
+        # 只生成少量token，测量首token时间
+        model = get_chat_model("local", base_url=args.base_url, model=args.ollama_model).bind(num_predict=8)
+
+    data = prompt_data(args.seed, args.charts)
+    report = {}
+    for name, build in (("before", before_messages), ("after", after_messages)):
+        stub_model._PROMPT_SLOTS.clear()
+        report[name] = run_case(model, [build(item) for item in data])
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    print(f"模型 {args.model}，命盘 {args.charts} 个（首个请求单独列出，其余取中位数）")
+    print(f"{'结构':<8}{'计算token':>12}{'prompt_eval(ms)':>18}{'TTFT(ms)':>12}{'首个TTFT(ms)':>16}")
+    for name, row in report.items():
+        print(f"{name:<8}{row['prompt_eval_count']:>12}{row['prompt_eval_ms']:>18}{row['ttft_ms']:>12}{row['first']['ttft_ms']:>16}")
+
+
+if __name__ == "__main__":
+    main()
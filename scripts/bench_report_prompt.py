@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+报告提示词基准：比较让模型自行推算和注入命盘事实两种提示词的token用量和耗时
+
+- derive：原来的提示词，只给出四柱八字，要求模型排出大运流年，附藏干表供模型推算十神
+- facts： 注入排盘程序算出的四柱十神、五行分值、大运和流年（server/chart_facts.py），去掉推算要求
+
+在固定的一组命盘上依次生成完整报告，统计提示词token数、输出token数、首token时间和总耗时。
+输出token的差异需要真实模型才能测出（--model local/aliyun），桩模型的输出文本固定，只能比较提示词一侧。
+
+示例：
+    python scripts/bench_report_prompt.py
+    python scripts/bench_report_prompt.py --model local --base-url http://127.0.0.1:11434 --charts 5
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from typing import Dict, List
+
+# 将父目录添加到系统路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.chart_facts import format_chart_facts
+from server.define import Gender, SolarBirthInfo
+from server.fate_owner import FateOwner
+from server.model import build_messages, get_chat_model
+from server.prompt_templates import BAZI_REPORT_SYSTEM_PROMPT, get_bazi_report_prompt
+
+# 原来的系统消息：由当前的系统消息还原推算要求和藏干表
+HIDDEN_STEM_TABLE = "可以参考的命理基础知识：\n地支藏干：\n" + "".join(
+    f"{branch}：{'、'.join(stems)}\n" for branch, stems in FateOwner.engine.BRANCH_HIDDEN_STEM.items()
+)
+DERIVE_SYSTEM_PROMPT = (
+    BAZI_REPORT_SYSTEM_PROMPT
+    .replace("3. 结合大运和流年，推断命主过往的重要经历", "3. 排出大运和流年，并列出命主的历史事件")
+    .replace("5. 分析预测当前流年的运势。", "5. 分析预测2025年的运势。")
+    .replace("四柱、藏干、十神、五行分值、大运和流年已由排盘程序算出，以用户给出的数据为准，直接引用，不要重新推算或复述。\n",
+             HIDDEN_STEM_TABLE)
+)
+
+
+def chart_set(seed: int, n: int) -> List[Dict[str, str]]:
+    """固定的一组命盘，返回 (推算版, 事实版) 的提示词数据"""
+    rng = random.Random(seed)
+    current_year = 2025
+    charts = []
+    for _ in range(n):
+        day = date(1950, 1, 1) + timedelta(days=rng.randrange(60 * 365))
+        gender = rng.choice(["male", "female"])
+        birth = SolarBirthInfo(year=day.year, month=day.month, day=day.day, hour=rng.randrange(24), gender=gender)
+        owner = FateOwner(gender=Gender.MALE if gender == "male" else Gender.FEMALE, solar_birth_info=birth)
+        bazi_info = owner.calculate_bazi()
+        data = {"gender": gender, "lunar_date": str(owner.lunar_birth_info), "bazi": bazi_info.get_bazi_string()}
+        facts = {**data, "current_date": f"{current_year}年", **format_chart_facts(bazi_info, birth, current_year)}
+        charts.append({"derive": data, "facts": facts})
+    return charts
+
+
+def run_case(model, messages_list: List[list]) -> Dict:
+    rows = []
+    for messages in messages_list:
+        started_at = time.perf_counter()
+        first_token_at, usage = None, None
+        for chunk in model.stream(messages):
+            if first_token_at is None and chunk.content:
+                first_token_at = time.perf_counter()
+            usage = chunk.usage_metadata or usage
+        finished_at = time.perf_counter()
+        rows.append({
+            "input_tokens": (usage or {}).get("input_tokens", 0),
+            "output_tokens": (usage or {}).get("output_tokens", 0),
+            "ttft_ms": ((first_token_at or finished_at) - started_at) * 1000,
+            "total_ms": (finished_at - started_at) * 1000,
+        })
+    return {key: round(statistics.mean(row[key] for row in rows), 1) for key in rows[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="报告提示词基准")
+    parser.add_argument("--charts", type=int, default=10, help="命盘数")
+    parser.add_argument("--seed", type=int, default=7, help="随机种子，固定命盘集合")
+    parser.add_argument("--model", choices=["stub", "local", "aliyun"], default="stub", help="模型后端")
+    parser.add_argument("--base-url", default=None, help="Ollama地址（--model local）")
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    args = parser.parse_args()
+
+    if args.model == "stub":
+        model = get_chat_model("stub", time_to_first_token=0, tokens_per_second=0, cache_slots=0)
+    elif args.model == "local":
+        model = get_chat_model("local", base_url=args.base_url)
+    else:
+        model = get_chat_model("aliyun")
+
+    charts = chart_set(args.seed, args.charts)
+    report = {
+        "derive": run_case(model, [build_messages(get_bazi_report_prompt(c["derive"]), system=DERIVE_SYSTEM_PROMPT) for c in charts]),
+        "facts": run_case(model, [build_messages(get_bazi_report_prompt(c["facts"]), system=BAZI_REPORT_SYSTEM_PROMPT) for c in charts]),
+    }
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    print(f"模型 {args.model}，命盘 {args.charts} 个（取平均值）")
+    print(f"{'提示词':<8}{'输入token':>10}{'输出token':>10}{'TTFT(ms)':>12}{'总耗时(ms)':>12}")
+    for name, row in report.items():
+        print(f"{name:<8}{row['input_tokens']:>10}{row['output_tokens']:>10}{row['ttft_ms']:>12}{row['total_ms']:>12}")
+
+
+if __name__ == "__main__":
+    main()
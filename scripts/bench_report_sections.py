@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+分节并行生成基准：比较一次生成全文和各节并行生成的首字时间与总耗时
+
+使用桩模型模拟生成速度：全文的长度为各节之和，分节时每节单独请求，按 --concurrency 并行生成后按顺序合并。
+真实后端的并行请求会分摊算力（Ollama需设置 OLLAMA_NUM_PARALLEL），单请求速度随并发数下降，
+可用 --parallel-slowdown 模拟（例如0.6表示并行时每个请求的速度为单独运行时的60%）。
+
+示例：
+    python scripts/bench_report_sections.py
+    python scripts/bench_report_sections.py --section-tokens 600 --tps 30 --concurrency 7 --parallel-slowdown 0.5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Dict
+
+# 将父目录添加到系统路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.llm_stream import astream_until_disconnect, merge_ordered_streams
+from server.model import get_chat_model
+from server.prompt_templates import REPORT_SECTIONS
+
+
+async def consume(contents) -> Dict:
+    started_at = time.perf_counter()
+    first_at, length = None, 0
+    async for content in contents:
+        if first_at is None:
+            first_at = time.perf_counter()
+        length += len(content)
+    finished_at = time.perf_counter()
+    return {
+        "chars": length,
+        "first_char_s": round(first_at - started_at, 2),
+        "total_s": round(finished_at - started_at, 2),
+    }
+
+
+async def run(args) -> Dict:
+    sections = len(REPORT_SECTIONS)
+    section_text = "命" * args.section_tokens
+    messages = [("user", "命主信息")]
+
+    full = get_chat_model("stub", text=section_text * sections, time_to_first_token=args.ttft,
+                          tokens_per_second=args.tps, cache_slots=0)
+    full_result = await consume(astream_until_disconnect(full, messages, backend="bench"))
+
+    concurrency = min(args.concurrency, sections)
+    parallel_tps = args.tps * (args.parallel_slowdown if concurrency > 1 else 1)
+    section_model = get_chat_model("stub", text=section_text, time_to_first_token=args.ttft,
+                                   tokens_per_second=parallel_tps, cache_slots=0)
+    streams = [astream_until_disconnect(section_model, messages, backend="bench") for _ in range(sections)]
+    sections_result = await consume(merge_ordered_streams(streams, concurrency, separator="\n\n"))
+    return {"full": full_result, f"sections_x{concurrency}": sections_result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分节并行生成基准")
+    parser.add_argument("--section-tokens", type=int, default=200, help="每节的token数")
+    parser.add_argument("--tps", type=float, default=100, help="单个请求的生成速度（tokens/s）")
+    parser.add_argument("--ttft", type=float, default=0.5, help="首token时间（秒）")
+    parser.add_argument("--concurrency", type=int, default=3, help="同时生成的节数")
+    parser.add_argument("--parallel-slowdown", type=float, default=1.0, help="并行时单个请求的速度比例")
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    print(f"{len(REPORT_SECTIONS)} 节，每节 {args.section_tokens} token，{args.tps:g} tokens/s，首token {args.ttft:g}s")
+    print(f"{'方式':<14}{'字数':>8}{'首字(s)':>10}{'总耗时(s)':>12}")
+    for name, row in report.items():
+        print(f"{name:<14}{row['chars']:>8}{row['first_char_s']:>10}{row['total_s']:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+启动开销基准：在新的解释器中以 python -X importtime 导入 server.app，统计导入耗时、常驻内存，
+并列出累计耗时最多的模块。超出预算，或导入了应当按需加载的模块（langchain/openai/ollama）时以退出码1结束，
+可以放进CI防止启动时间回退。
+
+每轮都启动新进程，取多轮的中位数。
+
+示例：
+    python scripts/bench_startup.py
+    python scripts/bench_startup.py --rounds 5 --max-import-ms 800 --max-rss-mb 80 --top 20
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 启动时不应导入的模块前缀，它们只在首次调用模型时加载
+LAZY_MODULES = ("langchain", "langchain_core", "langchain_openai", "langchain_ollama", "langsmith", "openai", "ollama")
+
+# 子进程中执行：导入应用后输出常驻内存和已加载的按需模块
+_CHILD = """
+import json, sys
+import server.app
+with open("/proc/self/status") as f:
+    rss_kb = int(f.read().split("VmRSS:")[1].split()[0])
+lazy = sorted({name.split(".")[0] for name in sys.modules} & set(%r))
+print(json.dumps({"rss_kb": rss_kb, "modules": len(sys.modules), "lazy_loaded": lazy}))
+""" % (LAZY_MODULES,)
+
+_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def run_once() -> Dict[str, Any]:
+    """在新进程中导入一次应用，返回导入耗时（微秒）与各模块的耗时"""
+    env = {**os.environ, "MODEL_SOURCE": os.environ.get("MODEL_SOURCE", "stub"), "SHARED_CACHE_PATH": ""}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHILD],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    modules = []
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append({"module": name, "self_us": int(self_us), "cumulative_us": int(cumulative_us), "depth": len(indent) // 2})
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    app_entry = next(m for m in modules if m["module"] == "server.app")
+    result["import_us"] = app_entry["cumulative_us"]
+    result["import_modules"] = modules
+    return result
+
+
+def heaviest(modules: List[Dict[str, Any]], top: int) -> List[Dict[str, Any]]:
+    """累计耗时最多的顶层依赖（server.app直接或间接导入的第一层包）"""
+    roots: Dict[str, Dict[str, Any]] = {}
+    for m in modules:
+        if m["depth"] == 1 or m["module"].startswith("server."):
+            entry = roots.setdefault(m["module"], {"module": m["module"], "cumulative_us": 0, "self_us": 0})
+            entry["cumulative_us"] += m["cumulative_us"]
+            entry["self_us"] += m["self_us"]
+    return sorted(roots.values(), key=lambda m: m["cumulative_us"], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="server.app 导入耗时与内存基准")
+    parser.add_argument("--rounds", type=int, default=5, help="测量轮数，取中位数")
+    parser.add_argument("--top", type=int, default=15, help="列出累计耗时最多的模块数")
+    parser.add_argument("--max-import-ms", type=float, default=1000, help="导入耗时预算（毫秒）")
+    parser.add_argument("--max-rss-mb", type=float, default=100, help="导入后常驻内存预算（MB）")
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.rounds)]
+    import_ms = statistics.median(r["import_us"] for r in runs) / 1000
+    rss_mb = statistics.median(r["rss_kb"] for r in runs) / 1024
+    lazy_loaded = sorted({name for r in runs for name in r["lazy_loaded"]})
+    median_run = sorted(runs, key=lambda r: r["import_us"])[len(runs) // 2]
+
+    violations = []
+    if import_ms > args.max_import_ms:
+        violations.append(f"导入耗时 {import_ms:.0f}ms 超出预算 {args.max_import_ms:.0f}ms")
+    if rss_mb > args.max_rss_mb:
+        violations.append(f"常驻内存 {rss_mb:.1f}MB 超出预算 {args.max_rss_mb:.0f}MB")
+    if lazy_loaded:
+        violations.append(f"启动时导入了应按需加载的模块: {', '.join(lazy_loaded)}")
+
+    report = {
+        "import_ms": round(import_ms, 1),
+        "rss_mb": round(rss_mb, 1),
+        "modules": median_run["modules"],
+        "lazy_loaded": lazy_loaded,
+        "budget": {"import_ms": args.max_import_ms, "rss_mb": args.max_rss_mb},
+        "heaviest": heaviest(median_run["import_modules"], args.top),
+        "violations": violations,
+    }
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(f"导入 server.app：{import_ms:.0f}ms（预算 {args.max_import_ms:.0f}ms），"
+              f"常驻内存 {rss_mb:.1f}MB（预算 {args.max_rss_mb:.0f}MB），已加载模块 {report['modules']} 个")
+        print(f"\n{'模块':<40}{'累计(ms)':>10}{'自身(ms)':>10}")
+        for m in report["heaviest"]:
+            print(f"{m['module']:<40}{m['cumulative_us'] / 1000:>10.1f}{m['self_us'] / 1000:>10.1f}")
+        for violation in violations:
+            print(f"\n超出预算: {violation}")
+    sys.exit(1 if violations else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+多worker吞吐对比：分别以单进程和N个worker启动服务（run_server.py --stub），用同一请求序列压测，
+比较吞吐量和延迟分位数。
+
+每种配置压测两轮，请求序列相同：
+- cold：共享缓存为空，每个出生信息都要排盘
+- warm：第二轮的请求大多落到没有排过这张盘的worker上，靠共享缓存命中，无需重新排盘
+
+多worker的收益取决于可用的CPU核数，单核机器上两者接近。
+
+示例：
+    python scripts/compare_workers.py --workers 4 --endpoint calculate_bazi --concurrency 32 --requests 2000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from scripts.load_test import HTTPDriver, run_load, summarize
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 60) -> None:
+    import httpx
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务启动失败，退出码 {process.returncode}")
+        try:
+            if httpx.get(f"{url}/api/test", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("等待服务启动超时")
+
+
+def run_config(workers: int, args) -> Dict[str, Any]:
+    """以指定worker数启动服务，压测cold和warm两轮"""
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "SHARED_CACHE_PATH": os.path.join(tmp, "cache.sqlite3"),
+            "LOG_LEVEL": "WARNING",
+            "STUB_LLM_TTFT": "0",
+            "STUB_LLM_TPS": "0",
+        }
+        process = subprocess.Popen(
+            [sys.executable, "run_server.py", "--stub", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            wait_ready(url, process)
+            rounds = {}
+            for name in ("cold", "warm"):
+                rounds[name] = asyncio.run(run_round(url, args))
+                print(f"workers={workers} {name}: {rounds[name]['throughput_rps']:.1f} req/s", file=sys.stderr)
+            return rounds
+        finally:
+            process.terminate()
+            process.wait(timeout=args.graceful_timeout)
+
+
+async def run_round(url: str, args) -> Dict[str, Any]:
+    driver = HTTPDriver(url, args.timeout)
+    load_args = argparse.Namespace(
+        endpoint=args.endpoint, concurrency=args.concurrency, rate=0,
+        requests=args.requests, duration=0, seed=args.seed
+    )
+    try:
+        results, elapsed = await run_load(driver, load_args)
+    finally:
+        await driver.close()
+    summary = summarize(results, elapsed)[args.endpoint]
+    return {
+        "throughput_rps": summary["throughput_rps"],
+        "latency_s": summary["latency_s"],
+        "errors": summary["errors"],
+    }
+
+
+def print_table(report: Dict[str, Any]) -> None:
+    print(f"{'配置':<14}{'轮次':<6}{'吞吐(req/s)':>14}{'p50(ms)':>10}{'p99(ms)':>10}{'错误':>6}")
+    for workers, rounds in report["results"].items():
+        for name, r in rounds.items():
+            latency = r["latency_s"]
+            print(f"{workers + ' worker':<14}{name:<6}{r['throughput_rps']:>14.1f}"
+                  f"{latency['p50'] * 1000:>10.1f}{latency['p99'] * 1000:>10.1f}{r['errors']:>6}")
+    base = report["results"]["1"]["cold"]["throughput_rps"]
+    multi = report["results"][str(report["config"]["workers"])]["cold"]["throughput_rps"]
+    if base:
+        print(f"\n{report['config']['workers']} worker 相对单进程（cold）：{multi / base:.2f}x，本机CPU核数 {os.cpu_count()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="单进程与多worker的吞吐对比")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="多worker配置的进程数")
+    parser.add_argument("--endpoint", default="calculate_bazi", choices=["calculate_bazi", "basic_report"], help="压测的接口")
+    parser.add_argument("--concurrency", type=int, default=32, help="最大并发请求数")
+    parser.add_argument("--requests", type=int, default=1000, help="每轮请求数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--timeout", type=float, default=60, help="HTTP请求超时（秒）")
+    parser.add_argument("--graceful-timeout", type=float, default=30, help="等待服务退出的秒数")
+    parser.add_argument("--json", action="store_true", help="输出JSON而不是表格")
+    args = parser.parse_args()
+
+    configs: List[int] = sorted({1, args.workers})
+    report = {
+        "config": {k: getattr(args, k) for k in ("workers", "endpoint", "concurrency", "requests", "seed")},
+        "cpu_count": os.cpu_count(),
+        "results": {str(workers): run_config(workers, args) for workers in configs},
+    }
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_table(report)
+
+
+if __name__ == "__main__":
+    main()
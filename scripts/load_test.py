@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+压测脚本：以可配置的并发和到达速率压测 /api/calculate_bazi、/api/basic_report、/api/fate_report，
+统计延迟分位数（p50/p95/p99）、SSE首事件时间、事件速率和错误率，输出可在提交之间对比的JSON摘要。
+
+两种运行方式：
+- HTTP：压测已启动的服务，如 --target http://127.0.0.1:8080
+- 进程内：--target asgi，直接调用ASGI应用，不经过网络；默认使用本地桩模型（MODEL_SOURCE=stub）
+
+示例：
+    python scripts/load_test.py --target asgi --endpoint mix --concurrency 32 --requests 500
+    python scripts/load_test.py --target http://127.0.0.1:8080 --endpoint fate_report --rate 5 --duration 60 -o before.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# 将父目录添加到系统路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ENDPOINTS = {
+    "calculate_bazi": ("POST", "/api/calculate_bazi"),
+    "basic_report"  : ("POST", "/api/basic_report"),
+    "fate_report"   : ("POST", "/api/fate_report"),
+}
+
+
+def random_birth_info(rng: random.Random) -> Dict[str, Any]:
+    """生成1900-2100年之间的随机出生信息"""
+    return {
+        "gender": rng.choice(["male", "female"]),
+        "year"  : rng.randint(1900, 2100),
+        "month" : rng.randint(1, 12),
+        "day"   : rng.randint(1, 28),
+        "hour"  : rng.randint(0, 23),
+        "minute": rng.randint(0, 59),
+    }
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """线性插值分位数，q取0-100"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100
+    lower = int(pos)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (pos - lower)
+
+
+class Result:
+    """单次请求的结果"""
+    __slots__ = ("endpoint", "status", "latency", "ttfe", "events", "bytes", "error")
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.status = 0
+        self.latency = 0.0
+        self.ttfe: Optional[float] = None  # SSE首个事件的时间
+        self.events = 0
+        self.bytes = 0
+        self.error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and 200 <= self.status < 300
+
+
+class ASGIDriver:
+    """进程内直接调用ASGI应用，记录每个响应分块到达的时间"""
+
+    def __init__(self):
+        from server.app import app
+        self.app = app
+
+    async def request(self, method: str, path: str, payload: Dict, result: Result, started_at: float) -> None:
+        body = json.dumps(payload).encode()
+        body_sent = False
+        done = asyncio.Event()
+
+        async def receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                result.status = message["status"]
+            elif message["type"] == "http.response.body":
+                on_chunk(result, message.get("body", b""), started_at)
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0", "spec_version": "2.4"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(b"content-type", b"application/json"), (b"host", b"loadtest")],
+            "client": ("127.0.0.1", 50000),
+            "server": ("loadtest", 80),
+        }
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            done.set()
+
+    async def close(self) -> None:
+        pass
+
+
+class HTTPDriver:
+    """通过HTTP压测已启动的服务"""
+
+    def __init__(self, base_url: str, timeout: float):
+        import httpx
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=httpx.Limits(max_connections=None))
+
+    async def request(self, method: str, path: str, payload: Dict, result: Result, started_at: float) -> None:
+        async with self.client.stream(method, path, json=payload) as response:
+            result.status = response.status_code
+            async for chunk in response.aiter_raw():
+                on_chunk(result, chunk, started_at)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def on_chunk(result: Result, chunk: bytes, started_at: float) -> None:
+    """统计响应分块：SSE事件以空行分隔"""
+    if not chunk:
+        return
+    result.bytes += len(chunk)
+    events = chunk.count(b"\n\n")
+    if events and result.ttfe is None:
+        result.ttfe = time.perf_counter() - started_at
+    result.events += events
+
+
+async def run_one(driver, endpoint: str, payload: Dict, started_at: float) -> Result:
+    method, path = ENDPOINTS[endpoint]
+    result = Result(endpoint)
+    try:
+        await driver.request(method, path, payload, result, started_at)
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    result.latency = time.perf_counter() - started_at
+    return result
+
+
+async def run_load(driver, args) -> Tuple[List[Result], float]:
+    """按配置发起请求
+
+    - rate为0时为闭环压测：concurrency个worker连续发请求
+    - rate大于0时为开环压测：按泊松过程到达，最多concurrency个请求同时进行；
+      延迟从计划到达时间开始计算，避免协调遗漏（coordinated omission）
+    """
+    rng = random.Random(args.seed)
+    endpoints = list(ENDPOINTS) if args.endpoint == "mix" else [args.endpoint]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    results: List[Result] = []
+    tasks = []
+    bench_start = time.perf_counter()
+    deadline = bench_start + args.duration if args.duration else None
+
+    def should_continue(sent: int) -> bool:
+        if deadline is not None:
+            return time.perf_counter() < deadline
+        return sent < args.requests
+
+    async def guarded(endpoint: str, payload: Dict, scheduled_at: float):
+        async with semaphore:
+            results.append(await run_one(driver, endpoint, payload, scheduled_at))
+
+    if args.rate > 0:
+        sent = 0
+        next_at = bench_start
+        while should_continue(sent):
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            endpoint = rng.choice(endpoints)
+            tasks.append(asyncio.create_task(guarded(endpoint, random_birth_info(rng), next_at)))
+            sent += 1
+            next_at += rng.expovariate(args.rate)
+        await asyncio.gather(*tasks)
+    else:
+        counter = {"sent": 0}
+
+        async def worker():
+            while should_continue(counter["sent"]):
+                counter["sent"] += 1
+                endpoint = rng.choice(endpoints)
+                results.append(await run_one(driver, endpoint, random_birth_info(rng), time.perf_counter()))
+
+        await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+
+    return results, time.perf_counter() - bench_start
+
+
+def summarize(results: List[Result], elapsed: float) -> Dict[str, Any]:
+    """按接口汇总结果"""
+    def stats(values: List[float]) -> Dict[str, Optional[float]]:
+        if not values:
+            return {}
+        return {
+            "mean": round(sum(values) / len(values), 6),
+            "p50" : round(percentile(values, 50), 6),
+            "p95" : round(percentile(values, 95), 6),
+            "p99" : round(percentile(values, 99), 6),
+            "max" : round(max(values), 6),
+        }
+
+    summary = {}
+    for endpoint in sorted({r.endpoint for r in results}):
+        group = [r for r in results if r.endpoint == endpoint]
+        ok = [r for r in group if r.ok]
+        errors: Dict[str, int] = {}
+        for r in group:
+            if not r.ok:
+                key = r.error or f"HTTP {r.status}"
+                errors[key] = errors.get(key, 0) + 1
+        entry = {
+            "requests"      : len(group),
+            "errors"        : len(group) - len(ok),
+            "error_rate"    : round((len(group) - len(ok)) / len(group), 4),
+            "throughput_rps": round(len(ok) / elapsed, 3) if elapsed > 0 else None,
+            "latency_s"     : stats([r.latency for r in ok]),
+            "bytes_mean"    : round(sum(r.bytes for r in ok) / len(ok), 1) if ok else None,
+            "error_kinds"   : errors,
+        }
+        streamed = [r for r in ok if r.ttfe is not None and r.events > 1]
+        if endpoint == "fate_report" and streamed:
+            entry["ttfe_s"] = stats([r.ttfe for r in streamed])
+            entry["events_per_stream"] = round(sum(r.events for r in streamed) / len(streamed), 1)
+            entry["events_per_sec"] = stats([
+                r.events / (r.latency - r.ttfe) for r in streamed if r.latency > r.ttfe
+            ])
+        summary[endpoint] = entry
+    return summary
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="飞灵(Fatelling)服务器压测")
+    parser.add_argument("--target", default="asgi", help="asgi（进程内）或服务地址，如 http://127.0.0.1:8080")
+    parser.add_argument("--endpoint", default="calculate_bazi", choices=list(ENDPOINTS) + ["mix"], help="压测的接口，mix为随机混合")
+    parser.add_argument("--concurrency", type=int, default=16, help="最大并发请求数")
+    parser.add_argument("--rate", type=float, default=0, help="到达速率（请求/秒），0为闭环压测")
+    parser.add_argument("--requests", type=int, default=200, help="请求总数（未指定--duration时生效）")
+    parser.add_argument("--duration", type=float, default=0, help="压测时长（秒），优先于--requests")
+    parser.add_argument("--warmup", type=int, default=5, help="正式压测前的预热请求数")
+    parser.add_argument("--timeout", type=float, default=300, help="HTTP请求超时（秒）")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子，保证不同提交之间请求序列一致")
+    parser.add_argument("-o", "--output", help="JSON摘要输出路径，默认打印到标准输出")
+    return parser.parse_args()
+
+
+async def main_async(args) -> Dict[str, Any]:
+    if args.target == "asgi":
+        # 进程内压测默认使用桩模型，结果可重复
+        os.environ.setdefault("MODEL_SOURCE", "stub")
+        driver = ASGIDriver()
+    else:
+        driver = HTTPDriver(args.target, args.timeout)
+
+    try:
+        if args.warmup:
+            warmup_args = argparse.Namespace(**{**vars(args), "requests": args.warmup, "duration": 0, "rate": 0, "seed": args.seed + 1})
+            await run_load(driver, warmup_args)
+        results, elapsed = await run_load(driver, args)
+    finally:
+        await driver.close()
+
+    return {
+        "commit"   : git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config"   : {
+            "target"     : args.target,
+            "endpoint"   : args.endpoint,
+            "concurrency": args.concurrency,
+            "rate"       : args.rate,
+            "requests"   : args.requests,
+            "duration"   : args.duration,
+            "seed"       : args.seed,
+            "model_source": os.environ.get("MODEL_SOURCE") if args.target == "asgi" else None,
+        },
+        "elapsed_s": round(elapsed, 3),
+        "total_requests": len(results),
+        "endpoints": summarize(results, elapsed),
+    }
+
+
+def main():
+    args = parse_args()
+    summary = asyncio.run(main_async(args))
+    text = json.dumps(summary, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"压测结果已写入 {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+为静态文件生成预压缩变体（.gz，安装了brotli时还有 .br），部署前运行一次，服务启动时会自动识别。
+只保留比原文件小的变体；过小的文件和本身已压缩的格式（图片、字体等）跳过。
+
+示例：
+    python scripts/precompress_static.py
+    python scripts/precompress_static.py --directory static --min-size 256
+"""
+
+import argparse
+import os
+import sys
+
+# 将父目录添加到系统路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.static_files import PRECOMPRESS_MIN_SIZE, precompress
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成静态文件的预压缩变体")
+    parser.add_argument("--directory", default="static", help="静态文件目录")
+    parser.add_argument("--min-size", type=int, default=PRECOMPRESS_MIN_SIZE, help="小于此字节数的文件不压缩")
+    args = parser.parse_args()
+
+    results = precompress(args.directory, args.min_size)
+    print(f"{'文件':<40}{'原大小':>10}{'gzip':>10}{'br':>10}")
+    for name, sizes in results.items():
+        print(f"{name:<40}{sizes['original']:>10}{sizes.get('gzip', '-'):>10}{sizes.get('br', '-'):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+管理接口
+
+运维诊断用的接口（请求剖析、内存诊断），统一挂在 /admin 下。请求需携带与环境变量 ADMIN_TOKEN
+相同值的 X-Admin-Token 请求头；未配置ADMIN_TOKEN时管理接口全部拒绝访问。
+"""
+
+import os
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse, Response
+
+from server.memory import cache_registry, memory_tracer, TRACEMALLOC_FRAMES
+from server.profiling import profile_store
+
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """校验管理令牌；未配置ADMIN_TOKEN时一律拒绝"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="未配置ADMIN_TOKEN，管理接口已关闭")
+    if not (x_admin_token and secrets.compare_digest(x_admin_token, ADMIN_TOKEN)):
+        raise HTTPException(status_code=403, detail="需要有效的管理令牌")
+
+
+admin_router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)], include_in_schema=False)
+
+
+@admin_router.get("/profiles")
+async def list_profiles():
+    """最近的请求剖析结果，新的在前"""
+    return [profile.to_dict() for profile in profile_store.list()]
+
+
+@admin_router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, format: str = "text", limit: int = 50):
+    """下载剖析结果
+
+    format:
+        text       可读的文本摘要
+        pstats     pstats文件（cprofile模式）
+        collapsed  折叠栈，可直接交给flamegraph.pl或speedscope（sample模式）
+    """
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="剖析结果不存在或已被淘汰")
+    try:
+        if format == "text":
+            return PlainTextResponse(profile.to_text(limit))
+        if format == "pstats":
+            return Response(
+                content=profile.to_pstats(),
+                media_type="application/octet-stream",
+                headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.pstats"'}
+            )
+        if format == "collapsed":
+            return PlainTextResponse(profile.to_collapsed())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    raise HTTPException(status_code=400, detail=f"不支持的格式: {format}")
+
+
+@admin_router.delete("/profiles")
+async def clear_profiles():
+    """清空剖析结果"""
+    profile_store.clear()
+    return {"status": "ok"}
+
+
+@admin_router.get("/memory")
+async def memory_summary():
+    """进程内存概况与各缓存的占用"""
+    return {**memory_tracer.summary(), "caches": cache_registry.stats()}
+
+
+@admin_router.get("/memory/caches")
+async def memory_caches():
+    """各进程内缓存的条目数和估算字节数"""
+    return cache_registry.stats()
+
+
+@admin_router.post("/memory/tracemalloc/start")
+async def start_tracemalloc(frames: int = Query(TRACEMALLOC_FRAMES, ge=1, le=64)):
+    """开启tracemalloc，并把当前状态记为基准快照"""
+    memory_tracer.start(frames)
+    return memory_tracer.summary()
+
+
+@admin_router.post("/memory/tracemalloc/stop")
+async def stop_tracemalloc():
+    """关闭tracemalloc并释放其记录"""
+    memory_tracer.stop()
+    return memory_tracer.summary()
+
+
+@admin_router.post("/memory/snapshot")
+async def reset_memory_baseline():
+    """把当前状态记为新的基准快照，之后的 /memory/diff 与其比较"""
+    try:
+        memory_tracer.reset_baseline()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "ok"}
+
+
+@admin_router.get("/memory/top")
+async def memory_top(limit: int = 20, group_by: str = "lineno"):
+    """当前分配最多的代码位置"""
+    try:
+        return memory_tracer.top(limit, group_by)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@admin_router.get("/memory/diff")
+async def memory_diff(limit: int = 20, group_by: str = "lineno"):
+    """与基准快照相比增长最多的代码位置"""
+    try:
+        return memory_tracer.diff(limit, group_by)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
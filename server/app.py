@@ -1,28 +1,60 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.exception_handlers import request_validation_exception_handler
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, StreamingResponse
-from pydantic import BaseModel
+from fastapi.responses import FileResponse, StreamingResponse, Response
+from pydantic import BaseModel, ValidationError
 from datetime import datetime
-from server.paipan_engine import BaziPaipanEngine
-from typing import Dict, List, AsyncGenerator, Union
+from server.bazi_calculator import BaziCalculator, ENGINE_VERSION
+from typing import Annotated, AsyncIterator, Dict, List, AsyncGenerator, Optional, Tuple, Union
+import asyncio
+import functools
+import hashlib
 import logging
 import os
-from server.model import get_chat_model
-from langchain.schema import HumanMessage
+import time
+from server.model import get_chat_model, build_messages
+from server.llm_stream import (astream_until_disconnect, merge_ordered_streams, record_llm_usage, split_reasoning,
+                               strip_reasoning, ClientDisconnectedError)
+from server.stream_replay import ReportStream, report_streams, format_sse
+from server.llm_scheduler import llm_scheduler, LLMJob, JobStatus, Priority, QueueFullError
+from server.metrics import registry as metrics_registry, record_cache, CONTENT_TYPE_LATEST
+from server.shared_cache import chart_cache, report_cache
+from server.storage import chart_store
+from server.serialization import FastJSONResponse, RawJSONResponse, encode_chart_response
+from server.http_cache import CHART_CACHE_CONTROL, etag_matches, make_etag, not_modified
+from server.static_files import FingerprintedStaticFiles
+from server.compression import CompressionMiddleware, COMPRESSION_ENABLED
+from server.batch import (BatchLimitError, RecordError, NDJSONStreamingResponse, check_content_length, error_line,
+                          is_ndjson, iter_ndjson, read_json_array, result_line, stream_batch)
+from server.profiling import ProfilingMiddleware, PROFILE_ENABLED
+from server.admin import admin_router
+from server.logging_config import setup_logging, record_stage_timing, RequestContextMiddleware
 from server.fate_owner import FateOwner, Gender, BaziInfo, SolarBirthInfo, LunarBirthInfo
-from server.define import BasicUserInput
-from server.prompt_templates import get_bazi_report_prompt
+from server.define import BasicUserInput, ChatInput
+from server.prompt_templates import (get_bazi_report_prompt, get_bazi_section_prompts, BAZI_REPORT_SYSTEM_PROMPT, BAZI_SECTION_SYSTEM_PROMPT,
+                                     CHAT_FOLLOWUP_PROMPT)
+from server.chat_sessions import ChatSession, chat_sessions
+from server.chart_facts import format_chart_facts
 import json
 
 # 配置日志
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger(__name__)
 
+# 报告生成方式：full 一次生成全文；sections 各节并行生成，按顺序流式输出。请求可用查询参数mode覆盖
+REPORT_MODES               = ("full", "sections")
+REPORT_MODE                = os.environ.get("REPORT_MODE", "full")
+# 分节生成时一份报告同时生成的节数，即占用的LLM槽位数（不超过调度器的并发上限）
+REPORT_SECTION_CONCURRENCY = int(os.environ.get("REPORT_SECTION_CONCURRENCY", 3))
+# 推理模型的 <think> 内容：drop 丢弃；event 作为reasoning事件发送；raw 不区分，与正文一起发送
+REPORT_REASONING           = os.environ.get("REPORT_REASONING", "drop")
+
 app = FastAPI(
     title="飞灵（Fatelling）- AI智能命运决策助手",
     description="基于LLM的AI智能命运决策助手，提供八字排盘、命盘解读、命运分析等服务",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # 允许跨域请求
@@ -34,183 +66,654 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 挂载静态文件目录
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# 响应压缩，流式响应在事件边界flush
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
+# 按需的请求剖析，未开启时不安装中间件
+if PROFILE_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+# 请求ID与访问日志，放在最外层以覆盖其他中间件
+app.add_middleware(RequestContextMiddleware)
+
+# 管理接口
+app.include_router(admin_router)
+
+# 挂载静态文件目录：指纹文件名长期缓存，有预压缩变体时直接返回变体
+static_files = FingerprintedStaticFiles(directory="static")
+app.mount("/static", static_files, name="static")
+
+STAGE_SECONDS = metrics_registry.histogram("request_stage_seconds", "各接口请求处理阶段的耗时", ["endpoint", "stage"])
+REQUEST_ERRORS = metrics_registry.counter("request_errors_total", "各接口请求处理阶段的错误次数", ["endpoint", "stage"])
+BATCH_RECORDS = metrics_registry.counter("batch_records_total", "批量排盘处理的记录数", ["outcome"])
+
+
+class RequestStage:
+    """请求处理阶段：记录耗时，阶段内抛出异常时计入该阶段的错误数
+
+    阶段包括 validation（输入校验与出生信息转换）、charting（排盘）、prompt_build（构建提示词）、llm（模型生成）
+    """
+    __slots__ = ("endpoint", "stage", "start")
+
+    def __init__(self, endpoint: str, stage: str):
+        self.endpoint = endpoint
+        self.stage = stage
+
+    def __enter__(self) -> "RequestStage":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        elapsed = time.perf_counter() - self.start
+        STAGE_SECONDS.labels(self.endpoint, self.stage).observe(elapsed)
+        record_stage_timing(self.stage, elapsed)
+        # 客户端断开或流被关闭不算错误
+        if exc_type is not None and not issubclass(exc_type, (asyncio.CancelledError, GeneratorExit, ClientDisconnectedError)):
+            REQUEST_ERRORS.labels(self.endpoint, self.stage).inc()
+
+
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request: Request, exc: RequestValidationError):
+    """请求参数校验失败时计入validation阶段的错误数，响应与默认处理一致"""
+    route = request.scope.get("route")
+    endpoint = route.path.rsplit("/", 1)[-1] if route is not None else "unknown"
+    REQUEST_ERRORS.labels(endpoint, "validation").inc()
+    return await request_validation_exception_handler(request, exc)
 
 # 添加 favicon 路由
 @app.get('/favicon.ico', include_in_schema=False)
 async def favicon():
-    return FileResponse('static/favicon.ico')
+    return FileResponse('static/favicon.ico', headers={"Cache-Control": "public, max-age=86400"})
+
+def get_request_priority(request: Request) -> Priority:
+    """根据请求头X-User-Tier确定LLM任务优先级（由网关根据用户身份设置），付费用户优先"""
+    return Priority.HIGH if request.headers.get("x-user-tier", "").lower() == "paid" else Priority.NORMAL
+
+def submit_llm_job(request: Request, model_source: str, slots: int = 1) -> LLMJob:
+    """提交LLM任务，队列已满时返回429并给出Retry-After；slots为任务同时发出的生成请求数
+
+    路由模式下队列的并发上限为各后端上限之和，每个后端的并发由路由器按主机控制
+    """
+    if model_source == "router":
+        from server.llm_router import get_llm_router
+        llm_scheduler.set_max_concurrency(model_source, get_llm_router().max_concurrency)
+    try:
+        return llm_scheduler.submit(model_source, get_request_priority(request), slots)
+    except QueueFullError as e:
+        logger.warning("%s，建议 %d 秒后重试", e, e.retry_after)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def chart_cache_key(birth_info: Union[SolarBirthInfo, LunarBirthInfo]) -> str:
+    """排盘缓存的键：引擎版本、历法类型加上全部出生信息字段"""
+    kind = "lunar" if isinstance(birth_info, LunarBirthInfo) else "solar"
+    fields = birth_info.model_dump()
+    return f"v{ENGINE_VERSION}:{kind}:" + ",".join(f"{name}={fields[name]}" for name in sorted(fields))
+
+def chart_etag(birth_info: Union[SolarBirthInfo, LunarBirthInfo]) -> str:
+    """排盘结果的ETag，由规范化的出生信息和引擎版本决定，排盘前即可算出"""
+    return make_etag(chart_cache_key(birth_info))
+
+def calculate_chart(endpoint: str, birth_info: Union[SolarBirthInfo, LunarBirthInfo]) -> Tuple[FateOwner, BaziInfo]:
+    """创建命主并排盘
+
+    排盘结果存入跨worker的共享缓存，任何worker排过的盘，其他worker命中后直接还原，
+    跳过历法转换和排盘计算。
+    """
+    gender = Gender.MALE if birth_info.gender == "male" else Gender.FEMALE
+    key = chart_cache_key(birth_info)
+    cached = chart_cache.get_json(key)
+    if chart_cache.enabled:
+        record_cache("chart", cached is not None)
+    if cached is not None:
+        with RequestStage(endpoint, "charting"):
+            # 两种生日信息都已给出，FateOwner不会再做历法转换
+            fate_owner = FateOwner(
+                gender=gender,
+                solar_birth_info=SolarBirthInfo(**cached["solar"]) if cached["solar"] else None,
+                lunar_birth_info=LunarBirthInfo(**cached["lunar"]) if cached["lunar"] else None
+            )
+            fate_owner.bazi_info = BaziInfo.model_validate(cached["bazi"])
+        return fate_owner, fate_owner.bazi_info
+
+    # 创建命主对象
+    with RequestStage(endpoint, "validation"):
+        fate_owner = FateOwner(
+            gender=gender,
+            solar_birth_info=birth_info if isinstance(birth_info, SolarBirthInfo) else None,
+            lunar_birth_info=birth_info if isinstance(birth_info, LunarBirthInfo) else None
+        )
+    logger.debug("命主对象创建成功: %s", fate_owner)
+
+    # 计算八字
+    with RequestStage(endpoint, "charting"):
+        engine = BaziCalculator()
+        bazi_info = fate_owner.calculate_bazi(engine)
+    logger.debug("八字计算完成: %s", bazi_info)
+
+    chart_cache.set_json(key, {
+        "solar": fate_owner.solar_birth_info.model_dump() if fate_owner.solar_birth_info else None,
+        "lunar": fate_owner.lunar_birth_info.model_dump() if fate_owner.lunar_birth_info else None,
+        "bazi": bazi_info.model_dump(mode="json")
+    })
+    return fate_owner, bazi_info
+
+def get_owner(request: Request) -> Optional[str]:
+    """请求头X-User-Id中的用户标识（由网关根据登录状态设置），没有时不保存历史记录"""
+    owner = request.headers.get("x-user-id")
+    return owner if owner and len(owner) <= 128 else None
+
+def save_chart_history(owner: Optional[str], birth_info: Union[SolarBirthInfo, LunarBirthInfo], fate_owner: FateOwner, bazi_info: BaziInfo) -> Optional[int]:
+    """把命盘加入用户的历史记录（后台批量写入），返回命盘编码；未登录或命盘无法编码时返回None"""
+    if owner is None or not chart_store.enabled:
+        return None
+    try:
+        chart_code = bazi_info.chart_code
+    except ValueError as e:
+        logger.warning("命盘无法编码，不保存历史记录：%s", e)
+        return None
+    birth = {"calendar": "lunar" if isinstance(birth_info, LunarBirthInfo) else "solar", **birth_info.model_dump()}
+    chart_store.save_chart(owner, chart_code, birth, bazi_info.model_dump(mode="json"))
+    return chart_code
+
+def report_cache_key(model_source: str, prompt: str, system: str = "") -> str:
+    """报告缓存的键：模型来源和完整提示词（系统消息与用户消息）的摘要"""
+    return hashlib.sha256(f"{model_source}\0{system}\0{prompt}".encode("utf-8")).hexdigest()
+
+def get_cached_report(model_source: str, prompt: str, system: str = "") -> Optional[str]:
+    """从共享缓存读取已生成的报告正文，未开启报告缓存时返回None"""
+    if not report_cache.enabled:
+        return None
+    cached = report_cache.get(report_cache_key(model_source, prompt, system))
+    record_cache("report", cached is not None)
+    return cached.decode("utf-8") if cached is not None else None
+
+def save_report(model_source: str, prompt: str, text: str, system: str = "") -> None:
+    report_cache.set(report_cache_key(model_source, prompt, system), text.encode("utf-8"))
 
 # API路由定义
 @app.post("/api/basic_report")
-async def get_basic_report(user_input: BasicUserInput):
+async def get_basic_report(user_input: BasicUserInput, request: Request, response: Response):
     """获取基本命盘解读"""
-    logger.info("=== 开始处理 basic_report 请求 ===")
-    logger.info(f"请求方法: POST")
-    logger.info(f"请求路径: /api/basic_report")
-    logger.info(f"请求数据: {user_input.model_dump()}")
+    logger.info("开始处理 basic_report 请求")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("请求数据: %s", user_input.model_dump())
+    
+    model_source = os.environ.get("MODEL_SOURCE", "local")
+    job = None
     
     try:
-        # 创建命主对象
-        fate_owner = FateOwner(
-            gender=Gender.MALE if user_input.gender == "male" else Gender.FEMALE,
-            solar_birth_info=user_input.to_solar_birth_info()
-        )
-        logger.info(f"命主对象创建成功: {fate_owner}")
+        # 创建命主对象并计算八字
+        birth_info = user_input.to_solar_birth_info()
+        fate_owner, bazi_info = calculate_chart("basic_report", birth_info)
+        owner = get_owner(request)
+        chart_code = save_chart_history(owner, birth_info, fate_owner, bazi_info)
         
-        # 计算八字
-        logger.info("开始计算八字...")
-        engine = BaziPaipanEngine()
-        bazi_info = fate_owner.calculate_bazi(engine)
-        logger.info(f"八字计算完成: {bazi_info.get_bazi_string()}")
+        bazi_string = bazi_info.get_bazi_string()
+        with RequestStage("basic_report", "prompt_build"):
+            prompt = f"请对以下八字进行命理解读：{bazi_string}"
+            messages = build_messages(prompt)
+        
+        # 其他worker已生成过相同的解读时直接返回，不占用LLM槽位
+        reading = get_cached_report(model_source, prompt)
+        if reading is not None:
+            if chart_code is not None:
+                chart_store.save_report(owner, chart_code, "basic", reading, model_source)
+            return {"bazi": bazi_string, "reading": reading}
+        
+        job = submit_llm_job(request, model_source)
+        response.headers["X-Job-Id"] = job.job_id
         
         # 使用LLM生成解读
-        logger.info("开始生成命理解读...")
-        llm = get_chat_model(model_source=os.environ.get("MODEL_SOURCE", "local"))
-        prompt = f"请对以下八字进行命理解读：{bazi_info.get_bazi_string()}"
-        messages = [HumanMessage(content=prompt)]
-        response = llm.invoke(messages)
+        llm = get_chat_model(model_source=model_source)
+        async with llm_scheduler.run(job):
+            with RequestStage("basic_report", "llm"):
+                started_at = time.perf_counter()
+                llm_response = await llm.ainvoke(messages)
+                record_llm_usage(job.backend, llm_response, started_at, time.perf_counter())
         logger.info("命理解读生成完成")
+        # 推理模型的 <think> 内容不返回给用户
+        reading = strip_reasoning(llm_response.content)
+        save_report(model_source, prompt, reading)
+        if chart_code is not None:
+            chart_store.save_report(owner, chart_code, "basic", reading, model_source)
         
         result = {
-            "bazi": bazi_info.get_bazi_string(),
-            "reading": response.content
+            "bazi": bazi_string,
+            "reading": reading
         }
-        logger.info("返回结果成功")
         return result
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"生成命盘解读时发生错误：{str(e)}", exc_info=True)
+        logger.error("生成命盘解读时发生错误：%s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"生成命盘解读失败: {str(e)}")
+    finally:
+        # 在获得槽位前失败的任务也要释放
+        if job is not None:
+            llm_scheduler.finish(job, JobStatus.FAILED)
 
-@app.post("/api/calculate_bazi")
-async def calculate_bazi(birth_info: SolarBirthInfo):
+def chart_response(birth_info: SolarBirthInfo, request: Request) -> Response:
+    """排盘响应，带ETag和长期缓存头；GET请求的If-None-Match命中时返回304，不排盘"""
+    etag = chart_etag(birth_info)
+    headers = {"ETag": etag, "Cache-Control": CHART_CACHE_CONTROL}
+    if request.method == "GET" and etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(headers)
     try:
-        # 验证输入已经由Pydantic模型完成
-        
-        # 创建命主对象
-        fate_owner = FateOwner(
-            gender=Gender.MALE if birth_info.gender == "male" else Gender.FEMALE,
-            solar_birth_info=birth_info
-        )
-        
-        # 计算八字
-        engine = BaziPaipanEngine()
-        bazi_info = fate_owner.calculate_bazi(engine)
+        # 创建命主对象并计算八字
+        fate_owner, bazi_info = calculate_chart("calculate_bazi", birth_info)
+        save_chart_history(get_owner(request), birth_info, fate_owner, bazi_info)
         
-        # 构造响应
-        response = {
-            "solar_date": str(birth_info),
-            "lunar_date": str(fate_owner.lunar_birth_info) if fate_owner.lunar_birth_info else None,
-            "bazi_string": bazi_info.get_bazi_string(),
-            "five_elements": bazi_info.five_elements,
-            "pillars": {
-                "year": {"heavenly_stem": bazi_info.year.heavenly_stem, "earthly_branch": bazi_info.year.earthly_branch},
-                "month": {"heavenly_stem": bazi_info.month.heavenly_stem, "earthly_branch": bazi_info.month.earthly_branch},
-                "day": {"heavenly_stem": bazi_info.day.heavenly_stem, "earthly_branch": bazi_info.day.earthly_branch},
-                "hour": {"heavenly_stem": bazi_info.hour.heavenly_stem, "earthly_branch": bazi_info.hour.earthly_branch}
-            },
-            "ten_gods": {
-                pillar: {"heavenly_stem": god.heavenly_stem, "earthly_branch": god.earthly_branch}
-                for pillar, god in bazi_info.ten_gods.items()
-            } if bazi_info.ten_gods else {}
-        }
-
-        return response
+        # 构造响应：由预先编码的片段拼接，不经过jsonable_encoder
+        lunar_date = str(fate_owner.lunar_birth_info) if fate_owner.lunar_birth_info else None
+        return RawJSONResponse(encode_chart_response(str(birth_info), lunar_date, bazi_info), headers=headers)
 
     except Exception as e:
-        logger.error(f"发生错误：{str(e)}", exc_info=True)
+        logger.error("发生错误：%s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
-async def generate_report_stream(birth_info: Union[SolarBirthInfo, LunarBirthInfo]) -> AsyncGenerator[str, None]:
-    """生成流式命理报告"""
+@app.post("/api/calculate_bazi")
+async def calculate_bazi(birth_info: SolarBirthInfo, request: Request):
+    # 验证输入已经由Pydantic模型完成
+    return chart_response(birth_info, request)
+
+@app.get("/api/calculate_bazi")
+async def calculate_bazi_get(birth_info: Annotated[SolarBirthInfo, Query()], request: Request):
+    """排盘的GET形式，出生信息放在查询参数中，浏览器和CDN可以按URL缓存"""
+    return chart_response(birth_info, request)
+
+def chart_batch_chunk(chunk: List[Tuple[int, object]], owner: Optional[str] = None) -> bytes:
+    """在批量排盘线程中处理一块记录，返回按输入顺序排列的输出行
+
+    先校验整块，再按出生日期排序后排盘：历法库缓存最近计算过的农历年，同一年的记录连续计算时
+    历法转换快约十倍。同一块中出生信息相同的记录只排一次。
+    """
+    lines = [b""] * len(chunk)
+    valid = []
+    for position, (index, record) in enumerate(chunk):
+        try:
+            if isinstance(record, RecordError):
+                raise record
+            try:
+                valid.append((SolarBirthInfo.model_validate(record), position, index))
+            except ValidationError as e:
+                raise RecordError(422, e.errors(include_url=False, include_context=False))
+        except RecordError as e:
+            lines[position] = error_line(index, e.status, e.detail)
+
+    charted: Dict[str, bytes] = {}
+    failed = 0
+    for birth_info, position, index in sorted(valid, key=lambda item: (item[0].year, item[0].month, item[0].day)):
+        key = chart_cache_key(birth_info)
+        result = charted.get(key)
+        if result is None:
+            try:
+                fate_owner, bazi_info = calculate_chart("calculate_bazi_batch", birth_info)
+                save_chart_history(owner, birth_info, fate_owner, bazi_info)
+                lunar_date = str(fate_owner.lunar_birth_info) if fate_owner.lunar_birth_info else None
+                result = charted[key] = encode_chart_response(str(birth_info), lunar_date, bazi_info)
+            except Exception as e:
+                failed += 1
+                logger.error("批量排盘第 %d 条记录出错：%s", index, e, exc_info=True)
+                lines[position] = error_line(index, 500, str(e))
+                continue
+        lines[position] = result_line(index, result)
+
+    BATCH_RECORDS.labels("ok").inc(len(valid) - failed)
+    BATCH_RECORDS.labels("error").inc(len(chunk) - len(valid) + failed)
+    return b"".join(lines)
+
+@app.post("/api/calculate_bazi/batch")
+async def calculate_bazi_batch(request: Request):
+    """批量排盘：请求体为出生信息的JSON数组或NDJSON，按输入顺序以NDJSON流式返回，单条记录的错误写在该行中"""
     try:
-        # 创建命主对象
-        fate_owner = FateOwner(
-            gender=Gender.MALE if birth_info.gender == "male" else Gender.FEMALE,
-            solar_birth_info=birth_info if isinstance(birth_info, SolarBirthInfo) else None,
-            lunar_birth_info=birth_info if isinstance(birth_info, LunarBirthInfo) else None
-        )
-        
-        # 计算八字
-        engine = BaziPaipanEngine()
-        bazi_info = fate_owner.calculate_bazi(engine)
+        check_content_length(request.headers.get("content-length"))
+        if is_ndjson(request.headers.get("content-type")):
+            records = iter_ndjson(request.stream())
+        else:
+            records = await read_json_array(request.stream())
+    except BatchLimitError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"无效的请求体: {e}")
+    process_chunk = functools.partial(chart_batch_chunk, owner=get_owner(request))
+    return NDJSONStreamingResponse(stream_batch(records, process_chunk))
+
+def report_prompt_data(birth_info: Union[SolarBirthInfo, LunarBirthInfo], fate_owner: FateOwner, bazi_info: BaziInfo) -> Dict:
+    """报告提示词的命主信息，报告和追问会话共用"""
+    current_year = datetime.now().year
+    return {
+        "gender": birth_info.gender,
+        "birth_date": str(birth_info),
+        "lunar_date": str(fate_owner.lunar_birth_info) if fate_owner.lunar_birth_info else None,
+        "bazi": bazi_info.get_bazi_string(),
+        # 当前时间只精确到年：流年按年变化，报告缓存在一年内有效
+        "current_date": f"{current_year}年",
+        # 四柱十神、五行分值、大运和流年由排盘结果直接给出，模型不必再推算
+        **format_chart_facts(bazi_info, fate_owner.solar_birth_info, current_year)
+    }
+
+def reasoning_parts(contents: AsyncIterator[str], backend: str, record_ttfvt: bool = True) -> AsyncIterator[Tuple[bool, str]]:
+    """把一个模型响应的内容流拆分为 (是否推理内容, 文本)；REPORT_REASONING为raw时全部作为正文"""
+    if REPORT_REASONING == "raw":
+        return ((False, content) async for content in contents)
+    return split_reasoning(contents, backend=backend, record_ttfvt=record_ttfvt)
+
+async def generate_report_events(birth_info: Union[SolarBirthInfo, LunarBirthInfo], job: LLMJob, owner: Optional[str] = None, mode: str = "full") -> AsyncGenerator[Tuple[str, Dict], None]:
+    """生成命理报告事件序列，每项为 (事件名, 数据)；job为已提交的LLM任务，获得运行槽位后才调用模型
+
+    owner为用户标识，给出时命盘和完整生成的报告会保存到用户的历史记录中。
+    mode为sections时各节并行生成（同时生成的节数为job占用的槽位数），先输出的节边生成边发送，
+    后面的节缓冲到前一节结束后再发送
+    """
+    try:
+        # 创建命主对象并计算八字
+        fate_owner, bazi_info = calculate_chart("fate_report", birth_info)
+        chart_code = save_chart_history(owner, birth_info, fate_owner, bazi_info)
         
-        # 准备提示词数据
-        prompt_data = {
-            "gender": birth_info.gender,
-            "birth_date": str(birth_info),
-            "lunar_date": str(fate_owner.lunar_birth_info) if fate_owner.lunar_birth_info else None,
-            "bazi": bazi_info.get_bazi_string(),
-            "five_elements": " ".join(bazi_info.five_elements)
-        }
+        with RequestStage("fate_report", "prompt_build"):
+            # 准备提示词数据
+            prompt_data = report_prompt_data(birth_info, fate_owner, bazi_info)
+            
+            # 获取提示词：静态的系统消息在前，命主信息在后，后端可以复用相同的前缀
+            prompt = get_bazi_report_prompt(prompt_data)
+            
+            # 创建消息；分节生成时每节一组消息，报告缓存的键用分节的系统消息区分
+            if mode == "sections":
+                system = BAZI_SECTION_SYSTEM_PROMPT
+                section_messages = [build_messages(section, system=system) for section in get_bazi_section_prompts(prompt_data)]
+            else:
+                system = BAZI_REPORT_SYSTEM_PROMPT
+                messages = build_messages(prompt, system=system)
         
-        # 获取提示词
-        prompt = get_bazi_report_prompt(prompt_data)
+        # 其他worker已生成过相同的报告时直接回放，不调用模型；任务不再需要，记为取消以释放槽位
+        cached_report = get_cached_report(job.backend, prompt, system)
+        if cached_report is not None:
+            llm_scheduler.finish(job, JobStatus.CANCELLED)
+            yield "start", {"job_id": job.job_id, "cached": True}
+            for char in cached_report:
+                yield "message", {"text": char}
+            if chart_code is not None:
+                chart_store.save_report(owner, chart_code, "fate", cached_report, job.backend)
+            yield "end", {}
+            return
         
         # 使用LLM生成解读
-        llm = get_chat_model(model_source=os.environ.get("MODEL_SOURCE", "local"))
+        llm = get_chat_model(model_source=job.backend)
         
-        # 创建消息
-        messages = [HumanMessage(content=prompt)]
+        # 发送开始事件
+        yield "start", {"job_id": job.job_id}
         
-        # 流式生成报告
-        logger.info("开始生成命理报告...")
+        # 排队时告知客户端排队位置
+        if job.status is JobStatus.QUEUED:
+            yield "queued", {"job_id": job.job_id, "position": llm_scheduler.position(job)}
         
-        # 发送开始事件
-        yield f"event: start\ndata: {{}}\n\n"
-        
-        # 使用流式输出 - 直接使用astream方法
-        buffer = ""
-        async for chunk in llm.astream(messages):
-            if hasattr(chunk, 'content') and chunk.content:
-                content = chunk.content
-                logger.debug(f"收到内容块: {content}")
-                
-                # 将内容添加到缓冲区
-                buffer += content
+        async with llm_scheduler.run(job):
+            with RequestStage("fate_report", "llm"):
+                # 流式生成报告
+                logger.info("开始生成命理报告...")
+            
+                # 使用流式输出 - 上游生成在独立任务中运行，报告流被取消时一并取消
+                # 已生成的内容由报告流的缓冲区保存，仅在需要缓存或保存报告时另行累积全文
+                log_chunks = logger.isEnabledFor(logging.DEBUG)
+                chunks = [] if report_cache.enabled or chart_code is not None else None
+                if mode == "sections":
+                    # 每节分别区分推理内容，某节未闭合的<think>不影响后面的章节；首个正文token的时间按第一节记录
+                    contents = merge_ordered_streams(
+                        [
+                            reasoning_parts(astream_until_disconnect(llm, messages, backend=job.backend), job.backend, i == 0)
+                            for i, messages in enumerate(section_messages)
+                        ],
+                        job.slots,
+                        separator=(False, "\n\n")
+                    )
+                else:
+                    contents = reasoning_parts(astream_until_disconnect(llm, messages, backend=job.backend), job.backend)
+                async for is_reasoning, content in contents:
+                    if log_chunks:
+                        logger.debug("收到内容块: %s", content)
+                    # 推理内容不计入报告正文，按配置作为reasoning事件整块发送或丢弃
+                    if is_reasoning:
+                        if REPORT_REASONING == "event":
+                            yield "reasoning", {"text": content}
+                        continue
+                    if chunks is not None:
+                        chunks.append(content)
                 
-                # 逐字符发送，以实现更好的流式效果
-                for char in content:
-                    # 使用SSE格式发送数据
-                    yield f"event: message\ndata: {json.dumps({'text': char})}\n\n"
+                    # 逐字符发送，以实现更好的流式效果
+                    for char in content:
+                        yield "message", {"text": char}
+        
+        if chunks is not None:
+            report_text = "".join(chunks)
+            save_report(job.backend, prompt, report_text, system)
+            if chart_code is not None:
+                chart_store.save_report(owner, chart_code, "fate", report_text, job.backend)
         
         # 发送完成事件
-        yield f"event: end\ndata: {{}}\n\n"
+        yield "end", {}
         
         logger.info("命理报告生成完成")
         
     except Exception as e:
-        logger.error(f"生成命理报告时发生错误：{str(e)}", exc_info=True)
+        logger.error("生成命理报告时发生错误：%s", e, exc_info=True)
         # 发送错误事件
-        yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+        yield "error", {"error": str(e)}
+    finally:
+        # 在获得槽位前失败或被取消的任务也要释放
+        llm_scheduler.finish(job, JobStatus.FAILED)
+
+async def generate_report_stream(report_stream: ReportStream, after_seq: int = -1, request: Optional[Request] = None) -> AsyncGenerator[str, None]:
+    """输出流式命理报告，request用于检测客户端断开；所有客户端断开且宽限期内无人重连时取消上游生成"""
+    try:
+        async for text in report_streams.stream(report_stream, after_seq, request):
+            yield text
+    except ClientDisconnectedError:
+        logger.info("客户端已断开，报告流 %s 等待续传", report_stream.stream_id)
+    except Exception as e:
+        logger.error("输出命理报告时发生错误：%s", e, exc_info=True)
+        yield format_sse("error", {"error": str(e)})
 
 @app.post("/api/fate_report")
 @app.get("/api/fate_report")  # 添加GET方法支持
-async def get_fate_report(birth_info: Union[SolarBirthInfo, LunarBirthInfo] = None, data: str = None):
-    """获取流式命理报告"""
+async def get_fate_report(request: Request, birth_info: Union[SolarBirthInfo, LunarBirthInfo] = None, data: str = None, last_event_id: str = None, mode: Optional[str] = None):
+    """获取流式命理报告
+    
+    每个报告流拥有唯一ID，事件ID格式为"{stream_id}-{序号}"。断线重连时通过请求头Last-Event-ID
+    （或查询参数last_event_id）传入最后收到的事件ID，即可从断点继续接收，无需重新生成报告。
+    
+    mode为生成方式：full一次生成全文，sections各节并行生成后按顺序输出，默认由REPORT_MODE决定
+    """
+    # 断线重连：从报告流的缓冲区续传
+    resume_id = request.headers.get("last-event-id") or last_event_id
+    resumed = report_streams.resolve(resume_id)
+    if resume_id:
+        # 重连请求能否从缓冲区续传
+        record_cache("report_stream", resumed is not None)
+    if resumed is not None:
+        report_stream, after_seq = resumed
+        logger.info("续传报告流 %s，从事件 %d 开始", report_stream.stream_id, after_seq + 1)
+        return StreamingResponse(
+            generate_report_stream(report_stream, after_seq, request),
+            media_type="text/event-stream",
+            headers={"X-Stream-Id": report_stream.stream_id}
+        )
+    
     # 如果通过查询参数传递数据，则解析数据
     if birth_info is None and data:
         try:
-            birth_data = json.loads(data)
-            # 判断是否为农历数据
-            if "lunar_year" in birth_data:
-                birth_info = LunarBirthInfo(**birth_data)
-            else:
-                birth_info = SolarBirthInfo(**birth_data)
+            with RequestStage("fate_report", "validation"):
+                birth_data = json.loads(data)
+                # 判断是否为农历数据
+                if "lunar_year" in birth_data:
+                    birth_info = LunarBirthInfo(**birth_data)
+                else:
+                    birth_info = SolarBirthInfo(**birth_data)
         except Exception as e:
-            logger.error(f"解析查询参数失败：{str(e)}")
+            logger.error("解析查询参数失败：%s", e)
             raise HTTPException(status_code=400, detail=f"无效的请求数据: {str(e)}")
     
     # 如果仍然没有birth_info，则返回错误
     if birth_info is None:
         raise HTTPException(status_code=400, detail="缺少必要的出生信息")
     
+    mode = mode or REPORT_MODE
+    if mode not in REPORT_MODES:
+        raise HTTPException(status_code=400, detail=f"无效的生成方式: {mode}，可选 {', '.join(REPORT_MODES)}")
+    slots = REPORT_SECTION_CONCURRENCY if mode == "sections" else 1
+    job = submit_llm_job(request, os.environ.get("MODEL_SOURCE", "local"), slots)
+    report_stream = report_streams.create(generate_report_events(birth_info, job, get_owner(request), mode))
+    return StreamingResponse(
+        generate_report_stream(report_stream, request=request),
+        media_type="text/event-stream",
+        headers={"X-Stream-Id": report_stream.stream_id, "X-Job-Id": job.job_id}
+    )
+
+def chat_backend(pinned: Optional[str] = None) -> Tuple[str, object]:
+    """追问使用的模型后端，返回 (后端名, 模型)
+
+    路由模式下会话固定在路由器的一个后端上，同一会话的各轮请求发往同一后端以复用其KV缓存；
+    固定的后端不健康时换到当前最优的后端。其他模式下只有MODEL_SOURCE一个后端
+    """
+    model_source = os.environ.get("MODEL_SOURCE", "local")
+    if model_source == "router":
+        from server.llm_router import get_llm_router
+        router = get_llm_router()
+        backend = router.pick(pinned)
+        return backend.name, router.pinned(backend)
+    return model_source, get_chat_model(model_source=model_source)
+
+@app.post("/api/chat")
+async def create_chat(birth_info: Union[SolarBirthInfo, LunarBirthInfo], request: Request):
+    """创建追问会话，之后通过 /api/chat/{session_id} 就该命盘多轮提问
+
+    会话上下文与报告请求的提示词相同，报告已生成过（报告缓存命中）时一并放入上下文
+    """
+    from langchain_core.messages import AIMessage, SystemMessage
+
+    fate_owner, bazi_info = calculate_chart("chat", birth_info)
+    with RequestStage("chat", "prompt_build"):
+        prompt = get_bazi_report_prompt(report_prompt_data(birth_info, fate_owner, bazi_info))
+        context = build_messages(prompt, system=BAZI_REPORT_SYSTEM_PROMPT)
+        report = get_cached_report(os.environ.get("MODEL_SOURCE", "local"), prompt, BAZI_REPORT_SYSTEM_PROMPT)
+        if report is not None:
+            context.append(AIMessage(content=report))
+        context.append(SystemMessage(content=CHAT_FOLLOWUP_PROMPT))
+    backend, _ = chat_backend()
+    session = chat_sessions.create(get_owner(request), backend, context)
+    logger.info("创建追问会话 %s，后端 %s", session.session_id, backend)
+    return {"session_id": session.session_id, "backend": backend, "has_report": report is not None}
+
+async def generate_chat_events(session: ChatSession, question: str, job: LLMJob) -> AsyncGenerator[Tuple[str, Dict], None]:
+    """生成一轮追问的回答事件序列；回答完整生成后才计入会话历史"""
+    try:
+        yield "start", {"job_id": job.job_id, "session_id": session.session_id}
+        if job.status is JobStatus.QUEUED:
+            yield "queued", {"job_id": job.job_id, "position": llm_scheduler.position(job)}
+        
+        async with llm_scheduler.run(job):
+            backend, llm = chat_backend(session.backend)
+            if backend != session.backend:
+                logger.warning("会话 %s 的后端 %s 不可用，改用 %s", session.session_id, session.backend, backend)
+                session.backend = backend
+            
+            with RequestStage("chat", "llm"):
+                # 历史超出预算时先压缩较早的轮次
+                await session.compact(llm, question)
+                chunks = []
+                contents = reasoning_parts(astream_until_disconnect(llm, session.messages(question), backend=backend), backend)
+                async for is_reasoning, content in contents:
+                    if is_reasoning:
+                        if REPORT_REASONING == "event":
+                            yield "reasoning", {"text": content}
+                        continue
+                    chunks.append(content)
+                    for char in content:
+                        yield "message", {"text": char}
+        
+        session.turns.append((question, "".join(chunks)))
+        yield "end", {"turns": len(session.turns)}
+        
+    except Exception as e:
+        logger.error("生成追问回答时发生错误：%s", e, exc_info=True)
+        yield "error", {"error": str(e)}
+    finally:
+        llm_scheduler.finish(job, JobStatus.FAILED)
+
+@app.post("/api/chat/{session_id}")
+async def chat(session_id: str, chat_input: ChatInput, request: Request):
+    """在追问会话中提问，流式返回回答，事件格式和断线续传方式与 /api/fate_report 相同"""
+    session = chat_sessions.get(session_id, get_owner(request))
+    if session is None:
+        raise HTTPException(status_code=404, detail="会话不存在或已过期")
+    
+    # 断线重连：从回答流的缓冲区续传
+    resumed = report_streams.resolve(request.headers.get("last-event-id"))
+    if resumed is not None and resumed[0] is session.stream:
+        report_stream, after_seq = resumed
+        return StreamingResponse(
+            generate_report_stream(report_stream, after_seq, request),
+            media_type="text/event-stream",
+            headers={"X-Stream-Id": report_stream.stream_id}
+        )
+    
+    if session.busy:
+        raise HTTPException(status_code=409, detail="会话正在回答上一个问题")
+    job = submit_llm_job(request, os.environ.get("MODEL_SOURCE", "local"))
+    session.stream = report_streams.create(generate_chat_events(session, chat_input.message, job))
     return StreamingResponse(
-        generate_report_stream(birth_info),
-        media_type="text/event-stream"
+        generate_report_stream(session.stream, request=request),
+        media_type="text/event-stream",
+        headers={"X-Stream-Id": session.stream.stream_id, "X-Job-Id": job.job_id}
     )
 
+@app.get("/api/chat/{session_id}")
+async def get_chat(session_id: str, request: Request):
+    session = chat_sessions.get(session_id, get_owner(request))
+    if session is None:
+        raise HTTPException(status_code=404, detail="会话不存在或已过期")
+    return session.describe()
+
+@app.delete("/api/chat/{session_id}")
+async def delete_chat(session_id: str, request: Request):
+    if chat_sessions.get(session_id, get_owner(request)) is None:
+        raise HTTPException(status_code=404, detail="会话不存在或已过期")
+    chat_sessions.delete(session_id)
+    return {"deleted": True}
+
+def require_owner(request: Request) -> str:
+    owner = get_owner(request)
+    if owner is None:
+        raise HTTPException(status_code=401, detail="查询历史记录需要用户标识（X-User-Id）")
+    return owner
+
+# 历史记录接口为同步函数，在线程池中查询数据库，不阻塞事件循环
+@app.get("/api/history")
+def list_history(request: Request, limit: int = Query(20, ge=1, le=100), before: Optional[float] = None):
+    """当前用户排过的命盘，最近的在前；翻页时before传上一页最后一条的updated_at"""
+    return chart_store.list_charts(require_owner(request), limit, before)
+
+@app.get("/api/history/{chart_id}")
+def get_history(chart_id: int, request: Request):
+    """历史命盘详情及其全部报告，直接读取保存的结果，不重新排盘或调用模型"""
+    chart = chart_store.get_chart(require_owner(request), chart_id)
+    if chart is None:
+        raise HTTPException(status_code=404, detail="历史记录不存在")
+    return chart
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """查询LLM任务的状态和排队位置"""
+    job = llm_scheduler.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return llm_scheduler.describe(job)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus格式的运行指标"""
+    return Response(content=metrics_registry.render(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/api/test")
 async def test_api():
     """测试API是否正常工作"""
@@ -0,0 +1,211 @@
+"""
+批量排盘
+
+合作方一次提交成千上万人的出生信息，逐个调用 /api/calculate_bazi 时每人都要付出一次HTTP往返和请求处理的开销。
+批量接口在一个请求中接收全部记录，按输入顺序以NDJSON（每行一个JSON）流式返回结果：
+- 输入：JSON数组，或NDJSON（Content-Type为 application/x-ndjson 或 application/jsonl）。
+  NDJSON边上传边排盘，不必等整个请求体到达
+- 排盘：记录按块交给专用线程池，每块在一个线程中按出生日期排序后排完（见 server/app.py 的 chart_batch_chunk）；
+  同时在途的块数有上限，客户端读得慢时不再读取请求体、不再提交新块，背压一直传到上传方
+- 输出：每条记录一行，{"index": 序号, "result": 排盘结果} 或 {"index": 序号, "error": {"status": 状态码, "detail": 原因}}，
+  单条记录出错不影响其他记录
+
+配置项（环境变量）：
+- BATCH_MAX_BYTES:    请求体的最大字节数，超出时返回413（NDJSON已开始返回时以一行错误结束）
+- BATCH_MAX_RECORDS:  每个请求的最大记录数，处理方式同上
+- BATCH_CHUNK_SIZE:   每块的记录数
+- BATCH_MAX_INFLIGHT: 同时在途（排盘中或等待发送）的块数
+- BATCH_WORKERS:      排盘线程数；排盘受GIL限制，多个线程交错计算不同年份还会冲掉历法库的缓存，默认1
+"""
+
+import asyncio
+import logging
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Deque, List, Optional, Tuple
+
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from server.serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_BYTES    = int(os.environ.get("BATCH_MAX_BYTES", 8 * 1024 * 1024))
+BATCH_MAX_RECORDS  = int(os.environ.get("BATCH_MAX_RECORDS", 10000))
+BATCH_CHUNK_SIZE   = int(os.environ.get("BATCH_CHUNK_SIZE", 256))
+BATCH_MAX_INFLIGHT = int(os.environ.get("BATCH_MAX_INFLIGHT", 2))
+BATCH_WORKERS      = int(os.environ.get("BATCH_WORKERS", 1))
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+_NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/json-lines")
+
+# 一条输入记录：(序号, 解析出的JSON值或解析错误)
+Record = Tuple[int, Any]
+
+
+class BatchLimitError(Exception):
+    """请求体或记录数超出限制"""
+    status_code = 413
+
+
+class RecordError(Exception):
+    """单条记录处理失败，以一行错误返回"""
+
+    def __init__(self, status: int, detail: Any):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def is_ndjson(content_type: Optional[str]) -> bool:
+    media_type = (content_type or "").split(";", 1)[0].strip().lower()
+    return media_type in _NDJSON_TYPES
+
+
+def result_line(index: int, result: bytes) -> bytes:
+    """成功记录的输出行，result为已编码的排盘结果"""
+    return b'{"index":%d,"result":%s}\n' % (index, result)
+
+
+def error_line(index: int, status: int, detail: Any) -> bytes:
+    return b'{"index":%d,"error":%s}\n' % (index, dumps({"status": status, "detail": detail}))
+
+
+def check_content_length(content_length: Optional[str], max_bytes: int = BATCH_MAX_BYTES) -> None:
+    """请求头声明的长度超出限制时，在读取请求体之前拒绝"""
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise BatchLimitError(f"请求体超过 {max_bytes} 字节")
+
+
+async def read_json_array(body: AsyncIterator[bytes], max_bytes: int = BATCH_MAX_BYTES, max_records: int = BATCH_MAX_RECORDS) -> List[Record]:
+    """读取并解析JSON数组形式的请求体；超出限制时抛出BatchLimitError，不是数组时抛出ValueError"""
+    data = bytearray()
+    async for chunk in body:
+        data += chunk
+        if len(data) > max_bytes:
+            raise BatchLimitError(f"请求体超过 {max_bytes} 字节")
+    records = loads(bytes(data))
+    if not isinstance(records, list):
+        raise ValueError("请求体应为出生信息的JSON数组")
+    if len(records) > max_records:
+        raise BatchLimitError(f"记录数 {len(records)} 超过上限 {max_records}")
+    return list(enumerate(records))
+
+
+async def iter_ndjson(body: AsyncIterator[bytes], max_bytes: int = BATCH_MAX_BYTES, max_records: int = BATCH_MAX_RECORDS) -> AsyncGenerator[Record, None]:
+    """边读边解析NDJSON请求体，空行跳过；无法解析的行以RecordError作为该记录的值
+
+    超出限制时抛出BatchLimitError，之前的记录已经产出
+    """
+    received = 0
+    index = 0
+    pending = b""
+
+    def parse(line: bytes) -> Any:
+        try:
+            return loads(line)
+        except ValueError as e:
+            return RecordError(400, f"无法解析的JSON: {e}")
+
+    async for chunk in body:
+        received += len(chunk)
+        if received > max_bytes:
+            raise BatchLimitError(f"请求体超过 {max_bytes} 字节")
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if not line.strip():
+                continue
+            if index >= max_records:
+                raise BatchLimitError(f"记录数超过上限 {max_records}")
+            yield index, parse(line)
+            index += 1
+    if pending.strip():
+        if index >= max_records:
+            raise BatchLimitError(f"记录数超过上限 {max_records}")
+        yield index, parse(pending)
+
+
+async def _chunks(records: AsyncIterator[Record], size: int) -> AsyncGenerator[List[Record], None]:
+    chunk: List[Record] = []
+    try:
+        async for record in records:
+            chunk.append(record)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    except BatchLimitError:
+        # 超限之前读到的记录照常处理
+        if chunk:
+            yield chunk
+        raise
+    if chunk:
+        yield chunk
+
+
+async def _as_async(records: List[Record]) -> AsyncGenerator[Record, None]:
+    for record in records:
+        yield record
+
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """边读请求体边返回的NDJSON流式响应
+
+    StreamingResponse 在ASGI 2.4以下会另起任务从receive监听断开，与读取请求体争抢消息，
+    这里只在发送失败时判定断开；读取请求体时收到断开消息同样会结束
+    """
+    media_type = NDJSON_MEDIA_TYPE
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
+
+
+# 批量排盘专用线程池，与处理同步接口的线程池分开，批量请求不会占满后者
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch-chart")
+
+
+async def stream_batch(
+    records: Any,
+    process_chunk: Callable[[List[Record]], bytes],
+    chunk_size: int = BATCH_CHUNK_SIZE,
+    max_inflight: int = BATCH_MAX_INFLIGHT,
+    executor: ThreadPoolExecutor = batch_executor
+) -> AsyncGenerator[bytes, None]:
+    """按输入顺序流式产出各块的输出行
+
+    records为记录列表或异步迭代器；process_chunk在线程池中处理一块记录，返回该块全部输出行。
+    在途块数达到max_inflight时先等最早的一块处理完并发送出去，再读取后续记录。
+    """
+    if isinstance(records, list):
+        records = _as_async(records)
+    loop = asyncio.get_running_loop()
+    pending: Deque[asyncio.Future] = deque()
+    next_index = 0
+    try:
+        try:
+            async for chunk in _chunks(records, chunk_size):
+                pending.append(loop.run_in_executor(executor, process_chunk, chunk))
+                next_index = chunk[-1][0] + 1
+                if len(pending) >= max_inflight:
+                    yield await pending.popleft()
+        except BatchLimitError as e:
+            # 已经开始返回结果，只能以一行错误结束
+            while pending:
+                yield await pending.popleft()
+            logger.warning("批量排盘请求超出限制：%s", e)
+            yield error_line(next_index, e.status_code, str(e))
+            return
+        while pending:
+            yield await pending.popleft()
+    finally:
+        # 客户端断开时取消尚未开始的块
+        for future in pending:
+            future.cancel()
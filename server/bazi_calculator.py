@@ -1,11 +1,14 @@
 from datetime import datetime, timedelta
 import sxtwl  # 使用寿星天文历库计算农历和八字
-from typing import Dict, Tuple, List
-from define import *
-from terminology import *
+from typing import Dict, Tuple, List, Optional
+from server.define import *
+from server.terminology import *
 
 NUM_DECADE_PILLAR = 8
 
+# 排盘引擎版本：排盘规则或输出内容变化时递增，缓存的排盘结果（共享缓存、ETag）随之失效
+ENGINE_VERSION = "1"
+
 class BaziCalculator:
     """八字计算器
     根据输入的年月日时、性别，进行阳历转农历、农历转阳历、八字计算、大运计算等。
@@ -438,14 +441,34 @@ class BaziCalculator:
         qiyun_date_solar = dayun_start_info["qiyun_date_solar"] # 起运具体日期：起运时间是哪年哪月哪日
         
         # 计算大运干支和年份
-        destiny_cycles = []
         # 获取月柱干支在六十甲子中的索引
-        current_gz_index = self.SEXAGENARY_CYCLE.index(
+        month_gz_index = self.SEXAGENARY_CYCLE.index(
             f"{self.TIAN_GAN_NAMES[month_gz.tg]}{self.DI_ZHI_NAMES[month_gz.dz]}"
         )
-        
-        # 计算大运干支
-        first_cycle_year = qiyun_date_solar["year"]
+        destiny_cycles = self._calculate_dayun_cycles(month_gz_index, is_forward, qiyun_date_solar["year"])
+
+        # TODO: 排出每个大运的年份
+        return {
+            "cycles": destiny_cycles,
+            "start_age": start_age,
+            "qiyun_date_solar": dayun_start_info['qiyun_date_solar'],
+            "qiyun_date_lunar": dayun_start_info['qiyun_date_lunar'],
+            "jieqi_name": self.JIE_QI_NAMES[jieqi_idx], # 生日最近的一个节气名称
+            "is_forward": is_forward
+        }
+    
+    def _calculate_dayun_cycles(self, month_gz_index: int, is_forward: bool, first_cycle_year: Optional[int] = None) -> List[Dict]:
+        """从月柱开始按顺逆排列大运干支
+
+        Args:
+            month_gz_index: 月柱在六十甲子中的索引
+            is_forward: 是否顺行
+            first_cycle_year: 第一步大运的年份，未知时不输出年份
+        Returns:
+            大运干支列表
+        """
+        destiny_cycles = []
+        current_gz_index = month_gz_index
         for i in range(NUM_DECADE_PILLAR):
             if is_forward:
                 current_gz_index = (current_gz_index + 1) % 60
@@ -459,22 +482,47 @@ class BaziCalculator:
             cycle_info = {
                 "tian_gan": stem,
                 "di_zhi": branch,
-                "cang_gan": self.BRANCH_HIDDEN_STEM.get(branch, []),
-                "year": first_cycle_year + i * 10
+                "cang_gan": self.BRANCH_HIDDEN_STEM.get(branch, [])
             }
+            if first_cycle_year is not None:
+                cycle_info["year"] = first_cycle_year + i * 10
             destiny_cycles.append(cycle_info)
-            
+        return destiny_cycles
 
-        # TODO: 排出每个大运的年份
-        return {
-            "cycles": destiny_cycles,
-            "start_age": start_age,
-            "qiyun_date_solar": dayun_start_info['qiyun_date_solar'],
-            "qiyun_date_lunar": dayun_start_info['qiyun_date_lunar'],
-            "jieqi_name": self.JIE_QI_NAMES[jieqi_idx], # 生日最近的一个节气名称
+    def calculate_bazi_from_pillars(
+        self,
+        year_index: int,
+        month_index: int,
+        day_index: int,
+        hour_index: int,
+        is_forward: bool,
+        start_age: Dict[str, int]
+    ) -> Dict:
+        """由四柱在六十甲子中的索引、大运顺逆和起运时间还原八字，不需要出生日期（用于命盘编码的解码）
+
+        Args:
+            year_index: 年柱索引
+            month_index: 月柱索引
+            day_index: 日柱索引
+            hour_index: 时柱索引
+            is_forward: 大运是否顺行
+            start_age: 起运时间，包含years、months、days
+        Returns:
+            与 calculate_bazi_from_lunar 结构相同的八字信息字典，大运中不含年份、起运日期和节气
+        """
+        bazi = {
+            pillar: self._create_pillar_info(index % 10, index % 12)
+            for pillar, index in ((YEAR, year_index), (MONTH, month_index), (DAY, day_index), (HOUR, hour_index))
+        }
+        bazi[FIVE_ELEMENTS] = self._calculate_five_elements(bazi)
+        bazi[TEN_GODS] = self._calculate_ten_gods(bazi, self.TIAN_GAN_NAMES[day_index % 10])
+        bazi[DECADE_PILLAR] = {
+            "cycles": self._calculate_dayun_cycles(month_index, is_forward),
+            "start_age": dict(start_age),
             "is_forward": is_forward
         }
-    
+        return bazi
+
     def _get_nearest_jieqi_time(self, day: sxtwl.Day, is_forward: bool) -> Tuple[int, Tuple[int, int, int, int, int, int]]:
         """
         获取距离某日最近的下/上一个节气时间
@@ -0,0 +1,124 @@
+"""
+命盘编码
+
+把一张命盘压缩为一个32位无符号整数，用作缓存、数据库和索引的键，比较和哈希都是整数运算：
+- 四柱：年柱、日柱取六十甲子序号（0-59）；月干由年干按五虎遁确定，时干由日干按五鼠遁确定，
+  只需记录月支、时支（0-11）。四柱共 60*12*60*12 = 518400 种，占19位
+- 性别：1位，男0女1。大运顺逆由年干阴阳与性别确定（阳男阴女顺行），不单独占位
+- 起运：以天计的起运时间（年*360 + 月*30 + 天），占12位
+
+布局（高位到低位）：| 四柱 19位 | 性别 1位 | 起运 12位 |
+
+十神、五行、藏干和大运干支都由四柱和大运顺逆决定，解码时由排盘引擎按同样的规则重新推出，
+不需要出生日期，也不做历法计算。编码与 BaziInfo 可以互相转换：encode_chart / decode_chart，
+或 BaziInfo.chart_code / BaziInfo.from_chart_code。
+"""
+
+from typing import Optional, Tuple
+
+from server.define import BaziInfo, EarthlyBranch, Gender, HeavenlyStem, PillarInfo
+from server.fate_owner import FateOwner, build_bazi_info
+
+STEMS = list(HeavenlyStem)
+BRANCHES = list(EarthlyBranch)
+STEM_INDEX = {stem: i for i, stem in enumerate(STEMS)}
+BRANCH_INDEX = {branch: i for i, branch in enumerate(BRANCHES)}
+
+START_OFFSET_BITS = 12
+START_OFFSET_MAX = (1 << START_OFFSET_BITS) - 1
+GENDER_SHIFT = START_OFFSET_BITS
+PILLARS_SHIFT = START_OFFSET_BITS + 1
+
+
+def sexagenary_index(stem: HeavenlyStem, branch: EarthlyBranch) -> int:
+    """干支在六十甲子中的序号，甲子为0；天干地支阴阳不一致时抛出ValueError"""
+    s, b = STEM_INDEX[stem], BRANCH_INDEX[branch]
+    if s % 2 != b % 2:
+        raise ValueError(f"无效的干支组合: {stem}{branch}")
+    return (6 * s - 5 * b) % 60
+
+
+def month_stem_index(year_stem: int, month_branch: int) -> int:
+    """五虎遁：由年干和月支推出月干"""
+    return ((year_stem % 5) * 2 + 2 + (month_branch - 2) % 12) % 10
+
+
+def hour_stem_index(day_stem: int, hour_branch: int) -> int:
+    """五鼠遁：由日干和时支推出时干"""
+    return ((day_stem % 5) * 2 + hour_branch) % 10
+
+
+def is_forward(year_stem: int, gender: Gender) -> bool:
+    """大运顺逆：阳年生男、阴年生女顺行，反之逆行"""
+    return (year_stem % 2 == 0) == (gender is Gender.MALE)
+
+
+def _check_stem(pillar: PillarInfo, expected: int, name: str) -> None:
+    if STEM_INDEX[pillar.heavenly_stem] != expected:
+        raise ValueError(f"{name}{pillar}与{STEMS[expected]}不符，无法编码")
+
+
+def encode_chart(bazi_info: BaziInfo, gender: Optional[Gender] = None) -> int:
+    """把命盘编码为32位整数
+
+    gender省略时由年干阴阳和大运顺逆推出。命盘缺少大运，或不符合五虎遁、五鼠遁、大运顺逆规则时抛出ValueError
+    """
+    destiny = bazi_info.destiny_cycle
+    if destiny is None:
+        raise ValueError("缺少大运信息，无法编码")
+
+    year = sexagenary_index(bazi_info.year_pillar.heavenly_stem, bazi_info.year_pillar.earthly_branch)
+    day = sexagenary_index(bazi_info.day_pillar.heavenly_stem, bazi_info.day_pillar.earthly_branch)
+    month_branch = BRANCH_INDEX[bazi_info.month_pillar.earthly_branch]
+    hour_branch = BRANCH_INDEX[bazi_info.hour_pillar.earthly_branch]
+    _check_stem(bazi_info.month_pillar, month_stem_index(year % 10, month_branch), "月柱")
+    _check_stem(bazi_info.hour_pillar, hour_stem_index(day % 10, hour_branch), "时柱")
+    if gender is None:
+        gender = Gender.MALE if destiny.is_forward == (year % 2 == 0) else Gender.FEMALE
+    elif destiny.is_forward != is_forward(year % 10, gender):
+        raise ValueError("大运顺逆与年干、性别不符，无法编码")
+
+    start = destiny.start_age
+    start_offset = (start.years * 12 + start.months) * 30 + start.days
+    if not 0 <= start_offset <= START_OFFSET_MAX:
+        raise ValueError(f"起运时间超出编码范围: {start}")
+
+    pillars = ((year * 12 + month_branch) * 60 + day) * 12 + hour_branch
+    return (pillars << PILLARS_SHIFT) | ((gender is Gender.FEMALE) << GENDER_SHIFT) | start_offset
+
+
+def unpack_chart(code: int) -> Tuple[int, int, int, int, Gender, int]:
+    """拆出四柱的六十甲子序号（年、月、日、时）、性别和以天计的起运时间"""
+    if not 0 <= code < (1 << 32):
+        raise ValueError(f"无效的命盘编码: {code}")
+    pillars, hour_branch = divmod(code >> PILLARS_SHIFT, 12)
+    pillars, day = divmod(pillars, 60)
+    year, month_branch = divmod(pillars, 12)
+    if year >= 60:
+        raise ValueError(f"无效的命盘编码: {code}")
+    month = sexagenary_index(STEMS[month_stem_index(year % 10, month_branch)], BRANCHES[month_branch])
+    hour = sexagenary_index(STEMS[hour_stem_index(day % 10, hour_branch)], BRANCHES[hour_branch])
+    return year, month, day, hour, chart_gender(code), code & START_OFFSET_MAX
+
+
+def chart_gender(code: int) -> Gender:
+    return Gender.FEMALE if code >> GENDER_SHIFT & 1 else Gender.MALE
+
+
+def pillars_string(code: int) -> str:
+    """四柱字符串，如'甲子 乙丑 丙寅 丁卯'，不构建BaziInfo"""
+    year, month, day, hour, _, _ = unpack_chart(code)
+    return " ".join(STEMS[i % 10].value + BRANCHES[i % 12].value for i in (year, month, day, hour))
+
+
+def decode_chart(code: int) -> BaziInfo:
+    """由编码还原完整的BaziInfo（四柱、藏干、五行、十神、大运）"""
+    year, month, day, hour, gender, start_offset = unpack_chart(code)
+    months, days = divmod(start_offset, 30)
+    years, months = divmod(months, 12)
+    bazi_dict = FateOwner.engine.calculate_bazi_from_pillars(
+        year, month, day, hour,
+        is_forward=is_forward(year % 10, gender),
+        start_age={"years": years, "months": months, "days": days}
+    )
+    return build_bazi_info(bazi_dict)
@@ -0,0 +1,138 @@
+"""
+命盘事实：由排盘结果生成注入报告提示词的结构化数据
+
+四柱、十神、五行分值、大运和流年都由排盘引擎确定性地算出，直接以紧凑的表格交给模型，
+模型不必再自行推算（推算既耗输出token，又容易出错），只需在此基础上分析。
+
+- 五行分值：天干各计1分；地支计1分，按藏干本气、中气、余气分配（见 HIDDEN_STEM_WEIGHTS）
+- 大运年份：与排盘引擎相同，出生日期加上起运年龄（1年按365天、1月按30天）得到起运年份，之后每十年一步
+- 流年：按公历年份取干支（实际以立春为界），列出当前大运的十年
+
+当前年份变化时事实随之变化，报告缓存以提示词为键，同一命盘每年重新生成一次
+"""
+
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from server.bazi_calculator import BaziCalculator
+from server.define import BaziInfo, DestinyCycleInfo, PillarInfo, SolarBirthInfo
+
+ELEMENTS = ("木", "火", "土", "金", "水")
+STEM_ELEMENT = BaziCalculator.TIAN_GAN_2_WU_XING
+
+# 地支的1分按藏干个数分配给本气、中气、余气
+HIDDEN_STEM_WEIGHTS = {1: (1.0,), 2: (0.7, 0.3), 3: (0.6, 0.3, 0.1)}
+
+PILLAR_NAMES = (("year", "年柱"), ("month", "月柱"), ("day", "日柱"), ("hour", "时柱"))
+
+
+def year_pillar_name(year: int) -> str:
+    """公历年份对应的干支，1984年为甲子"""
+    return BaziCalculator.SEXAGENARY_CYCLE[(year - 4) % 60]
+
+
+def _pillars(bazi_info: BaziInfo) -> List[PillarInfo]:
+    return [bazi_info.year_pillar, bazi_info.month_pillar, bazi_info.day_pillar, bazi_info.hour_pillar]
+
+
+def element_scores(bazi_info: BaziInfo) -> Dict[str, float]:
+    """四柱的五行分值，合计8分"""
+    scores = dict.fromkeys(ELEMENTS, 0.0)
+    for pillar in _pillars(bazi_info):
+        scores[STEM_ELEMENT[pillar.heavenly_stem.value]] += 1
+        hidden = pillar.hidden_stem or []
+        for stem, weight in zip(hidden, HIDDEN_STEM_WEIGHTS.get(len(hidden), ())):
+            scores[STEM_ELEMENT[stem.value]] += weight
+    return {element: round(score, 1) for element, score in scores.items()}
+
+
+def destiny_start_year(solar_birth_info: SolarBirthInfo, destiny_cycle: DestinyCycleInfo) -> int:
+    """第一步大运的起始年份，算法与排盘引擎的起运日期一致"""
+    start_age = destiny_cycle.start_age
+    birth = date(solar_birth_info.year, solar_birth_info.month, solar_birth_info.day)
+    return (birth + timedelta(days=start_age.years * 365 + start_age.months * 30 + start_age.days)).year
+
+
+def destiny_years(solar_birth_info: SolarBirthInfo, destiny_cycle: DestinyCycleInfo) -> List[Tuple[PillarInfo, int]]:
+    """每步大运及其起始年份"""
+    first_year = destiny_start_year(solar_birth_info, destiny_cycle)
+    return [(cycle, first_year + i * 10) for i, cycle in enumerate(destiny_cycle.cycles)]
+
+
+def current_destiny(cycles: List[Tuple[PillarInfo, int]], current_year: int) -> Optional[Tuple[PillarInfo, int]]:
+    """当前年份所在的大运，尚未起运或已超出排出的大运时为None"""
+    for cycle, start_year in cycles:
+        if start_year <= current_year < start_year + 10:
+            return cycle, start_year
+    return None
+
+
+def format_chart_facts(bazi_info: BaziInfo, solar_birth_info: SolarBirthInfo, current_year: int) -> Dict[str, str]:
+    """生成注入提示词的命盘事实
+
+    Returns:
+        字典，包含以下键:
+            - chart_facts    : str, 四柱十神、五行分值、大运和流年的表格
+            - current_dayun  : str, 当前大运，未起运时为"未起运"
+            - current_liunian: str, 当前流年
+    """
+    pillars = _pillars(bazi_info)
+    ten_gods = [bazi_info.ten_gods.get(key) for key, _ in PILLAR_NAMES]
+    day_stem = bazi_info.day_pillar.heavenly_stem.value
+
+    lines = [
+        "四柱:",
+        "| | " + " | ".join(name for _, name in PILLAR_NAMES) + " |",
+        "|---|---|---|---|---|",
+        "| 干支 | " + " | ".join(str(pillar) for pillar in pillars) + " |",
+        # 日干为日主本身，不论十神
+        "| 天干十神 | " + " | ".join(
+            "日主" if key == "day" else (str(gods.heavenly_stem) if gods else "")
+            for (key, _), gods in zip(PILLAR_NAMES, ten_gods)
+        ) + " |",
+        "| 藏干 | " + " | ".join("".join(str(stem) for stem in pillar.hidden_stem or []) for pillar in pillars) + " |",
+        "| 藏干十神 | " + " | ".join(" ".join(str(god) for god in gods.hidden_stems) if gods else "" for gods in ten_gods) + " |",
+        "",
+        f"日主: {day_stem}{STEM_ELEMENT[day_stem]}",
+        "五行分值（天干各1分，地支1分按藏干分配，合计8分）: "
+        + " ".join(f"{element}{score:g}" for element, score in element_scores(bazi_info).items()),
+    ]
+
+    current_liunian = year_pillar_name(current_year)
+    current_dayun = ""
+    destiny_cycle = bazi_info.destiny_cycle
+    if destiny_cycle is not None:
+        cycles = destiny_years(solar_birth_info, destiny_cycle)
+        current = current_destiny(cycles, current_year)
+        if current is not None:
+            current_dayun = str(current[0])
+        elif current_year < cycles[0][1]:
+            current_dayun = "未起运"
+        birth_year = solar_birth_info.year
+        direction = "顺行" if destiny_cycle.is_forward else "逆行"
+        lines += [
+            "",
+            f"大运（{direction}，{destiny_cycle.start_age}起运）:",
+            "| 大运 | 年份 | 年龄 |",
+            "|---|---|---|",
+        ]
+        lines += [
+            f"| {cycle}{'（当前）' if current is not None and start_year == current[1] else ''} "
+            f"| {start_year}-{start_year + 9} | {start_year - birth_year}-{start_year - birth_year + 9} |"
+            for cycle, start_year in cycles
+        ]
+        # 流年：当前大运的十年，不在排出的大运中时为当前年份起的十年
+        first_year = current[1] if current is not None else current_year
+        lines += [
+            "",
+            "流年: " + " ".join(
+                f"{year}{year_pillar_name(year)}{'（当前）' if year == current_year else ''}"
+                for year in range(first_year, first_year + 10)
+            ),
+        ]
+
+    return {
+        "chart_facts": "\n".join(lines),
+        "current_dayun": current_dayun,
+        "current_liunian": current_liunian,
+    }
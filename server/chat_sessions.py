@@ -0,0 +1,199 @@
+"""
+多轮追问会话
+
+用户看完报告后可以就同一命盘继续追问。每个会话在进程内保存：
+- 上下文：报告的系统消息、命主信息（与报告请求相同），以及已生成的报告（有缓存时），之后是追问说明。
+  这部分在会话内不变，作为每轮请求的公共前缀，后端可以复用其KV缓存，每轮只需计算新增的问答
+- 历史：此前的问答轮次和较早轮次的摘要。历史的token数超过预算时，把较早的轮次连同旧摘要压缩为新摘要，
+  只保留最近的几轮原文；摘要只在超出预算时更新，大多数轮次的提示词前缀保持不变
+- 后端：会话固定使用创建时选定的模型后端（路由模式下为其中一个后端），KV缓存才能在轮次之间复用
+
+会话按LRU和空闲时间淘汰：空闲超过 CHAT_SESSION_TTL 秒的会话失效，会话数超过 CHAT_MAX_SESSIONS 时淘汰最久未用的。
+token数按字符数估算（中文约一字一token），只用于预算控制。
+
+配置项（环境变量）：
+- CHAT_SESSION_TTL:     会话空闲多久后失效（秒）
+- CHAT_MAX_SESSIONS:    进程内最多保存的会话数
+- CHAT_HISTORY_TOKENS:  历史（摘要、问答轮次和新问题）的token预算
+- CHAT_KEEP_TURNS:      压缩历史时保留原文的最近轮数
+"""
+
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from server.llm_stream import strip_reasoning
+from server.memory import approx_size, register_cache
+from server.metrics import registry
+from server.prompt_templates import CHAT_SUMMARY_HEADER, CHAT_SUMMARY_REQUEST
+
+logger = logging.getLogger(__name__)
+
+CHAT_SESSION_TTL    = float(os.environ.get("CHAT_SESSION_TTL", 1800))
+CHAT_MAX_SESSIONS   = int(os.environ.get("CHAT_MAX_SESSIONS", 1000))
+CHAT_HISTORY_TOKENS = int(os.environ.get("CHAT_HISTORY_TOKENS", 4000))
+CHAT_KEEP_TURNS     = int(os.environ.get("CHAT_KEEP_TURNS", 4))
+
+SESSIONS_EVICTED = registry.counter("chat_sessions_evicted_total", "淘汰的追问会话数", ["reason"])
+HISTORY_SUMMARIZED = registry.counter("chat_history_summarized_total", "压缩追问历史的次数", ["outcome"])
+
+
+def estimate_tokens(text: str) -> int:
+    """按字符数估算token数"""
+    return len(text)
+
+
+class ChatSession:
+    """一个追问会话：固定的上下文、问答历史和固定的模型后端"""
+
+    def __init__(self, session_id: str, owner: Optional[str], backend: str, context: List[Any]):
+        self.session_id = session_id
+        self.owner = owner
+        # 固定使用的模型后端名称；路由模式下为路由器中的后端名
+        self.backend = backend
+        self.context = context
+        self.summary = ""
+        self.turns: List[Tuple[str, str]] = []
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        # 正在生成回答的报告流；同一会话同时只处理一轮追问
+        self.stream: Optional[Any] = None
+
+    @property
+    def busy(self) -> bool:
+        return self.stream is not None and not self.stream.finished
+
+    def history_tokens(self) -> int:
+        return estimate_tokens(self.summary) + sum(estimate_tokens(q) + estimate_tokens(a) for q, a in self.turns)
+
+    def messages(self, question: str, turns: Optional[List[Tuple[str, str]]] = None) -> List[Any]:
+        """发给模型的消息：上下文、摘要、历史问答（默认为全部轮次）、新问题"""
+        from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+        messages = list(self.context)
+        if self.summary:
+            messages.append(SystemMessage(content=CHAT_SUMMARY_HEADER + self.summary))
+        for asked, answered in self.turns if turns is None else turns:
+            messages.append(HumanMessage(content=asked))
+            messages.append(AIMessage(content=answered))
+        messages.append(HumanMessage(content=question))
+        return messages
+
+    def split_for_summary(self, question: str, budget: int, keep_turns: int) -> int:
+        """历史加上新问题超出预算时，返回需要压缩的最早轮数，否则返回0；至少保留最近一轮原文"""
+        if self.history_tokens() + estimate_tokens(question) <= budget or len(self.turns) <= 1:
+            return 0
+        keep = max(1, min(keep_turns, len(self.turns) - 1))
+        # 保留的轮次本身就超出预算时，只保留最近一轮
+        kept = sum(estimate_tokens(q) + estimate_tokens(a) for q, a in self.turns[-keep:])
+        if kept + estimate_tokens(question) > budget:
+            keep = 1
+        return len(self.turns) - keep
+
+    async def compact(self, llm: Any, question: str, budget: int = CHAT_HISTORY_TOKENS, keep_turns: int = CHAT_KEEP_TURNS) -> bool:
+        """历史超出预算时，把较早的轮次连同旧摘要压缩为新摘要，返回是否压缩
+
+        摘要请求与此前各轮共享上下文、摘要和较早问答这段前缀，后端可以复用其KV缓存。
+        模型调用失败或返回空内容时，只保留较早轮次的问题作为摘要，不让追问失败
+        """
+        count = self.split_for_summary(question, budget, keep_turns)
+        if not count:
+            return False
+        old_turns = self.turns[:count]
+        # 摘要最多占预算的四分之一，其余留给最近的轮次和新问题
+        limit = max(100, budget // 4)
+        try:
+            result = await llm.ainvoke(self.messages(CHAT_SUMMARY_REQUEST.format(limit=limit), old_turns))
+            summary = strip_reasoning(result.content).strip()
+            if not summary:
+                raise ValueError("模型返回的摘要为空")
+            HISTORY_SUMMARIZED.labels("ok").inc()
+        except Exception as e:
+            logger.warning("压缩会话 %s 的历史失败，只保留较早的问题：%s", self.session_id, e)
+            summary = "\n".join(filter(None, [self.summary, "用户还问过：" + "；".join(q for q, _ in old_turns)]))
+            HISTORY_SUMMARIZED.labels("fallback").inc()
+        self.summary = summary[:limit]
+        self.turns = self.turns[count:]
+        return True
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "backend": self.backend,
+            "turns": len(self.turns),
+            "history_tokens": self.history_tokens(),
+            "summarized": bool(self.summary),
+            "idle_seconds": round(time.monotonic() - self.last_used, 1)
+        }
+
+
+class ChatSessionStore:
+    """追问会话的LRU存储，空闲超时的会话失效"""
+
+    def __init__(self, max_sessions: int = CHAT_MAX_SESSIONS, ttl: float = CHAT_SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def create(self, owner: Optional[str], backend: str, context: List[Any]) -> ChatSession:
+        self.evict()
+        while len(self._sessions) >= self.max_sessions:
+            self._sessions.popitem(last=False)
+            SESSIONS_EVICTED.labels("lru").inc()
+        session = ChatSession(uuid.uuid4().hex, owner, backend, context)
+        self._sessions[session.session_id] = session
+        return session
+
+    def get(self, session_id: str, owner: Optional[str] = None) -> Optional[ChatSession]:
+        """查找会话并标记为最近使用；已过期或不属于该用户的会话返回None"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if time.monotonic() - session.last_used >= self.ttl:
+            self._remove(session_id, "ttl")
+            return None
+        if session.owner is not None and session.owner != owner:
+            return None
+        session.last_used = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    def evict(self) -> None:
+        """淘汰空闲超时的会话；会话按最近使用排序，从最久未用的开始检查"""
+        now = time.monotonic()
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used < self.ttl:
+                break
+            self._remove(session_id, "ttl")
+
+    def stats(self) -> Dict[str, Any]:
+        """会话占用统计，用于内存诊断"""
+        return {
+            "entries": len(self._sessions),
+            "bytes": approx_size(self._sessions) + sum(
+                approx_size(s.turns) + sum(approx_size(turn) for turn in s.turns) + approx_size(s.summary)
+                + sum(approx_size(getattr(m, "content", "")) for m in s.context)
+                for s in self._sessions.values()
+            ),
+            "history_tokens": sum(s.history_tokens() for s in self._sessions.values()),
+            "max_entries": self.max_sessions
+        }
+
+    def _remove(self, session_id: str, reason: str) -> None:
+        del self._sessions[session_id]
+        SESSIONS_EVICTED.labels(reason).inc()
+
+
+# 全局会话存储
+chat_sessions = ChatSessionStore()
+register_cache("chat_sessions", chat_sessions.stats)
@@ -0,0 +1,203 @@
+"""
+响应压缩
+
+报告是很长的中文Markdown，经SSE逐段发送（事件数据经JSON转义，每个汉字占6字节），批量排盘的NDJSON也可能很大。
+这里按 Accept-Encoding 协商压缩（安装了brotli时优先br，否则gzip）：
+- 一次性的响应（JSON等）：小于 COMPRESS_MIN_SIZE 的不压缩，压缩收益抵不过开销
+- 流式响应（SSE、NDJSON）：用同一个压缩流连续压缩，每到事件边界（SSE的空行、NDJSON的换行）就flush一次，
+  客户端收到后可以立即解压出完整的事件，不会因为压缩缓冲而推迟首字；事件中途的数据留在压缩器中，
+  等凑齐一个事件再发送
+- 已带 Content-Encoding 的响应（如预压缩的静态文件）、304/204 和未列入的内容类型原样返回
+- 压缩后的表示与原文不同，强ETag改为弱ETag
+
+Starlette 的 GZipMiddleware 不压缩 text/event-stream，流式响应也不按事件边界flush，所以这里单独实现。
+
+配置项（环境变量）：
+- COMPRESSION_ENABLED:     是否开启压缩，默认开启
+- COMPRESS_MIN_SIZE:       一次性响应的最小压缩字节数
+- COMPRESS_GZIP_LEVEL:     gzip压缩级别（1-9）
+- COMPRESS_BROTLI_QUALITY: brotli压缩质量（0-11）；流式响应逐事件flush，质量过高时CPU开销大而收益有限
+"""
+
+import os
+import zlib
+from typing import List, Optional, Tuple
+
+from server.http_cache import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # brotli为可选依赖，未安装时只用gzip
+    brotli = None
+
+COMPRESSION_ENABLED     = os.environ.get("COMPRESSION_ENABLED", "1").lower() not in ("0", "false", "no")
+COMPRESS_MIN_SIZE       = int(os.environ.get("COMPRESS_MIN_SIZE", 512))
+COMPRESS_GZIP_LEVEL     = int(os.environ.get("COMPRESS_GZIP_LEVEL", 6))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", 5))
+
+# 压缩的内容类型
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/event-stream", "text/plain", "text/html",
+                      "text/css", "text/javascript", "application/javascript")
+
+# 各内容类型的事件分隔符，流式压缩在分隔符处flush
+EVENT_DELIMITERS = {"text/event-stream": b"\n\n", "application/x-ndjson": b"\n"}
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """按服务端偏好选择客户端接受的编码：br（需安装brotli）优先，其次gzip"""
+    accepted = accepted_encodings(accept_encoding)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class StreamCompressor:
+    """连续压缩一个响应的数据；flush后已输入的数据可以被客户端完整解压"""
+
+    def __init__(self, encoding: str, gzip_level: int = COMPRESS_GZIP_LEVEL, brotli_quality: int = COMPRESS_BROTLI_QUALITY):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        """输出已输入数据的全部压缩结果，压缩流继续可用"""
+        if self.encoding == "br":
+            return self._compressor.flush()
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+def compress_bytes(data: bytes, encoding: str) -> bytes:
+    compressor = StreamCompressor(encoding)
+    return compressor.compress(data) + compressor.finish()
+
+
+def _media_type(headers: List[Tuple[bytes, bytes]]) -> Optional[str]:
+    for name, value in headers:
+        if name.lower() == b"content-type":
+            return value.decode("latin-1").split(";", 1)[0].strip().lower()
+    return None
+
+
+def _rewrite_headers(headers: List[Tuple[bytes, bytes]], encoding: str, length: Optional[int]) -> List[Tuple[bytes, bytes]]:
+    """设置Content-Encoding和Vary，更新Content-Length，强ETag改为弱ETag"""
+    rewritten = []
+    vary = None
+    for name, value in headers:
+        lower = name.lower()
+        if lower == b"content-length":
+            continue
+        if lower == b"vary":
+            vary = value
+            continue
+        if lower == b"etag" and not value.startswith(b"W/"):
+            value = b"W/" + value
+        rewritten.append((name, value))
+    rewritten.append((b"content-encoding", encoding.encode("latin-1")))
+    rewritten.append((b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"))
+    if length is not None:
+        rewritten.append((b"content-length", str(length).encode("latin-1")))
+    return rewritten
+
+
+class CompressionMiddleware:
+    """按Accept-Encoding压缩响应；流式响应在事件边界flush"""
+
+    def __init__(self, app, min_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.min_size = min_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding = None
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                encoding = choose_encoding(value.decode("latin-1"))
+                break
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor: Optional[StreamCompressor] = None
+        delimiter = b""
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, delimiter, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                if message["status"] == 304:
+                    # 客户端缓存的是压缩后的表示，304的ETag与之保持一致（条件请求按弱比较匹配）
+                    message["headers"] = [
+                        (name, b"W/" + value if name.lower() == b"etag" and not value.startswith(b"W/") else value)
+                        for name, value in headers
+                    ]
+                    passthrough = True
+                    await send(message)
+                    return
+                media_type = _media_type(headers)
+                if (
+                    message["status"] == 204
+                    or media_type not in COMPRESSIBLE_TYPES
+                    or any(name.lower() == b"content-encoding" for name, _ in headers)
+                ):
+                    passthrough = True
+                    await send(message)
+                    return
+                # 等到第一段响应体，才知道是一次性响应还是流式响应
+                start_message = {**message, "headers": headers}
+                delimiter = EVENT_DELIMITERS.get(media_type, b"")
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                start, start_message = start_message, None
+                if not more_body:
+                    # 一次性响应：太小的不压缩
+                    if len(body) < self.min_size:
+                        passthrough = True
+                        await send(start)
+                        await send(message)
+                        return
+                    compressed = compress_bytes(body, encoding)
+                    start["headers"] = _rewrite_headers(start["headers"], encoding, len(compressed))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                compressor = StreamCompressor(encoding)
+                start["headers"] = _rewrite_headers(start["headers"], encoding, None)
+                await send(start)
+
+            data = compressor.compress(body) if body else b""
+            if not more_body:
+                data += compressor.finish()
+            elif body and (not delimiter or body.endswith(delimiter)):
+                # 到达事件边界（非SSE/NDJSON时每段都是边界），把已压缩的数据全部送出
+                data += compressor.flush()
+            if data or not more_body:
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
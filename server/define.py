@@ -1,5 +1,5 @@
-from typing import Dict, List, Optional
-from pydantic import BaseModel, Field
+from typing import Dict, List, Optional, Tuple
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr, model_validator
 from enum import Enum
 
 
@@ -118,6 +118,11 @@ class BasicUserInput(BaseModel):
         )
 
 
+class ChatInput(BaseModel):
+    """多轮追问中用户提出的问题"""
+    message: str = Field(..., min_length=1, max_length=2000, description="问题内容，最多2000字")
+
+
 class LunarBirthInfo(BaseModel):
     """农历生日信息数据结构"""
     year         : int  = Field(..., ge=1900, le=2100, description="农历年份，范围1900-2100")
@@ -146,18 +151,27 @@ class LunarBirthInfo(BaseModel):
 
 
 class PillarInfo(BaseModel):
-    """单柱信息（天干地支）"""
+    """单柱信息（天干地支）
+
+    构建后不可修改：排盘结果中同一干支的柱共享同一个实例（见 server/fate_owner.py 的 PILLARS），
+    藏干因此用元组保存，不能就地修改
+    """
+    model_config = ConfigDict(frozen=True)
+    
     heavenly_stem : HeavenlyStem                 = Field(..., description="天干")
     earthly_branch: EarthlyBranch                = Field(..., description="地支")
-    hidden_stem   : Optional[List[HeavenlyStem]] = Field(None, description="地支藏干")
+    hidden_stem   : Optional[Tuple[HeavenlyStem, ...]] = Field(None, description="地支藏干")
     
-    def __init__(self, **data):
-        super().__init__(**data)
+    @model_validator(mode="before")
+    @classmethod
+    def _fill_hidden_stem(cls, data):
         # 如果没有提供hidden_stem，根据地支查找藏干
-        if not self.hidden_stem and self.earthly_branch:
-            branch_str = self.earthly_branch.value
+        if isinstance(data, dict) and not data.get("hidden_stem") and data.get("earthly_branch"):
+            branch = data["earthly_branch"]
+            branch_str = branch.value if isinstance(branch, EarthlyBranch) else branch
             if branch_str in BRANCH_HIDDEN_STEM:
-                self.hidden_stem = [HeavenlyStem(stem) for stem in BRANCH_HIDDEN_STEM[branch_str]]
+                data = {**data, "hidden_stem": tuple(HeavenlyStem(stem) for stem in BRANCH_HIDDEN_STEM[branch_str])}
+        return data
 
     def __str__(self) -> str:
         """返回天干地支的汉字组合"""
@@ -165,10 +179,12 @@ class PillarInfo(BaseModel):
 
 
 class TenGodInfo(BaseModel):
-    """十神信息"""
-    heavenly_stem : TenGodType       = Field(..., description="天干十神")
-    earthly_branch: TenGodType       = Field(..., description="地支十神")
-    hidden_stems  : List[TenGodType] = Field(default_factory=list, description="藏干十神")
+    """十神信息，构建后不可修改，可在命盘之间共享；藏干十神用元组保存"""
+    model_config = ConfigDict(frozen=True)
+    
+    heavenly_stem : TenGodType             = Field(..., description="天干十神")
+    earthly_branch: TenGodType             = Field(..., description="地支十神")
+    hidden_stems  : Tuple[TenGodType, ...] = Field(default_factory=tuple, description="藏干十神")
 
 
 class StartAge(BaseModel):
@@ -218,6 +234,54 @@ class BaziInfo(BaseModel):
     """大运"""
     destiny_cycle: Optional[DestinyCycleInfo] = Field(None, description="大运信息")
     
+    # 命盘编码的缓存，修改字段时清除
+    _chart_code: Optional[int] = PrivateAttr(None)
+    
+    def __setattr__(self, name: str, value) -> None:
+        super().__setattr__(name, value)
+        if name in type(self).model_fields:
+            # 字段有变化，缓存的编码失效；就地修改柱内的字段不会被察觉，需重新赋值整柱
+            self._chart_code = None
+    
+    @property
+    def chart_code(self) -> int:
+        """32位命盘编码（见 server/chart_code.py），无法编码时抛出ValueError"""
+        if self._chart_code is None:
+            from server.chart_code import encode_chart
+            self._chart_code = encode_chart(self)
+        return self._chart_code
+    
+    @classmethod
+    def from_chart_code(cls, code: int) -> "BaziInfo":
+        """由命盘编码还原八字信息"""
+        from server.chart_code import decode_chart
+        bazi_info = decode_chart(code)
+        bazi_info._chart_code = code
+        return bazi_info
+    
+    def __eq__(self, other) -> bool:
+        """可编码的命盘直接比较编码，否则逐字段比较"""
+        if isinstance(other, BaziInfo):
+            try:
+                return self.chart_code == other.chart_code
+            except ValueError:
+                pass
+        return super().__eq__(other)
+    
+    def __hash__(self) -> int:
+        """与__eq__一致：可编码的命盘按编码，否则按全部字段"""
+        try:
+            return hash(self.chart_code)
+        except ValueError:
+            return hash(self.model_dump_json())
+    
+    def model_copy(self, *, update=None, deep: bool = False) -> "BaziInfo":
+        copied = super().model_copy(update=update, deep=deep)
+        if update:
+            # 字段有变化，缓存的编码失效
+            copied._chart_code = None
+        return copied
+    
     def get_bazi_string(self) -> str:
         """返回八字字符串，如'甲子 乙丑 丙寅 丁卯'"""
         return f"{self.year_pillar} {self.month_pillar} {self.day_pillar} {self.hour_pillar}"
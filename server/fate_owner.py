@@ -1,8 +1,79 @@
-from typing import Dict, List, Optional
-from server.bazi_calculator import BaziPaipanEngine
+from typing import Dict, List, Optional, Tuple
+from server.bazi_calculator import BaziCalculator
+from server.terminology import YEAR, MONTH, DAY, HOUR, STEM, BRANCH, HIDDEN_STEM, FIVE_ELEMENTS, TEN_GODS, DECADE_PILLAR
 from server.define import Gender, SolarBirthInfo, LunarBirthInfo, BaziInfo, PillarInfo, HeavenlyStem, EarthlyBranch, TenGodInfo, TenGodType, DestinyCycleInfo, StartAge
 
 
+# 享元：十个天干、六十个干支柱和十神组合都是有限集合，预先构建不可修改的实例，各命盘共享，
+# 排盘结果转换为模型时只做查表，不再逐字段校验
+STEM_BY_NAME: Dict[str, HeavenlyStem] = {stem.value: stem for stem in HeavenlyStem}
+BRANCH_BY_NAME: Dict[str, EarthlyBranch] = {branch.value: branch for branch in EarthlyBranch}
+TEN_GOD_BY_NAME: Dict[str, TenGodType] = {god.value: god for god in TenGodType}
+
+# (天干, 地支) -> PillarInfo，藏干与排盘引擎一致
+PILLARS: Dict[Tuple[str, str], PillarInfo] = {
+    (stem, branch): PillarInfo.model_construct(
+        heavenly_stem=STEM_BY_NAME[stem],
+        earthly_branch=BRANCH_BY_NAME[branch],
+        hidden_stem=tuple(STEM_BY_NAME[hidden] for hidden in BaziCalculator.BRANCH_HIDDEN_STEM[branch])
+    )
+    for stem, branch in BaziCalculator.SEXAGENARY_CYCLE
+}
+
+# (天干十神, 地支十神, 藏干十神) -> TenGodInfo，按需构建，最多几百种
+_TEN_GODS: Dict[Tuple[str, str, Tuple[str, ...]], TenGodInfo] = {}
+
+
+def _ten_god_info(stem_god: str, branch_god: str, hidden_gods: List[str]) -> TenGodInfo:
+    key = (stem_god, branch_god, tuple(hidden_gods))
+    info = _TEN_GODS.get(key)
+    if info is None:
+        info = _TEN_GODS[key] = TenGodInfo.model_construct(
+            heavenly_stem=TEN_GOD_BY_NAME[stem_god],
+            earthly_branch=TEN_GOD_BY_NAME[branch_god],
+            hidden_stems=tuple(TEN_GOD_BY_NAME[god] for god in hidden_gods)
+        )
+    return info
+
+
+def build_bazi_info(bazi_dict: Dict) -> BaziInfo:
+    """由排盘引擎输出的八字信息字典构建BaziInfo
+
+    引擎的输出是可信数据，用model_construct跳过校验，四柱、大运和十神取共享的享元实例
+    """
+    # 四柱
+    year_pillar, month_pillar, day_pillar, hour_pillar = (
+        PILLARS[bazi_dict[pillar][STEM], bazi_dict[pillar][BRANCH]] for pillar in (YEAR, MONTH, DAY, HOUR)
+    )
+    
+    # 十神
+    ten_gods = {
+        pillar_name: _ten_god_info(gods[TEN_GODS], gods[BRANCH], gods[HIDDEN_STEM])
+        for pillar_name, gods in bazi_dict.get(TEN_GODS, {}).items()
+    }
+    
+    # 大运
+    destiny_cycle = None
+    destiny_dict = bazi_dict.get(DECADE_PILLAR)
+    if destiny_dict:
+        destiny_cycle = DestinyCycleInfo.model_construct(
+            cycles=[PILLARS[cycle[STEM], cycle[BRANCH]] for cycle in destiny_dict["cycles"]],
+            start_age=StartAge.model_construct(**destiny_dict["start_age"]),
+            is_forward=destiny_dict["is_forward"]
+        )
+    
+    # 创建八字信息
+    return BaziInfo.model_construct(
+        year_pillar=year_pillar,
+        month_pillar=month_pillar,
+        day_pillar=day_pillar,
+        hour_pillar=hour_pillar,
+        five_elements=list(bazi_dict[FIVE_ELEMENTS]),
+        ten_gods=ten_gods,
+        destiny_cycle=destiny_cycle
+    )
+
+
 class FateOwner():
     """命主类，包含生日信息和八字信息"""
     name: Optional[str] = None
@@ -10,7 +81,7 @@ class FateOwner():
     solar_birth_info: Optional[SolarBirthInfo] = None
     lunar_birth_info: Optional[LunarBirthInfo] = None
     bazi_info: Optional[BaziInfo] = None
-    engine: BaziPaipanEngine = BaziPaipanEngine()
+    engine: BaziCalculator = BaziCalculator()
     
     def __init__(self, gender: Gender = None, solar_birth_info: SolarBirthInfo = None, lunar_birth_info: LunarBirthInfo = None, name: str = None):
         self.gender = gender
@@ -68,7 +139,7 @@ class FateOwner():
             minute=self.lunar_birth_info.minute
         )
     
-    def calculate_bazi(self, engine: BaziPaipanEngine = None) -> BaziInfo:
+    def calculate_bazi(self, engine: BaziCalculator = None) -> BaziInfo:
         """计算八字信息"""
         # 使用传入的引擎或默认引擎
         paipan_engine = engine if engine else self.engine
@@ -81,84 +152,17 @@ class FateOwner():
                 raise ValueError("需要阳历或农历生日信息才能计算八字")
         
         # 使用排盘引擎计算八字
-        bazi_dict = paipan_engine.calculate_bazi(
+        bazi_dict = paipan_engine.calculate_bazi_from_lunar(
             lunar_year    = self.lunar_birth_info.year,
             lunar_month   = self.lunar_birth_info.month,
             lunar_day     = self.lunar_birth_info.day,
             hour          = self.lunar_birth_info.hour,
+            minute        = self.lunar_birth_info.minute,
             is_leap_month = self.lunar_birth_info.is_leap_month,
             gender        = str(self.gender)
         )
         
-        # 构建PillarInfo对象
-        year_pillar = PillarInfo(
-            heavenly_stem=HeavenlyStem(bazi_dict["year"]["heavenly_stem"]),
-            earthly_branch=EarthlyBranch(bazi_dict["year"]["earthly_branch"]),
-            hidden_stem=[HeavenlyStem(stem) for stem in bazi_dict["year"]["hidden_stems"]]
-        )
-        month_pillar = PillarInfo(
-            heavenly_stem=HeavenlyStem(bazi_dict["month"]["heavenly_stem"]),
-            earthly_branch=EarthlyBranch(bazi_dict["month"]["earthly_branch"]),
-            hidden_stem=[HeavenlyStem(stem) for stem in bazi_dict["month"]["hidden_stems"]]
-        )
-        day_pillar = PillarInfo(
-            heavenly_stem=HeavenlyStem(bazi_dict["day"]["heavenly_stem"]),
-            earthly_branch=EarthlyBranch(bazi_dict["day"]["earthly_branch"]),
-            hidden_stem=[HeavenlyStem(stem) for stem in bazi_dict["day"]["hidden_stems"]]
-        )
-        hour_pillar = PillarInfo(
-            heavenly_stem=HeavenlyStem(bazi_dict["hour"]["heavenly_stem"]),
-            earthly_branch=EarthlyBranch(bazi_dict["hour"]["earthly_branch"]),
-            hidden_stem=[HeavenlyStem(stem) for stem in bazi_dict["hour"]["hidden_stems"]]
-        )
-        
-        # 构建十神信息
-        ten_gods = {}
-        if "ten_gods" in bazi_dict:
-            for pillar_name, gods in bazi_dict["ten_gods"].items():
-                ten_gods[pillar_name] = TenGodInfo(
-                    heavenly_stem=TenGodType(gods["heavenly_stem"]),
-                    earthly_branch=TenGodType(gods["earthly_branch"]),
-                    hidden_stems=[TenGodType(god) for god in gods["hidden_stems"]]
-                )
-        
-        # 计算大运信息
-        destiny_cycle = None
-        lunar_date = {
-            "year": self.lunar_birth_info.year,
-            "month": self.lunar_birth_info.month,
-            "day": self.lunar_birth_info.day,
-            "hour": self.lunar_birth_info.hour,
-            "is_leap_month": self.lunar_birth_info.is_leap_month
-        }
-        destiny_dict = self.engine.calculate_destiny_cycles(lunar_date, str(self.gender))
-        
-        if destiny_dict:
-            destiny_cycles = [
-                PillarInfo(
-                    heavenly_stem=HeavenlyStem(cycle["heavenly_stem"]),
-                    earthly_branch=EarthlyBranch(cycle["earthly_branch"]),
-                    hidden_stem=[HeavenlyStem(stem) for stem in cycle["hidden_stems"]]
-                )
-                for cycle in destiny_dict["cycles"]
-            ]
-            
-            destiny_cycle = DestinyCycleInfo(
-                cycles=destiny_cycles,
-                start_age=StartAge(**destiny_dict["start_age"]),
-                is_forward=destiny_dict["is_forward"]
-            )
-        
-        # 创建八字信息
-        self.bazi_info = BaziInfo(
-            year_pillar=year_pillar,
-            month_pillar=month_pillar,
-            day_pillar=day_pillar,
-            hour_pillar=hour_pillar,
-            five_elements=bazi_dict["five_elements"],
-            ten_gods=ten_gods,
-            destiny_cycle=destiny_cycle
-        )
+        self.bazi_info = build_bazi_info(bazi_dict)
         
         return self.bazi_info
     
@@ -0,0 +1,61 @@
+"""
+HTTP缓存语义
+
+排盘结果只取决于出生信息和排盘引擎，同样的输入永远得到同样的响应，适合让浏览器和CDN缓存：
+- ETag：由规范化后的出生信息和引擎版本（ENGINE_VERSION）算出，排盘之前就能确定，
+  条件请求（If-None-Match）命中时直接返回304，不排盘
+- Cache-Control：排盘结果长期缓存（immutable），引擎版本变化时ETag随之变化
+- 静态文件的缓存与预压缩见 server/static_files.py
+
+配置项（环境变量）：
+- CHART_MAX_AGE: 排盘结果的缓存时间（秒），默认一年
+"""
+
+import hashlib
+import os
+from typing import Dict, Optional, Set
+
+from fastapi.responses import Response
+
+CHART_MAX_AGE = int(os.environ.get("CHART_MAX_AGE", 365 * 86400))
+
+CHART_CACHE_CONTROL = f"public, max-age={CHART_MAX_AGE}, immutable"
+
+
+def make_etag(*parts: str) -> str:
+    """由若干字符串算出强ETag（带引号）"""
+    digest = hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否包含该ETag；按弱比较，忽略 W/ 前缀"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def not_modified(headers: Dict[str, str]) -> Response:
+    """304响应，只带缓存相关的头"""
+    return Response(status_code=304, headers=headers)
+
+
+def accepted_encodings(accept_encoding: Optional[str]) -> Set[str]:
+    """Accept-Encoding 中客户端接受的编码（q=0的除外）"""
+    encodings = set()
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        encodings.add(name)
+    return encodings
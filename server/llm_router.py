@@ -0,0 +1,351 @@
+"""
+多后端LLM路由
+
+在配置的多个模型后端（如多台Ollama主机和阿里云）之间路由请求：
+- 按后端记录首token时间（TTFT）的EWMA和错误率EWMA，每次请求发往当前最快的健康后端
+- 后端在输出首个token前失败时，自动切换到下一个后端（failover）
+- 可选对冲请求：首个token超过该后端TTFT的p95仍未到达时，向下一个后端发出第二个请求，
+  先输出首token的一方胜出，另一方被取消
+- 连续失败的后端暂时熔断，冷却后再参与路由
+- 每个后端同时处理的请求数有上限（含对冲请求），请求只发往还有空闲槽位的后端，全部占满时等待槽位释放
+
+后端列表通过环境变量 LLM_BACKENDS 配置，格式为JSON数组，例如：
+    [{"name": "ollama-a", "source": "local", "base_url": "http://192.168.11.8:11434"},
+     {"name": "ollama-b", "source": "local", "base_url": "http://192.168.11.9:11434"},
+     {"name": "aliyun", "source": "aliyun"}]
+max_concurrency为该后端的并发上限（整个服务合计，按worker数平分），默认为 LLM_MAX_CONCURRENCY；除name、source、max_concurrency外的字段原样传给 get_chat_model。
+路由模式下调度器的 "router" 队列只控制总并发（各后端上限之和），每台主机的并发由路由器控制。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+from server.llm_scheduler import LLM_MAX_CONCURRENCY, per_worker
+from server.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# 路由默认配置，可通过环境变量覆盖
+LLM_HEDGE             = os.environ.get("LLM_HEDGE", "0") == "1"              # 是否启用对冲请求
+LLM_HEDGE_MIN_DELAY   = float(os.environ.get("LLM_HEDGE_MIN_DELAY", 0.5))    # 对冲请求的最短等待时间（秒）
+LLM_HEDGE_DEFAULT_DELAY = float(os.environ.get("LLM_HEDGE_DEFAULT_DELAY", 5)) # 样本不足时的对冲等待时间（秒）
+
+EWMA_ALPHA          = 0.2   # EWMA平滑系数
+P95_MIN_SAMPLES     = 20    # 计算p95所需的最少样本数
+TTFT_WINDOW         = 200   # 计算p95保留的最近样本数
+FAILURE_THRESHOLD   = 3     # 连续失败多少次后熔断
+COOLDOWN_SECONDS    = 30.0  # 熔断冷却时间（秒）
+ERROR_RATE_PENALTY  = 4.0   # 错误率对排序得分的惩罚系数
+
+BACKEND_TTFT = registry.histogram("llm_backend_ttft_seconds", "各模型后端的首token时间", ["backend"])
+BACKEND_ERRORS = registry.counter("llm_backend_errors_total", "各模型后端在输出首token前的失败次数", ["backend"])
+HEDGED_REQUESTS = registry.counter("llm_hedged_requests_total", "发出的对冲请求数")
+FAILOVERS = registry.counter("llm_failovers_total", "切换到其他后端的次数")
+
+# 上游流结束的哨兵对象
+_END_OF_STREAM = object()
+
+
+class BackendStats:
+    """单个后端的延迟与健康统计"""
+
+    def __init__(self):
+        self.ewma_ttft: Optional[float] = None
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.in_flight = 0
+        self.samples: Deque[float] = deque(maxlen=TTFT_WINDOW)
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.open_until
+
+    def record_ttft(self, seconds: float) -> None:
+        self.ewma_ttft = seconds if self.ewma_ttft is None else (1 - EWMA_ALPHA) * self.ewma_ttft + EWMA_ALPHA * seconds
+        self.samples.append(seconds)
+
+    def record_success(self) -> None:
+        self.error_rate = (1 - EWMA_ALPHA) * self.error_rate
+        self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        self.error_rate = (1 - EWMA_ALPHA) * self.error_rate + EWMA_ALPHA
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= FAILURE_THRESHOLD:
+            self.open_until = time.monotonic() + COOLDOWN_SECONDS
+
+    def p95_ttft(self) -> Optional[float]:
+        if len(self.samples) < P95_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def score(self) -> float:
+        """排序得分，越小越优先；尚无样本的后端得分为0，以便尽快被探测"""
+        return (self.ewma_ttft or 0.0) * (1 + ERROR_RATE_PENALTY * self.error_rate)
+
+
+class Backend:
+    """一个模型后端"""
+
+    def __init__(self, name: str, model: Any, max_concurrency: int = LLM_MAX_CONCURRENCY):
+        self.name = name
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.stats = BackendStats()
+        # 等待空闲槽位的请求，槽位释放时全部唤醒后重新选择后端
+        self.waiters: List[asyncio.Future] = []
+
+    @property
+    def available(self) -> bool:
+        return self.stats.in_flight < self.max_concurrency
+
+    def acquire(self) -> None:
+        self.stats.in_flight += 1
+
+    def release(self) -> None:
+        self.stats.in_flight -= 1
+        waiters, self.waiters = self.waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def to_dict(self) -> Dict:
+        p95 = self.stats.p95_ttft()
+        return {
+            "name": self.name,
+            "healthy": self.stats.healthy,
+            "ewma_ttft": None if self.stats.ewma_ttft is None else round(self.stats.ewma_ttft, 3),
+            "p95_ttft": None if p95 is None else round(p95, 3),
+            "error_rate": round(self.stats.error_rate, 3),
+            "in_flight": self.stats.in_flight,
+            "max_concurrency": self.max_concurrency
+        }
+
+
+class _Attempt:
+    """向某个后端发出的一次流式请求"""
+
+    def __init__(self, backend: Backend, messages: List[Any]):
+        self.backend = backend
+        self.started_at = time.perf_counter()
+        self.stream: AsyncIterator = backend.model.astream(messages).__aiter__()
+        self.first = asyncio.create_task(self._next())
+        backend.acquire()
+
+    async def _next(self):
+        try:
+            return await self.stream.__anext__()
+        except StopAsyncIteration:
+            return _END_OF_STREAM
+
+    async def close(self) -> None:
+        """取消请求并关闭上游流"""
+        self.first.cancel()
+        await asyncio.gather(self.first, return_exceptions=True)
+        aclose = getattr(self.stream, "aclose", None)
+        if aclose is not None:
+            try:
+                await aclose()
+            except Exception:
+                pass
+
+    def release(self) -> None:
+        self.backend.release()
+
+
+class LLMRouter:
+    """按延迟和健康状况在多个后端之间路由的聊天模型，提供与LangChain聊天模型相同的astream/ainvoke接口"""
+
+    def __init__(
+        self,
+        backends: List[Backend],
+        hedge: bool = LLM_HEDGE,
+        hedge_min_delay: float = LLM_HEDGE_MIN_DELAY,
+        hedge_default_delay: float = LLM_HEDGE_DEFAULT_DELAY
+    ):
+        if not backends:
+            raise ValueError("至少需要配置一个模型后端")
+        self.backends = backends
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_default_delay = hedge_default_delay
+
+    @property
+    def max_concurrency(self) -> int:
+        """所有后端的并发上限之和，作为调度器中路由队列的总并发"""
+        return sum(backend.max_concurrency for backend in self.backends)
+
+    def rank(self) -> List[Backend]:
+        """按得分排序的候选后端：健康的在前；全部熔断时仍按得分尝试"""
+        ordered = sorted(self.backends, key=lambda b: (b.stats.score(), b.stats.in_flight))
+        healthy = [b for b in ordered if b.stats.healthy]
+        return healthy or ordered
+
+    def pick(self, name: Optional[str] = None) -> Backend:
+        """为需要固定后端的调用（如多轮对话）选择后端：指定的后端仍健康时继续使用，否则选当前最优的后端"""
+        for backend in self.backends:
+            if backend.name == name and backend.stats.healthy:
+                return backend
+        return self.rank()[0]
+
+    def pinned(self, backend: Backend) -> "LLMRouter":
+        """只使用指定后端的路由器，与本路由器共享该后端的统计和并发槽位"""
+        return LLMRouter([backend], hedge=False)
+
+    def hedge_delay(self, backend: Backend) -> float:
+        """主请求等待首token多久后发出对冲请求"""
+        p95 = backend.stats.p95_ttft()
+        return max(self.hedge_min_delay, p95 if p95 is not None else self.hedge_default_delay)
+
+    async def astream(self, messages: List[Any]) -> AsyncIterator[Any]:
+        """流式生成：先选出最先输出首token的后端，再持续输出该后端的内容"""
+        candidates = self.rank()
+        attempts: List[_Attempt] = []
+        hedged = False
+        last_error: Optional[BaseException] = None
+        winner: Optional[_Attempt] = None
+        first_chunk = None
+
+        def launch() -> bool:
+            """向排在最前且有空闲槽位的候选后端发出请求，都已占满时返回False"""
+            for backend in candidates:
+                if backend.available:
+                    candidates.remove(backend)
+                    attempts.append(_Attempt(backend, messages))
+                    return True
+            return False
+
+        try:
+            while winner is None:
+                if not attempts:
+                    if not candidates:
+                        raise last_error or RuntimeError("没有可用的模型后端")
+                    if not launch():
+                        await self._wait_for_slot(candidates)
+                        continue
+                    if last_error is not None:
+                        FAILOVERS.inc()
+                    continue
+
+                timeout = None
+                if self.hedge and not hedged and len(attempts) == 1 and any(b.available for b in candidates):
+                    elapsed = time.perf_counter() - attempts[0].started_at
+                    timeout = max(0.0, self.hedge_delay(attempts[0].backend) - elapsed)
+
+                done, _ = await asyncio.wait([a.first for a in attempts], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # 首token超过p95仍未到达，向下一个有空闲槽位的后端发出对冲请求
+                    hedged = True
+                    if launch():
+                        HEDGED_REQUESTS.inc()
+                        logger.info("后端 %s 首token超时，向 %s 发出对冲请求", attempts[0].backend.name, attempts[-1].backend.name)
+                    continue
+
+                for attempt in [a for a in attempts if a.first in done]:
+                    error = attempt.first.exception()
+                    if error is None:
+                        winner, first_chunk = attempt, attempt.first.result()
+                        break
+                    # 首token前失败，记录错误后由其他后端接替
+                    attempts.remove(attempt)
+                    attempt.release()
+                    attempt.backend.stats.record_failure()
+                    BACKEND_ERRORS.labels(attempt.backend.name).inc()
+                    logger.warning("模型后端 %s 请求失败：%s", attempt.backend.name, error)
+                    last_error = error
+        finally:
+            # 取消对冲中落败或未完成的请求
+            for attempt in attempts:
+                if attempt is not winner:
+                    attempt.release()
+                    await attempt.close()
+
+        backend = winner.backend
+        ttft = time.perf_counter() - winner.started_at
+        backend.stats.record_ttft(ttft)
+        BACKEND_TTFT.labels(backend.name).observe(ttft)
+
+        try:
+            if first_chunk is not _END_OF_STREAM:
+                yield first_chunk
+                async for chunk in winner.stream:
+                    yield chunk
+            backend.stats.record_success()
+        except Exception:
+            # 已输出部分内容，无法无缝切换后端，只记录错误
+            backend.stats.record_failure()
+            BACKEND_ERRORS.labels(backend.name).inc()
+            raise
+        finally:
+            winner.release()
+            aclose = getattr(winner.stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    @staticmethod
+    async def _wait_for_slot(backends: List[Backend]) -> None:
+        """等待任一后端释放槽位"""
+        waiter = asyncio.get_running_loop().create_future()
+        for backend in backends:
+            backend.waiters.append(waiter)
+        try:
+            await waiter
+        finally:
+            for backend in backends:
+                if waiter in backend.waiters:
+                    backend.waiters.remove(waiter)
+
+    async def ainvoke(self, messages: List[Any]) -> Any:
+        """非流式调用：汇总流式输出的内容块"""
+        result = None
+        async for chunk in self.astream(messages):
+            result = chunk if result is None else result + chunk
+        return result
+
+    def stats(self) -> List[Dict]:
+        return [backend.to_dict() for backend in self.backends]
+
+
+def load_backend_configs() -> List[Dict]:
+    """读取LLM_BACKENDS配置；未配置时退化为MODEL_SOURCE指定的单个后端"""
+    raw = os.environ.get("LLM_BACKENDS")
+    if not raw:
+        source = os.environ.get("MODEL_SOURCE", "local")
+        return [{"name": source, "source": "local" if source == "router" else source}]
+    configs = json.loads(raw)
+    if not isinstance(configs, list) or not configs:
+        raise ValueError("LLM_BACKENDS 必须是非空的JSON数组")
+    return configs
+
+
+def build_router(configs: List[Dict]) -> LLMRouter:
+    """根据后端配置创建路由器"""
+    from server.model import get_chat_model
+
+    backends = []
+    for i, config in enumerate(configs):
+        options = dict(config)
+        source = options.pop("source")
+        name = options.pop("name", f"{source}-{i}")
+        max_concurrency = per_worker(int(options["max_concurrency"])) if "max_concurrency" in options else LLM_MAX_CONCURRENCY
+        options.pop("max_concurrency", None)
+        backends.append(Backend(name, get_chat_model(source, **options), max_concurrency))
+    return LLMRouter(backends)
+
+
+_router: Optional[LLMRouter] = None
+
+
+def get_llm_router() -> LLMRouter:
+    """全局路由器，首次使用时根据配置创建，以便在请求之间保留各后端的统计"""
+    global _router
+    if _router is None:
+        _router = build_router(load_backend_configs())
+    return _router
@@ -0,0 +1,332 @@
+"""
+LLM任务调度
+
+在模型后端前面加一层有界的异步任务队列：
+- 每个后端同时运行的生成任务数有上限，其余任务按优先级排队（同优先级先到先得）
+- 一个任务可以占用多个槽位（如分节并行生成的报告同时发出多个生成请求），队首任务槽位不足时后面的任务也继续等待
+- 排队任务数达到上限时拒绝新任务，由接口返回429及Retry-After
+- 每个任务有唯一ID，可查询排队位置和状态
+- 队列深度、运行中任务数、排队等待时间和拒绝次数以指标形式导出
+
+调度器在每个worker进程内各有一个，配置的并发和排队上限按worker数平分，见 WEB_CONCURRENCY
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import os
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from enum import Enum, IntEnum
+from typing import AsyncIterator, Dict, List, Optional
+
+from server.memory import approx_size, register_cache
+from server.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# 同一服务的worker进程数，由 run_server.py 按 --workers 设置（uvicorn也读取该变量作为默认worker数）
+WEB_CONCURRENCY = max(1, int(os.environ.get("WEB_CONCURRENCY", 1)))
+
+
+def per_worker(limit: int) -> int:
+    """把整个服务的上限平分到每个worker进程，每个worker至少为1"""
+    return max(1, limit // WEB_CONCURRENCY)
+
+
+# 调度默认配置，可通过环境变量覆盖；两项上限都是整个服务（全部worker合计）的上限，每个worker进程各有一个调度器，
+# 按 WEB_CONCURRENCY 平分。上限小于worker数时每个worker仍有1个，合计会超过配置值
+LLM_MAX_CONCURRENCY = per_worker(int(os.environ.get("LLM_MAX_CONCURRENCY", 2)))  # 每个后端同时运行的生成任务数
+LLM_MAX_QUEUE       = per_worker(int(os.environ.get("LLM_MAX_QUEUE", 32)))       # 每个后端最多排队的任务数
+LLM_JOB_HISTORY     = int(os.environ.get("LLM_JOB_HISTORY", 1000))   # 保留的任务记录数（含已结束任务）
+
+# 尚无历史数据时估算Retry-After使用的单任务耗时（秒）
+DEFAULT_JOB_SECONDS = 60.0
+
+QUEUE_DEPTH = registry.gauge("llm_queue_depth", "排队中的LLM任务数", ["backend"])
+IN_FLIGHT = registry.gauge("llm_in_flight", "运行中的LLM任务数", ["backend"])
+QUEUE_WAIT = registry.histogram("llm_queue_wait_seconds", "LLM任务排队等待时间", ["backend"])
+JOB_DURATION = registry.histogram("llm_job_duration_seconds", "LLM任务运行时间", ["backend"])
+REJECTED = registry.counter("llm_jobs_rejected_total", "因队列已满被拒绝的LLM任务数", ["backend"])
+
+
+class Priority(IntEnum):
+    """任务优先级，数值越小越先执行"""
+    HIGH   = 0  # 付费用户
+    NORMAL = 1
+
+
+class JobStatus(str, Enum):
+    """任务状态"""
+    QUEUED    = "queued"
+    RUNNING   = "running"
+    DONE      = "done"
+    FAILED    = "failed"
+    CANCELLED = "cancelled"
+
+    def __str__(self) -> str:
+        return self.value
+
+
+class QueueFullError(Exception):
+    """队列已满，retry_after为建议的重试等待秒数"""
+
+    def __init__(self, backend: str, retry_after: int):
+        super().__init__(f"模型后端 {backend} 的任务队列已满")
+        self.backend = backend
+        self.retry_after = retry_after
+
+
+class LLMJob:
+    """一次LLM生成任务"""
+
+    def __init__(self, backend: str, priority: Priority, slots: int = 1):
+        self.job_id = uuid.uuid4().hex
+        self.backend = backend
+        self.priority = priority
+        self.slots = slots
+        self.status = JobStatus.QUEUED
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._ready: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    @property
+    def wait_seconds(self) -> float:
+        end = self.started_at if self.started_at is not None else time.monotonic()
+        return end - self.enqueued_at
+
+
+class _BackendQueue:
+    """单个后端的运行槽位和优先级队列"""
+
+    def __init__(self, backend: str, max_concurrency: int):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.running = 0
+        self.heap: List = []
+        self.queued = 0
+        self.avg_job_seconds = DEFAULT_JOB_SECONDS
+        self._seq = itertools.count()
+        self.depth_gauge = QUEUE_DEPTH.labels(backend)
+        self.in_flight_gauge = IN_FLIGHT.labels(backend)
+
+    def push(self, job: LLMJob) -> None:
+        heapq.heappush(self.heap, (job.priority, next(self._seq), job))
+        self.queued += 1
+        self.depth_gauge.set(self.queued)
+
+    def pop(self) -> Optional[LLMJob]:
+        """取出队首任务，空闲槽位不够队首任务使用时返回None"""
+        while self.heap:
+            job = self.heap[0][2]
+            # 已取消的任务惰性出队
+            if job.status is not JobStatus.QUEUED:
+                heapq.heappop(self.heap)
+                continue
+            if self.running + job.slots > self.max_concurrency:
+                return None
+            heapq.heappop(self.heap)
+            self.queued -= 1
+            self.depth_gauge.set(self.queued)
+            return job
+        return None
+
+    def discard(self, job: LLMJob) -> None:
+        """排队中的任务被取消，堆中的条目在出队时跳过"""
+        self.queued -= 1
+        self.depth_gauge.set(self.queued)
+
+    def position(self, job: LLMJob) -> int:
+        """任务前面还有多少个排队任务"""
+        own = next(((p, s) for p, s, other in self.heap if other is job), None)
+        if own is None:
+            return 0
+        return sum(
+            1 for p, s, other in self.heap
+            if other.status is JobStatus.QUEUED and (p, s) < own
+        )
+
+
+class LLMScheduler:
+    """LLM任务调度器"""
+
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_queue: int = LLM_MAX_QUEUE,
+        history: int = LLM_JOB_HISTORY
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.history = history
+        self._backends: Dict[str, _BackendQueue] = {}
+        self._jobs: "OrderedDict[str, LLMJob]" = OrderedDict()
+
+    def _backend(self, backend: str) -> _BackendQueue:
+        queue = self._backends.get(backend)
+        if queue is None:
+            queue = self._backends[backend] = _BackendQueue(backend, self.max_concurrency)
+        return queue
+
+    def submit(self, backend: str, priority: Priority = Priority.NORMAL, slots: int = 1) -> LLMJob:
+        """提交任务：有足够的空闲槽位时立即开始，否则排队
+
+        slots为任务占用的槽位数，超过并发上限时按上限计
+
+        Raises:
+            QueueFullError: 排队任务数已达上限
+        """
+        queue = self._backend(backend)
+        job = LLMJob(backend, priority, max(1, min(slots, queue.max_concurrency)))
+
+        if queue.running + job.slots <= queue.max_concurrency and queue.queued == 0:
+            self._start(queue, job)
+        elif queue.queued >= self.max_queue:
+            REJECTED.labels(backend).inc()
+            raise QueueFullError(backend, self._retry_after(queue))
+        else:
+            queue.push(job)
+
+        self._remember(job)
+        return job
+
+    def set_max_concurrency(self, backend: str, max_concurrency: int) -> None:
+        """调整某个后端的并发上限（如路由模式下为各主机上限之和），上限提高时立即启动排队任务"""
+        queue = self._backend(backend)
+        if queue.max_concurrency != max_concurrency:
+            queue.max_concurrency = max_concurrency
+            self._drain(queue)
+
+    def get(self, job_id: str) -> Optional[LLMJob]:
+        return self._jobs.get(job_id)
+
+    def position(self, job: LLMJob) -> int:
+        """排队位置，0表示下一个执行；非排队状态返回0"""
+        if job.status is not JobStatus.QUEUED:
+            return 0
+        return self._backend(job.backend).position(job)
+
+    def estimated_wait(self, job: LLMJob) -> float:
+        """估算任务还需排队多久（秒）"""
+        if job.status is not JobStatus.QUEUED:
+            return 0.0
+        queue = self._backend(job.backend)
+        return (self.position(job) + 1) * queue.avg_job_seconds / max(1, queue.max_concurrency)
+
+    def describe(self, job: LLMJob) -> Dict:
+        """任务状态信息，用于任务查询接口"""
+        return {
+            "job_id": job.job_id,
+            "status": job.status.value,
+            "backend": job.backend,
+            "priority": job.priority.name.lower(),
+            "position": self.position(job),
+            "wait_seconds": round(job.wait_seconds, 3),
+            "estimated_wait_seconds": round(self.estimated_wait(job), 1)
+        }
+
+    async def wait(self, job: LLMJob) -> None:
+        """等待任务获得运行槽位；等待期间被取消则移出队列"""
+        try:
+            await asyncio.shield(job._ready)
+        except asyncio.CancelledError:
+            self.finish(job, JobStatus.CANCELLED)
+            raise
+
+    def finish(self, job: LLMJob, status: JobStatus = JobStatus.DONE) -> None:
+        """结束任务并把槽位交给下一个排队任务"""
+        if job.status in (JobStatus.DONE, JobStatus.FAILED, JobStatus.CANCELLED):
+            return
+        queue = self._backend(job.backend)
+        was_running = job.status is JobStatus.RUNNING
+        job.status = status
+        job.finished_at = time.monotonic()
+
+        if not was_running:
+            queue.discard(job)
+            # 被取消的可能是槽位不足而阻塞队列的队首任务
+            self._drain(queue)
+            return
+
+        duration = job.finished_at - job.started_at
+        JOB_DURATION.labels(job.backend).observe(duration)
+        if status is JobStatus.DONE:
+            queue.avg_job_seconds = 0.8 * queue.avg_job_seconds + 0.2 * duration
+        queue.running -= job.slots
+        queue.in_flight_gauge.set(queue.running)
+        self._drain(queue)
+
+    @asynccontextmanager
+    async def run(self, job: LLMJob) -> AsyncIterator[LLMJob]:
+        """等待槽位并在退出时释放，异常退出记为失败"""
+        await self.wait(job)
+        try:
+            yield job
+        except asyncio.CancelledError:
+            self.finish(job, JobStatus.CANCELLED)
+            raise
+        except BaseException:
+            self.finish(job, JobStatus.FAILED)
+            raise
+        else:
+            self.finish(job, JobStatus.DONE)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """各后端的运行和排队情况"""
+        return {
+            backend: {
+                "running": queue.running,
+                "queued": queue.queued,
+                "max_concurrency": queue.max_concurrency,
+                "avg_job_seconds": round(queue.avg_job_seconds, 3)
+            }
+            for backend, queue in self._backends.items()
+        }
+
+    def history_stats(self) -> Dict[str, int]:
+        """任务记录占用统计，用于内存诊断"""
+        return {
+            "entries": len(self._jobs),
+            "bytes": approx_size(self._jobs) + sum(approx_size(job.__dict__) for job in self._jobs.values()),
+            "max_entries": self.history
+        }
+
+    def _start(self, queue: _BackendQueue, job: LLMJob) -> None:
+        job.status = JobStatus.RUNNING
+        job.started_at = time.monotonic()
+        queue.running += job.slots
+        queue.in_flight_gauge.set(queue.running)
+        QUEUE_WAIT.labels(job.backend).observe(job.wait_seconds)
+        if not job._ready.done():
+            job._ready.set_result(None)
+
+    def _drain(self, queue: _BackendQueue) -> None:
+        """按队列顺序启动空闲槽位够用的排队任务"""
+        next_job = queue.pop()
+        while next_job is not None:
+            self._start(queue, next_job)
+            next_job = queue.pop()
+
+    def _retry_after(self, queue: _BackendQueue) -> int:
+        seconds = (queue.queued + 1) * queue.avg_job_seconds / max(1, queue.max_concurrency)
+        return max(1, math.ceil(seconds))
+
+    def _remember(self, job: LLMJob) -> None:
+        """记录任务，超出保留数量时淘汰最早结束的任务"""
+        self._jobs[job.job_id] = job
+        overflow = len(self._jobs) - self.history
+        if overflow <= 0:
+            return
+        finished = [job_id for job_id, j in self._jobs.items() if j.finished_at is not None]
+        for job_id in finished[:overflow]:
+            del self._jobs[job_id]
+
+
+# 全局调度器
+llm_scheduler = LLMScheduler()
+register_cache("llm_jobs", llm_scheduler.history_stats)
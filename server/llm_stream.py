@@ -0,0 +1,365 @@
+"""
+LLM流式输出工具
+
+将上游LLM的流式生成放在独立的任务中运行，请求处理协程只负责从队列中取出内容块。
+客户端断开连接时立即取消上游生成任务，避免在无人接收的报告上浪费模型算力。
+
+同时记录每次生成的首token时间、生成速度和总耗时，以及模型后端在响应元数据中报告的
+各阶段耗时（Ollama的load/prompt_eval/eval_duration）和token用量。
+
+多个生成可以并行运行并按顺序合并输出（merge_ordered_streams），用于分节生成的报告。
+
+deepseek-r1等推理模型在正文前输出 <think>…</think> 推理过程。ReasoningFilter 在流式输出中逐块区分
+推理内容和正文（标签可能被拆在相邻的内容块中），不缓冲整个响应；split_reasoning 同时记录首个可见token的时间。
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, AsyncGenerator, AsyncIterator, List, Optional, Tuple
+
+from starlette.requests import Request
+
+from server.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# 检测客户端断开的最小间隔（秒），同时覆盖模型输出首个token前的静默期
+DISCONNECT_POLL_INTERVAL = 0.5
+
+# 上游生成结束的哨兵对象
+_END_OF_STREAM = object()
+
+# 生成速度分桶（tokens/s）
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 500)
+
+LLM_TTFT = registry.histogram("llm_time_to_first_token_seconds", "从发出请求到收到首个token的时间", ["backend"])
+LLM_TOKENS_PER_SECOND = registry.histogram("llm_tokens_per_second", "生成速度", ["backend"], TOKENS_PER_SECOND_BUCKETS)
+LLM_STREAM_DURATION = registry.histogram("llm_stream_duration_seconds", "一次生成从发出请求到结束的时间", ["backend"])
+LLM_PROMPT_TOKENS = registry.counter("llm_prompt_tokens_total", "提示词token数", ["backend"])
+LLM_OUTPUT_TOKENS = registry.counter("llm_output_tokens_total", "生成token数", ["backend"])
+LLM_BACKEND_DURATION = registry.histogram("llm_backend_duration_seconds", "模型后端报告的各阶段耗时", ["backend", "phase"])
+LLM_TTFVT = registry.histogram("llm_time_to_first_visible_token_seconds", "从发出请求到收到首个正文（非推理）token的时间", ["backend"])
+
+# Ollama响应元数据中的耗时字段（纳秒）及对应的阶段名
+_BACKEND_PHASES = (
+    ("total_duration", "total"),
+    ("load_duration", "load"),
+    ("prompt_eval_duration", "prompt_eval"),
+    ("eval_duration", "eval"),
+)
+
+
+def record_llm_usage(
+    backend: str,
+    message: Any,
+    started_at: float,
+    finished_at: float,
+    first_token_at: Optional[float] = None,
+    num_chunks: int = 0
+) -> None:
+    """记录一次完整生成的指标
+
+    Args:
+        backend: 模型后端名称
+        message: 带response_metadata/usage_metadata的消息或最后一个内容块，可为None
+        started_at: 发出请求的时间（perf_counter）
+        finished_at: 生成结束的时间
+        first_token_at: 收到首个token的时间，非流式调用为None
+        num_chunks: 收到的内容块数，后端未报告token用量时作为生成token数的估计
+    """
+    metadata = getattr(message, "response_metadata", None) or {}
+    usage = getattr(message, "usage_metadata", None) or {}
+
+    LLM_STREAM_DURATION.labels(backend).observe(finished_at - started_at)
+
+    for key, phase in _BACKEND_PHASES:
+        value = metadata.get(key)
+        if value:
+            LLM_BACKEND_DURATION.labels(backend, phase).observe(value / 1e9)
+
+    prompt_tokens = usage.get("input_tokens") or metadata.get("prompt_eval_count") or 0
+    output_tokens = usage.get("output_tokens") or metadata.get("eval_count") or num_chunks
+    if prompt_tokens:
+        LLM_PROMPT_TOKENS.labels(backend).inc(prompt_tokens)
+    if output_tokens:
+        LLM_OUTPUT_TOKENS.labels(backend).inc(output_tokens)
+
+    # 生成速度优先使用后端报告的eval耗时，否则按首token到结束的时间估算
+    eval_seconds = metadata.get("eval_duration", 0) / 1e9
+    if not eval_seconds and first_token_at is not None:
+        eval_seconds = finished_at - first_token_at
+    if output_tokens and eval_seconds > 0:
+        LLM_TOKENS_PER_SECOND.labels(backend).observe(output_tokens / eval_seconds)
+
+
+class ClientDisconnectedError(Exception):
+    """客户端在流式输出过程中断开连接"""
+
+
+class DisconnectMonitor:
+    """按固定间隔检测客户端是否断开，避免每个事件都探测连接状态"""
+
+    def __init__(self, request: Optional[Request], poll_interval: float = DISCONNECT_POLL_INTERVAL):
+        self.request = request
+        self.poll_interval = poll_interval
+        self._last_check = time.perf_counter()
+
+    async def check(self, force: bool = False) -> bool:
+        """返回客户端是否已断开；force为False时距上次检测不足间隔则直接返回False"""
+        if self.request is None:
+            return False
+        now = time.perf_counter()
+        if not force and now - self._last_check < self.poll_interval:
+            return False
+        self._last_check = now
+        return await self.request.is_disconnected()
+
+
+def _max_output_tokens(llm: Any) -> Optional[int]:
+    """读取模型配置的最大输出token数（Ollama为num_predict，OpenAI兼容接口为max_tokens）"""
+    for attr in ("num_predict", "max_tokens"):
+        value = getattr(llm, attr, None)
+        if isinstance(value, int) and value > 0:
+            return value
+    return None
+
+
+async def astream_until_disconnect(
+    llm: Any,
+    messages: List[Any],
+    request: Optional[Request] = None,
+    poll_interval: float = DISCONNECT_POLL_INTERVAL,
+    backend: str = "default"
+) -> AsyncGenerator[str, None]:
+    """流式获取LLM输出内容，客户端断开时取消上游生成
+
+    Args:
+        llm: 支持astream方法的聊天模型
+        messages: 发送给模型的消息列表
+        request: 当前请求，用于检测客户端是否断开；为None时不做检测
+        poll_interval: 检测客户端断开的间隔（秒）
+        backend: 模型后端名称，用作指标标签
+
+    Yields:
+        模型输出的非空内容块
+
+    Raises:
+        ClientDisconnectedError: 客户端已断开，上游生成任务已被取消
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    started_at = time.perf_counter()
+    first_token_at: Optional[float] = None
+    num_chunks = 0
+
+    async def produce():
+        nonlocal first_token_at, num_chunks
+        # 后端在最后一个内容块中返回耗时和token用量
+        last_metadata_chunk = None
+        try:
+            async for chunk in llm.astream(messages):
+                if getattr(chunk, "response_metadata", None) or getattr(chunk, "usage_metadata", None):
+                    last_metadata_chunk = chunk
+                if hasattr(chunk, 'content') and chunk.content:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        LLM_TTFT.labels(backend).observe(first_token_at - started_at)
+                    num_chunks += 1
+                    queue.put_nowait(chunk.content)
+        except Exception as e:
+            queue.put_nowait(e)
+        else:
+            record_llm_usage(backend, last_metadata_chunk, started_at, time.perf_counter(), first_token_at, num_chunks)
+        queue.put_nowait(_END_OF_STREAM)
+
+    monitor = DisconnectMonitor(request, poll_interval)
+    task = asyncio.create_task(produce())
+    num_yielded = 0
+    disconnected = False
+
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=poll_interval)
+            except asyncio.TimeoutError:
+                # 上游暂无输出（如首token前的提示词评估阶段），检查客户端是否仍在线
+                if await monitor.check(force=True):
+                    disconnected = True
+                    break
+                continue
+
+            if item is _END_OF_STREAM:
+                break
+            if isinstance(item, Exception):
+                raise item
+
+            num_yielded += 1
+            yield item
+
+            # 持续输出时按间隔检查，避免每个token都探测连接状态
+            if await monitor.check():
+                disconnected = True
+                break
+    finally:
+        # 无论是检测到断开、响应任务被取消还是生成器被提前关闭，都终止上游生成
+        if not task.done():
+            task.cancel()
+            max_tokens = _max_output_tokens(llm)
+            # 取消时后端尚未返回token用量，这里只有已输出的内容块数；内容块与token不一定一一对应
+            limit = f"（输出上限 {max_tokens} 个token）" if max_tokens else ""
+            logger.info("取消上游生成：已输出 %d 个内容块，耗时 %.2fs，剩余生成已中止%s", num_yielded, time.perf_counter() - started_at, limit)
+
+    if disconnected:
+        raise ClientDisconnectedError()
+
+
+async def merge_ordered_streams(
+    streams: List[AsyncIterator[Any]],
+    max_concurrency: int,
+    separator: Any = ""
+) -> AsyncGenerator[Any, None]:
+    """并行消费多个内容流，按列表顺序输出
+
+    最多同时运行max_concurrency个流，按列表顺序启动。当前输出的流边生成边输出，后面的流先在内存中缓冲，
+    轮到时一次输出已缓冲的内容再继续实时输出。并发数不小于流数时，总耗时取决于最慢的流，而不是各流耗时之和。
+
+    Args:
+        streams: 内容流，通常是 astream_until_disconnect 或 split_reasoning 的返回值
+        max_concurrency: 同时运行的流数
+        separator: 相邻两个流的输出之间插入的内容，与流中的元素类型相同
+
+    Raises:
+        某个流抛出的异常，在轮到该流输出时抛出；合并被中止时取消所有未结束的流
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    queues: List[asyncio.Queue] = [asyncio.Queue() for _ in streams]
+
+    async def pump(stream: AsyncIterator[str], queue: asyncio.Queue):
+        async with semaphore:
+            try:
+                async for content in stream:
+                    queue.put_nowait(content)
+            except Exception as e:
+                queue.put_nowait(e)
+            finally:
+                aclose = getattr(stream, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+        queue.put_nowait(_END_OF_STREAM)
+
+    # 任务按顺序创建，信号量按等待顺序放行，靠前的流先启动
+    tasks = [asyncio.create_task(pump(stream, queue)) for stream, queue in zip(streams, queues)]
+    try:
+        for i, queue in enumerate(queues):
+            if i and separator:
+                yield separator
+            while True:
+                item = await queue.get()
+                if item is _END_OF_STREAM:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+class ReasoningFilter:
+    """流式区分推理内容（<think>…</think>）和正文的状态机
+
+    feed 返回 (是否推理内容, 文本) 列表。内容块末尾可能是被拆开的标签的前半部分，这部分暂存到下一块再判断，
+    其余内容立即返回。推理结束后正文开头的空白行一并去掉。
+    """
+
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self):
+        self.in_reasoning = False
+        self._pending = ""
+        self._strip_leading = False
+
+    @staticmethod
+    def _partial_tag(text: str, tag: str) -> int:
+        """text末尾与tag开头重合的最大长度（不含完整的tag）"""
+        for size in range(min(len(tag) - 1, len(text)), 0, -1):
+            if text.endswith(tag[:size]):
+                return size
+        return 0
+
+    def _emit(self, out: List[Tuple[bool, str]], text: str) -> None:
+        if not self.in_reasoning and self._strip_leading:
+            text = text.lstrip()
+            if not text:
+                return
+            self._strip_leading = False
+        if text:
+            out.append((self.in_reasoning, text))
+
+    def feed(self, text: str) -> List[Tuple[bool, str]]:
+        out: List[Tuple[bool, str]] = []
+        text = self._pending + text
+        self._pending = ""
+        while text:
+            tag = self.CLOSE_TAG if self.in_reasoning else self.OPEN_TAG
+            index = text.find(tag)
+            if index >= 0:
+                self._emit(out, text[:index])
+                text = text[index + len(tag):]
+                self.in_reasoning = not self.in_reasoning
+                self._strip_leading = not self.in_reasoning
+                continue
+            keep = self._partial_tag(text, tag)
+            self._emit(out, text[:len(text) - keep])
+            self._pending = text[len(text) - keep:]
+            break
+        return out
+
+    def flush(self) -> List[Tuple[bool, str]]:
+        """输出结束：暂存的部分不是标签，按当前状态输出"""
+        out: List[Tuple[bool, str]] = []
+        pending, self._pending = self._pending, ""
+        self._emit(out, pending)
+        return out
+
+
+def strip_reasoning(text: str) -> str:
+    """去掉完整响应中的推理内容"""
+    reasoning_filter = ReasoningFilter()
+    parts = reasoning_filter.feed(text) + reasoning_filter.flush()
+    return "".join(content for is_reasoning, content in parts if not is_reasoning)
+
+
+async def split_reasoning(
+    contents: AsyncIterator[str],
+    backend: str = "default",
+    record_ttfvt: bool = True
+) -> AsyncGenerator[Tuple[bool, str], None]:
+    """把内容流拆分为 (是否推理内容, 文本)，并记录从开始到首个正文token的时间
+
+    每个模型响应使用各自的过滤状态：分节生成时对每节分别调用，一节中未闭合的<think>不会吞掉后面的章节。
+    record_ttfvt为False时不记录首个正文token的时间（如分节报告中第一节之后的章节）。被提前关闭时一并关闭内容流。
+    """
+    reasoning_filter = ReasoningFilter()
+    started_at = time.perf_counter()
+    visible = not record_ttfvt
+
+    def observe(parts: List[Tuple[bool, str]]) -> List[Tuple[bool, str]]:
+        nonlocal visible
+        if not visible and any(not is_reasoning for is_reasoning, _ in parts):
+            visible = True
+            LLM_TTFVT.labels(backend).observe(time.perf_counter() - started_at)
+        return parts
+
+    try:
+        async for content in contents:
+            for part in observe(reasoning_filter.feed(content)):
+                yield part
+        for part in observe(reasoning_filter.flush()):
+            yield part
+    finally:
+        aclose = getattr(contents, "aclose", None)
+        if aclose is not None:
+            await aclose()
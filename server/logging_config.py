@@ -0,0 +1,224 @@
+"""
+日志配置
+
+非阻塞的结构化日志：
+- 请求协程只把日志记录放入队列（QueueHandler），格式化和写出在 QueueListener 的后台线程中完成，
+  不会因终端或磁盘写入阻塞事件循环
+- 每条日志输出为一行JSON，带有请求ID（X-Request-Id）和附加字段；LOG_FORMAT=text 时输出可读文本
+- INFO及以下级别按代码位置限速，超出部分丢弃，丢弃条数附在该位置下一条输出的日志上；访问日志每个请求一条，不限速
+- 每个请求结束时输出一条访问日志，包含状态码、总耗时和各处理阶段的耗时
+
+配置项（环境变量）：
+- LOG_LEVEL:       日志级别，默认INFO
+- LOG_FORMAT:      json 或 text
+- LOG_RATE_LIMIT:  每个代码位置每秒最多输出的INFO及以下日志条数，0表示不限速
+- LOG_QUEUE_SIZE:  日志队列长度，队列满时丢弃新日志而不是阻塞请求
+"""
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, TextIO, Tuple
+
+LOG_LEVEL      = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT     = os.environ.get("LOG_FORMAT", "json")
+LOG_RATE_LIMIT = float(os.environ.get("LOG_RATE_LIMIT", 20))
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+
+# 当前请求的ID和各阶段耗时（毫秒），由 RequestContextMiddleware 设置
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+stage_timings_var: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_timings", default=None)
+
+access_logger = logging.getLogger("server.access")
+
+# LogRecord自带的属性，其余属性视为附加字段输出
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+
+def record_stage_timing(stage: str, seconds: float) -> None:
+    """把阶段耗时记入当前请求，随访问日志输出"""
+    timings = stage_timings_var.get()
+    if timings is not None:
+        timings[stage] = round(seconds * 1000, 3)
+
+
+class RequestContextFilter(logging.Filter):
+    """在产生日志的线程中附加当前请求ID"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """按代码位置限速的令牌桶，WARNING及以上级别和exempt中的日志器不限速
+
+    访问日志由同一个代码位置输出，按位置限速会在负载较高时丢弃访问日志，因此默认不限速
+    """
+
+    def __init__(self, rate: float = LOG_RATE_LIMIT, burst: Optional[float] = None, exempt: Tuple[str, ...] = (access_logger.name,)):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.exempt = frozenset(exempt)
+        # (文件, 行号) -> [令牌数, 上次补充时间, 已丢弃条数]
+        self._buckets: Dict[tuple, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0 or record.levelno >= logging.WARNING or record.name in self.exempt:
+            return True
+        now = time.monotonic()
+        key = (record.pathname, record.lineno)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now, 0]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] < 1:
+            bucket[2] += 1
+            return False
+        bucket[0] -= 1
+        if bucket[2]:
+            record.suppressed = bucket[2]
+            bucket[2] = 0
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """只在调用线程中合并消息参数，格式化交给监听线程；队列满时丢弃日志"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # 异常对象和调用栈不能跨线程保留，先转为文本
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def build_queue_handler(
+    fmt: str = LOG_FORMAT,
+    stream: Optional[TextIO] = None,
+    rate_limit: float = LOG_RATE_LIMIT
+) -> Tuple[NonBlockingQueueHandler, QueueListener]:
+    """创建入队处理器及写出日志的监听器（未启动）"""
+    output = logging.StreamHandler(stream or sys.stderr)
+    if fmt == "text":
+        output.setFormatter(logging.Formatter(TEXT_FORMAT))
+    else:
+        output.setFormatter(JsonFormatter())
+
+    handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    handler.addFilter(RequestContextFilter())
+    handler.addFilter(RateLimitFilter(rate_limit))
+    return handler, QueueListener(handler.queue, output, respect_handler_level=True)
+
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, stream: Optional[TextIO] = None) -> QueueListener:
+    """配置根日志：调用线程只入队，后台线程格式化并写出；重复调用返回已有的监听器"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    handler, _listener = build_queue_handler(fmt, stream)
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(handler)
+
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
+
+
+class RequestContextMiddleware:
+    """为每个HTTP请求分配请求ID（沿用请求头X-Request-Id），并在请求结束时输出访问日志"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id" and 0 < len(value) <= 128:
+                request_id = value.decode("latin-1")
+                break
+        request_id = request_id or uuid.uuid4().hex
+        timings: Dict[str, float] = {}
+        id_token = request_id_var.set(request_id)
+        timings_token = stage_timings_var.set(timings)
+        status = 500
+        started_at = time.perf_counter()
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            duration_ms = round((time.perf_counter() - started_at) * 1000, 3)
+            if access_logger.isEnabledFor(logging.INFO):
+                access_logger.info(
+                    "%s %s %d %.1fms", scope["method"], scope["path"], status, duration_ms,
+                    extra={"method": scope["method"], "path": scope["path"], "status": status,
+                           "duration_ms": duration_ms, "stages": dict(timings)}
+                )
+            request_id_var.reset(id_token)
+            stage_timings_var.reset(timings_token)
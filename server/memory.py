@@ -0,0 +1,185 @@
+"""
+内存诊断
+
+- 缓存登记：进程内的每个缓存（报告流缓冲区、任务记录、剖析结果等）在此登记一个统计函数，
+  管理接口据此报告各缓存的条目数和估算占用的字节数，便于定位worker内存增长的来源
+- tracemalloc：按需开启/关闭，返回分配最多的代码位置，以及与基准快照之间的差异
+
+新增的进程内缓存都应通过 register_cache 登记，统计函数返回至少包含 entries 和 bytes 的字典。
+"""
+
+import gc
+import logging
+import os
+import sys
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# tracemalloc默认记录的调用栈深度
+TRACEMALLOC_FRAMES = int(os.environ.get("TRACEMALLOC_FRAMES", 10))
+
+# 统计时忽略的分配位置（tracemalloc自身和导入系统）
+_IGNORED_TRACES = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+GROUP_BY = ("lineno", "filename", "traceback")
+
+
+def approx_size(obj: Any, max_items: int = 10000) -> int:
+    """估算容器及其直接元素占用的字节数（不递归），元素过多时按前max_items个的均值外推"""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, bytearray)) or not hasattr(obj, "__len__") or not hasattr(obj, "__iter__"):
+        return size
+    total = len(obj)
+    items = obj.items() if isinstance(obj, dict) else obj
+    sampled, per_item = 0, 0
+    for item in items:
+        if sampled >= max_items:
+            break
+        per_item += sum(map(sys.getsizeof, item)) if isinstance(obj, dict) else sys.getsizeof(item)
+        sampled += 1
+    if sampled and total > sampled:
+        per_item = per_item * total // sampled
+    return size + per_item
+
+
+class CacheRegistry:
+    """进程内缓存登记表"""
+
+    def __init__(self):
+        self._caches: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def register(self, name: str, stats: Callable[[], Dict[str, Any]]) -> None:
+        """登记缓存；stats返回至少包含 entries（条目数）和 bytes（估算字节数）的字典"""
+        if name in self._caches:
+            raise ValueError(f"缓存 {name} 已登记")
+        self._caches[name] = stats
+
+    def unregister(self, name: str) -> None:
+        self._caches.pop(name, None)
+
+    def names(self) -> List[str]:
+        return list(self._caches)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各缓存的统计；单个缓存统计失败不影响其余缓存"""
+        result = {}
+        for name, stats in self._caches.items():
+            try:
+                result[name] = stats()
+            except Exception as e:
+                logger.warning("统计缓存 %s 失败：%s", name, e)
+                result[name] = {"error": str(e)}
+        return result
+
+
+def _format_stat(stat) -> Dict[str, Any]:
+    frame = stat.traceback[0]
+    entry = {
+        "file": frame.filename,
+        "line": frame.lineno,
+        "size": stat.size,
+        "count": stat.count,
+    }
+    if hasattr(stat, "size_diff"):
+        entry["size_diff"] = stat.size_diff
+        entry["count_diff"] = stat.count_diff
+    if len(stat.traceback) > 1:
+        entry["traceback"] = [f"{f.filename}:{f.lineno}" for f in stat.traceback]
+    return entry
+
+
+class MemoryTracer:
+    """tracemalloc的开关与快照比较"""
+
+    def __init__(self):
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = TRACEMALLOC_FRAMES) -> None:
+        """开启tracemalloc并把当前状态记为基准快照；开启后分配内存会明显变慢，排查完应及时关闭"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            logger.info("已开启tracemalloc，记录 %d 层调用栈", frames)
+        self._baseline = self._snapshot()
+
+    def stop(self) -> None:
+        self._baseline = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            logger.info("已关闭tracemalloc")
+
+    def reset_baseline(self) -> None:
+        """把当前状态记为新的基准快照"""
+        self._require_tracing()
+        self._baseline = self._snapshot()
+
+    def top(self, limit: int = 20, group_by: str = "lineno") -> List[Dict[str, Any]]:
+        """当前分配最多的代码位置"""
+        self._require_tracing()
+        self._check_group_by(group_by)
+        stats = self._snapshot().statistics(group_by)
+        return [_format_stat(stat) for stat in stats[:limit]]
+
+    def diff(self, limit: int = 20, group_by: str = "lineno") -> List[Dict[str, Any]]:
+        """与基准快照相比增长最多的代码位置"""
+        self._require_tracing()
+        self._check_group_by(group_by)
+        if self._baseline is None:
+            self._baseline = self._snapshot()
+        stats = self._snapshot().compare_to(self._baseline, group_by)
+        return [_format_stat(stat) for stat in stats[:limit]]
+
+    def summary(self) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"tracing": self.tracing, "gc_objects": len(gc.get_objects()), "gc_counts": gc.get_count()}
+        rss = current_rss()
+        if rss is not None:
+            result["rss_bytes"] = rss
+        if self.tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            result.update({
+                "traced_bytes": current,
+                "traced_peak_bytes": peak,
+                "tracemalloc_overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+                "frames": tracemalloc.get_traceback_limit()
+            })
+        return result
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(_IGNORED_TRACES)
+
+    def _require_tracing(self) -> None:
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc未开启")
+
+    def _check_group_by(self, group_by: str) -> None:
+        if group_by not in GROUP_BY:
+            raise ValueError(f"group_by 只能是 {', '.join(GROUP_BY)}")
+
+
+def current_rss() -> Optional[int]:
+    """当前进程的常驻内存（字节），仅支持Linux"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# 全局缓存登记表与tracemalloc控制
+cache_registry = CacheRegistry()
+memory_tracer = MemoryTracer()
+
+
+def register_cache(name: str, stats: Callable[[], Dict[str, Any]]) -> None:
+    """登记进程内缓存，见 CacheRegistry.register"""
+    cache_registry.register(name, stats)
@@ -1,8 +1,16 @@
 import os
+from typing import Optional
 from dotenv import load_dotenv
 
-from langchain_openai.chat_models import ChatOpenAI
-from langchain_ollama import ChatOllama
+# langchain及openai/ollama客户端在首次创建模型时才导入：它们的导入耗时数秒、占用数百MB内存，
+# 只提供排盘接口的进程（或尚未收到报告请求的worker）不需要加载
+
+
+# Ollama保持模型常驻的时间。模型卸载后KV缓存随之丢失，下一个请求要重新加载模型并完整计算提示词，
+# 无法复用与上一个请求相同的提示词前缀（报告提示词的系统消息）
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+# 上下文长度；各请求必须一致，否则Ollama会重新加载模型、丢弃缓存。未设置时使用模型的默认值
+OLLAMA_NUM_CTX    = int(os.environ["OLLAMA_NUM_CTX"]) if os.environ.get("OLLAMA_NUM_CTX") else None
 
 
 """
@@ -11,9 +19,11 @@ from langchain_ollama import ChatOllama
 MODEL_SOURCE = [
     "aliyun", # 阿里云百炼
     "local",  # 公司内部模型 or Mac本地模型 (Ollama)
+    "router", # 按延迟在多个后端之间路由，后端列表见 LLM_BACKENDS 环境变量
+    "stub",   # 本地桩模型，离线测试和压测使用，配置见 server/stub_model.py
 ]
 
-def get_aliyun_chat_model():
+def get_aliyun_chat_model(model: str = "deepseek-r1", base_url: str = "https://dashscope.aliyuncs.com/compatible-mode/v1"):
     # 加载环境变量
     load_dotenv()
     
@@ -24,35 +34,58 @@ def get_aliyun_chat_model():
         print("错误：未找到API密钥。请确保.env文件中包含ALIYUN_API_KEY。")
         raise ValueError("未找到API密钥。请确保.env文件中包含ALIYUN_API_KEY。")
     
+    from langchain_openai.chat_models import ChatOpenAI
+    
     # 配置ChatOpenAI
     return ChatOpenAI(
-        model_name      = "deepseek-r1",
+        model_name      = model,
         openai_api_key  = api_key,
-        openai_api_base = "https://dashscope.aliyuncs.com/compatible-mode/v1",
+        openai_api_base = base_url,
         temperature     = 0
     )
 
 
-def get_ollama_chat_model():
-    import platform
-    REMOTE_HOST = "192.168.11.8" if platform.system() == "Linux" else "127.0.0.1"
-    OLLAMA_PORT = 11434
+def get_ollama_chat_model(base_url: str = None, model: str = "deepseek-r1:8b", keep_alive: str = OLLAMA_KEEP_ALIVE, num_ctx: Optional[int] = OLLAMA_NUM_CTX):
+    if base_url is None:
+        import platform
+        REMOTE_HOST = "192.168.11.8" if platform.system() == "Linux" else "127.0.0.1"
+        OLLAMA_PORT = 11434
+        base_url = f"http://{REMOTE_HOST}:{OLLAMA_PORT}"
+
+    from langchain_ollama import ChatOllama
 
     return ChatOllama(
-        base_url    = f"http://{REMOTE_HOST}:{OLLAMA_PORT}",
-        model       = "deepseek-r1:8b",
+        base_url    = base_url,
+        model       = model,
         temperature = 0.7,
-        timeout     = 30
+        timeout     = 30,
+        keep_alive  = keep_alive,
+        num_ctx     = num_ctx
     )
 
 
-def get_chat_model(model_source: str):
+def get_chat_model(model_source: str, **kwargs):
+    """根据模型类型创建聊天模型，kwargs传给具体的模型构造函数（如base_url、model）"""
     if model_source == "aliyun":
-        return get_aliyun_chat_model()
+        return get_aliyun_chat_model(**kwargs)
     elif model_source == "local":
-        return get_ollama_chat_model()
+        return get_ollama_chat_model(**kwargs)
+    elif model_source == "stub":
+        from server.stub_model import get_stub_chat_model
+        return get_stub_chat_model(**kwargs)
+    elif model_source == "router":
+        from server.llm_router import get_llm_router
+        return get_llm_router()
     else:
         raise ValueError(f"未找到模型类型: {model_source}")
 
 
-__all__ = ["get_chat_model"]
\ No newline at end of file
+def build_messages(prompt: str, system: Optional[str] = None) -> list:
+    """把提示词包装为模型的输入消息列表；给出system时以系统消息开头，便于后端复用相同的提示词前缀"""
+    from langchain_core.messages import HumanMessage, SystemMessage
+    if system:
+        return [SystemMessage(content=system), HumanMessage(content=prompt)]
+    return [HumanMessage(content=prompt)]
+
+
+__all__ = ["get_chat_model", "build_messages"]
\ No newline at end of file
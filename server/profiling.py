@@ -0,0 +1,234 @@
+"""
+请求级性能剖析
+
+按需对单个请求做性能剖析，用于排查个别命盘计算慢的问题：
+- 通过环境变量 PROFILE_ENABLED=1 开启；未开启时不安装中间件，没有任何开销
+- 每 PROFILE_SAMPLE_EVERY 个请求剖析一个（0表示不按比例采样），或请求带有 X-Profile: 1 请求头时剖析
+- 两种模式（PROFILE_MODE）：
+    cprofile  确定性剖析，结果可下载为pstats文件，用 snakeviz / python -m pstats 查看
+    sample    定时采样事件循环线程的调用栈，结果为flamegraph.pl / speedscope可直接读取的折叠栈格式
+- 内存中保留最近 PROFILE_KEEP 份结果，通过管理接口 /admin/profiles 查看和下载
+- 响应头 X-Profile-Id 返回本次剖析结果的ID
+
+剖析覆盖整个请求（含流式响应的输出过程）。同一时间只剖析一个请求；由于协程共享事件循环线程，
+剖析期间并发请求的执行也会出现在结果中。
+"""
+
+import cProfile
+import io
+import itertools
+import logging
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from server.memory import approx_size, register_cache
+
+logger = logging.getLogger(__name__)
+
+# 剖析默认配置，可通过环境变量覆盖
+PROFILE_ENABLED         = os.environ.get("PROFILE_ENABLED", "0") == "1"
+PROFILE_MODE            = os.environ.get("PROFILE_MODE", "cprofile")               # cprofile 或 sample
+PROFILE_SAMPLE_EVERY    = int(os.environ.get("PROFILE_SAMPLE_EVERY", 100))         # 每N个请求剖析一个，0表示只按请求头剖析
+PROFILE_KEEP            = int(os.environ.get("PROFILE_KEEP", 20))                  # 保留的剖析结果数
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", 0.005))  # sample模式的采样间隔（秒）
+
+# 触发剖析的请求头
+PROFILE_HEADER = b"x-profile"
+
+PROFILE_MODES = ("cprofile", "sample")
+
+
+class RequestProfile:
+    """一次请求的剖析结果"""
+
+    def __init__(self, profile_id: str, method: str, path: str, mode: str):
+        self.profile_id = profile_id
+        self.method = method
+        self.path = path
+        self.mode = mode
+        self.created_at = time.time()
+        self.duration = 0.0
+        self.status: Optional[int] = None
+        self.stats: Optional[pstats.Stats] = None  # cprofile模式
+        self.stacks: Counter = Counter()           # sample模式：折叠栈 -> 采样次数
+
+    def to_dict(self) -> Dict:
+        return {
+            "profile_id": self.profile_id,
+            "method": self.method,
+            "path": self.path,
+            "mode": self.mode,
+            "status": self.status,
+            "created_at": self.created_at,
+            "duration": round(self.duration, 6),
+            "samples": sum(self.stacks.values()) if self.mode == "sample" else None
+        }
+
+    def to_pstats(self) -> bytes:
+        """pstats文件内容，与 cProfile.Profile.dump_stats 输出的格式相同"""
+        if self.stats is None:
+            raise ValueError("只有cprofile模式的结果可以导出为pstats")
+        return marshal.dumps(self.stats.stats)
+
+    def to_text(self, limit: int = 50) -> str:
+        """可读的文本摘要"""
+        if self.stats is not None:
+            stream = io.StringIO()
+            pstats.Stats(stream=stream).add(self.stats).sort_stats("cumulative").print_stats(limit)
+            return stream.getvalue()
+        lines = [f"{count:>8}  {stack.rsplit(';', 1)[-1]}" for stack, count in self._leaf_counts().most_common(limit)]
+        return "\n".join(["  samples  function"] + lines) + "\n"
+
+    def to_collapsed(self) -> str:
+        """折叠栈格式，每行为"调用栈 采样次数"，调用栈自外向内以分号分隔"""
+        if self.mode != "sample":
+            raise ValueError("只有sample模式的结果可以导出为折叠栈")
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def _leaf_counts(self) -> Counter:
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves
+
+
+class ProfileStore:
+    """保留最近K份剖析结果"""
+
+    def __init__(self, keep: int = PROFILE_KEEP):
+        self._profiles: Deque[RequestProfile] = deque(maxlen=keep)
+        self._ids = itertools.count(1)
+
+    def new_id(self) -> str:
+        return f"{int(time.time())}-{next(self._ids)}"
+
+    def add(self, profile: RequestProfile) -> None:
+        self._profiles.append(profile)
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        return next((p for p in self._profiles if p.profile_id == profile_id), None)
+
+    def list(self) -> List[RequestProfile]:
+        return list(reversed(self._profiles))
+
+    def clear(self) -> None:
+        self._profiles.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """剖析结果占用统计，用于内存诊断"""
+        return {
+            "entries": len(self._profiles),
+            "bytes": sum(approx_size(p.stats.stats if p.stats is not None else p.stacks) for p in self._profiles),
+            "max_entries": self._profiles.maxlen
+        }
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class StackSampler:
+    """在后台线程中定时采样指定线程的调用栈"""
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+
+class ProfilingMiddleware:
+    """按采样比例或请求头对HTTP请求做性能剖析的ASGI中间件"""
+
+    def __init__(
+        self,
+        app,
+        store: Optional[ProfileStore] = None,
+        mode: str = PROFILE_MODE,
+        sample_every: int = PROFILE_SAMPLE_EVERY,
+        sample_interval: float = PROFILE_SAMPLE_INTERVAL
+    ):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"不支持的剖析模式: {mode}")
+        self.app = app
+        self.store = store if store is not None else profile_store
+        self.mode = mode
+        self.sample_every = sample_every
+        self.sample_interval = sample_interval
+        self._requests = itertools.count(1)
+        self._active = False
+
+    def _should_profile(self, scope) -> bool:
+        if self._active:
+            # cProfile同一线程只能有一个实例在运行
+            return False
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER and value == b"1":
+                return True
+        return self.sample_every > 0 and next(self._requests) % self.sample_every == 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(self.store.new_id(), scope["method"], scope["path"], self.mode)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile.profile_id.encode())]
+            await send(message)
+
+        self._active = True
+        profiler = sampler = None
+        if self.mode == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            sampler = StackSampler(threading.get_ident(), self.sample_interval)
+            sampler.start()
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profile.duration = time.perf_counter() - started_at
+            if profiler is not None:
+                profiler.disable()
+                profile.stats = pstats.Stats(profiler)
+            else:
+                profile.stacks = sampler.stop()
+            self._active = False
+            self.store.add(profile)
+            logger.info("已剖析请求 %s %s，耗时 %.3fs，剖析ID %s", profile.method, profile.path, profile.duration, profile.profile_id)
+
+
+# 全局剖析结果存储
+profile_store = ProfileStore()
+register_cache("profiles", profile_store.stats)
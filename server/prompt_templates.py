@@ -1,19 +1,14 @@
-from langchain.prompts import PromptTemplate
-from typing import Dict, Any
+from typing import Dict, Any, List
 
-# 八字命理报告的提示词模板
-BAZI_REPORT_TEMPLATE = """
-你是一名资深命理学家，熟读《三命通会》、《渊海子平》，《滴天髓》、《穷通宝鉴》、《子平真诠》等命理经典，请根据以下命主信息进行深度命盘解析：
+# 八字命理报告的提示词分为两部分：
+# - 系统消息：角色、分析要求和写作要求，所有请求完全相同
+# - 用户消息：命主信息和排盘程序算出的命盘事实（见 server/chart_facts.py），每个请求不同，放在最后
+# 模型后端（如Ollama）会复用与上一个请求相同的提示词前缀的KV缓存，静态内容在前时
+# 每个请求只需计算命主信息这一小段，首token时间随之缩短。修改系统消息会让已缓存的前缀失效
+BAZI_REPORT_SYSTEM_PROMPT = """
+你是一名资深命理学家，熟读《三命通会》、《渊海子平》，《滴天髓》、《穷通宝鉴》、《子平真诠》等命理经典，请根据用户给出的命主信息进行深度命盘解析。
 
-命主信息:
-- 出生日期: {lunar_date}
-- 四柱八字: {bazi_str}
-- 性别: {gender}
-- 当前时间：{cur_date_ymd}
-- 当前大运：{cur_dayun_ganzhi}
-- 当前流年：{cur_liunian_ganzhi}
-
-请根据以上信息，提供一份详细的八字命理分析报告，包括但不限于以下方面:
+请提供一份详细的八字命理分析报告，包括但不限于以下方面:
 1. 命主的五行特点和日主旺衰分析
 2. 命局特点和格局分析
 3. 性格特点和天赋才能
@@ -25,38 +20,65 @@ BAZI_REPORT_TEMPLATE = """
 请重点解读：
 1. 整体分析格局，考虑身强身弱，分析十神关系，体用平衡。注意逻辑合理，综合各种信息文本判断准确的关系模型，交叉验证，多次迭代后输出最终正确的结果。
 2. 绘制命盘能量分布图（用ASCII字符呈现五行强弱）。
-3. 排出大运和流年，并列出命主的历史事件，尽量详细，细节丰富，以验证推算的准确性。
+3. 结合大运和流年，推断命主过往的重要经历，尽量详细，细节丰富，以验证推算的准确性。
 4. 分析预测命主的感情状况。
-5. 分析预测2025年的运势。
-
-可以参考的命理基础知识：
-地支藏干：
-子：癸
-丑：己、辛、癸
-寅：甲、丙、戊
-卯：乙
-辰：戊、乙、癸
-巳：丙、庚、戊
-午：丁、己
-未：己、丁、乙
-申：庚、壬、戊
-酉：辛
-戌：戊、辛、丁
-亥：壬、甲
+5. 分析预测当前流年的运势。
+
+四柱、藏干、十神、五行分值、大运和流年已由排盘程序算出，以用户给出的数据为准，直接引用，不要重新推算或复述。
 
 请使用专业但通俗易懂的语言，避免过于迷信的说法，注重实用性建议。
 请使用Markdown格式组织你的回答，使用适当的标题、列表和强调，使报告更加清晰易读。
 """
 
-# 创建提示词模板
-bazi_report_prompt = PromptTemplate(
-    input_variables=["solar_date_ymd", "lunar_date_ymd", "birth_time_hour", "sizhu_str", "gender", "cur_date_ymd", "cur_dayun_ganzhi", "cur_liunian_ganzhi"],
-    template=BAZI_REPORT_TEMPLATE
+# 用户消息模板，包含命主信息和命盘事实
+BAZI_REPORT_USER_TEMPLATE = """命主信息:
+- 出生日期: {lunar_date_ymd}
+- 四柱八字: {sizhu_str}
+- 性别: {gender}
+- 当前时间：{cur_date_ymd}
+- 当前大运：{cur_dayun_ganzhi}
+- 当前流年：{cur_liunian_ganzhi}
+
+{chart_facts}
+
+{request}
+"""
+
+# 用户消息最后的写作要求
+BAZI_REPORT_REQUEST = "请根据以上命主信息撰写命理分析报告。"
+
+# 分节生成：报告的各节（标题, 重点），每节单独请求模型，可以并行生成后按顺序合并
+REPORT_SECTIONS = (
+    ("五行特点与日主旺衰", "分析五行强弱和日主旺衰，绘制命盘能量分布图（用ASCII字符呈现五行强弱）"),
+    ("命局格局", "分析格局、十神关系和体用平衡；结合大运和流年推断命主过往的重要经历，并分析当前流年的运势"),
+    ("性格与天赋", "分析性格特点和天赋才能"),
+    ("事业发展", "分析事业发展方向并给出建议"),
+    ("财运", "分析财运并给出理财建议"),
+    ("健康", "分析健康状况并给出养生建议"),
+    ("人际与婚姻", "分析人际关系、婚姻和感情状况"),
 )
 
-def get_bazi_report_prompt(fate_owner_data: Dict[str, Any]) -> str:
+# 分节生成的系统消息，各节共用；用户消息中命主信息在前、分节要求在最后，同一报告的各节共享提示词前缀
+BAZI_SECTION_SYSTEM_PROMPT = """
+你是一名资深命理学家，熟读《三命通会》、《渊海子平》，《滴天髓》、《穷通宝鉴》、《子平真诠》等命理经典。
+一份八字命理分析报告分为以下几节，分别撰写：
+""" + "".join(f"{i}. {title}\n" for i, (title, _) in enumerate(REPORT_SECTIONS, 1)) + """
+每次只撰写用户指定的一节：以"## 节标题"开头，不写全文的引言和总结，不重复其他各节的内容。
+
+四柱、藏干、十神、五行分值、大运和流年已由排盘程序算出，以用户给出的数据为准，直接引用，不要重新推算或复述。
+
+请使用专业但通俗易懂的语言，避免过于迷信的说法，注重实用性建议。
+请使用Markdown格式组织你的回答，使用适当的列表和强调，使报告更加清晰易读。
+"""
+
+BAZI_SECTION_REQUEST = "请根据以上命主信息撰写报告中的「{title}」一节，重点：{focus}。"
+
+# 预先绑定模板的format方法，生成提示词时只做一次字符串格式化，不依赖langchain
+bazi_report_prompt = BAZI_REPORT_USER_TEMPLATE.format
+
+def get_bazi_report_prompt(fate_owner_data: Dict[str, Any], request: str = BAZI_REPORT_REQUEST) -> str:
     """
-    根据命主信息生成八字命理报告的提示词
+    根据命主信息生成八字命理报告的用户消息，与系统消息 BAZI_REPORT_SYSTEM_PROMPT 一起发给模型
     
     Args:
         fate_owner_data: 包含命主信息的字典，包含以下键:
@@ -65,16 +87,18 @@ def get_bazi_report_prompt(fate_owner_data: Dict[str, Any]) -> str:
             - lunar_date_ymd : str, 农历日期, "2000年1月1日"
             - birth_time_hour: str, 出生时辰, "下午2点"
             - sizhu_str      : str, 八字, "庚辰 戊子 丙寅 乙未"
-            - current_date   : str, 当前日期, "2025年1月1日"
+            - current_date   : str, 当前日期, "2025年"
             - current_dayun  : str, 当前大运, "庚辰"
             - current_liunian: str, 当前流年
+            - chart_facts    : str, 命盘事实表格（见 server/chart_facts.py 的 format_chart_facts）
+        request: 用户消息最后的写作要求
     
     Returns:
-        格式化后的提示词字符串
+        格式化后的用户消息
     """
     gender_str = "男" if fate_owner_data.get("gender") == "male" else "女"
     
-    return bazi_report_prompt.format(
+    return bazi_report_prompt(
         solar_date_ymd=fate_owner_data.get("birth_date", ""),
         lunar_date_ymd=fate_owner_data.get("lunar_date", ""),
         birth_time_hour=fate_owner_data.get("birth_time", ""),
@@ -82,5 +106,28 @@ def get_bazi_report_prompt(fate_owner_data: Dict[str, Any]) -> str:
         gender=gender_str,
         cur_date_ymd=fate_owner_data.get("current_date", ""),
         cur_dayun_ganzhi=fate_owner_data.get("current_dayun", ""),
-        cur_liunian_ganzhi=fate_owner_data.get("current_liunian", "")
-    )
\ No newline at end of file
+        cur_liunian_ganzhi=fate_owner_data.get("current_liunian", ""),
+        chart_facts=fate_owner_data.get("chart_facts", ""),
+        request=request
+    )
+
+
+def get_bazi_section_prompts(fate_owner_data: Dict[str, Any]) -> List[str]:
+    """分节生成时各节的用户消息，顺序与 REPORT_SECTIONS 一致，与系统消息 BAZI_SECTION_SYSTEM_PROMPT 一起发给模型"""
+    return [
+        get_bazi_report_prompt(fate_owner_data, BAZI_SECTION_REQUEST.format(title=title, focus=focus))
+        for title, focus in REPORT_SECTIONS
+    ]
+
+# 多轮追问：会话上下文为报告的系统消息、命主信息和已生成的报告，之后是以下说明，会话内保持不变，
+# 每轮请求共享这段前缀。历史超出预算时较早的轮次被压缩为摘要，放在说明之后
+CHAT_FOLLOWUP_PROMPT = """
+接下来用户会就这份命盘继续提问。请结合上面的命主信息和报告回答，只回答用户问到的内容，不要重复整份报告。
+回答要简洁具体，使用专业但通俗易懂的语言，避免过于迷信的说法。
+"""
+
+# 历史摘要消息的开头
+CHAT_SUMMARY_HEADER = "此前对话的摘要：\n"
+
+# 压缩历史时发给模型的要求，放在待压缩的问答之后
+CHAT_SUMMARY_REQUEST = "请把以上对话（包括已有的摘要）压缩为一段摘要，保留用户关心的问题和已给出的主要结论，不超过{limit}字。只输出摘要。"
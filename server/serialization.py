@@ -0,0 +1,113 @@
+"""
+排盘结果的JSON序列化
+
+排盘接口的响应由预先编码好的片段直接拼接成字节串，不再经过 jsonable_encoder 和 json.dumps：
+- 四柱：六十甲子只有60种，每种柱的 {"heavenly_stem":..,"earthly_branch":..} 和干支名在导入时编码一次，
+  八字字符串也由干支名直接拼出
+- 十神：天干十神与地支十神的组合只有100种，同样预先编码
+- 其余字段（日期、八字字符串、五行）用 orjson 编码；未安装 orjson 时退回标准库 json，输出相同
+
+拼出的字节串用 RawJSONResponse 原样返回。其他接口返回的字典用 FastJSONResponse 编码。
+"""
+
+import json
+from itertools import product
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from fastapi.responses import JSONResponse, Response
+
+from server.define import BaziInfo, EarthlyBranch, HeavenlyStem, TenGodType
+from server.fate_owner import PILLARS
+
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖
+    orjson = None
+
+
+def dumps(obj: Any) -> bytes:
+    """编码为紧凑的UTF-8 JSON，与 JSONResponse 的输出一致"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: bytes) -> Any:
+    """解析JSON，数据无效时抛出ValueError"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _pair_json(heavenly_stem: str, earthly_branch: str) -> bytes:
+    return dumps({"heavenly_stem": heavenly_stem, "earthly_branch": earthly_branch})
+
+
+# 每种柱的 (干支名的UTF-8字节, 柱的JSON片段)；干支名不含需要转义的字符，可直接拼进JSON字符串
+PILLAR_JSON: Dict[Tuple[HeavenlyStem, EarthlyBranch], Tuple[bytes, bytes]] = {
+    (pillar.heavenly_stem, pillar.earthly_branch): (
+        (pillar.heavenly_stem.value + pillar.earthly_branch.value).encode("utf-8"),
+        _pair_json(pillar.heavenly_stem.value, pillar.earthly_branch.value)
+    )
+    for pillar in PILLARS.values()
+}
+
+TEN_GOD_JSON: Dict[Tuple[TenGodType, TenGodType], bytes] = {
+    (stem_god, branch_god): _pair_json(stem_god.value, branch_god.value)
+    for stem_god, branch_god in product(TenGodType, repeat=2)
+}
+
+_KEY_JSON: Dict[str, bytes] = {}
+
+
+def _key_json(key: str) -> bytes:
+    fragment = _KEY_JSON.get(key)
+    if fragment is None:
+        fragment = _KEY_JSON[key] = dumps(key) + b":"
+    return fragment
+
+
+_PILLAR_KEYS = (b'{"year":', b',"month":', b',"day":', b',"hour":')
+
+
+class RawJSONResponse(Response):
+    """内容已经是编码好的JSON字节串，原样返回"""
+    media_type = "application/json"
+
+
+class FastJSONResponse(JSONResponse):
+    """用 orjson 编码的 JSONResponse，输出与 JSONResponse 相同"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def encode_chart_response(solar_date: str, lunar_date: Optional[str], bazi_info: BaziInfo) -> bytes:
+    """排盘接口的响应体，字段与顺序与原先返回的字典相同"""
+    pillars = [
+        PILLAR_JSON[pillar.heavenly_stem, pillar.earthly_branch]
+        for pillar in (bazi_info.year_pillar, bazi_info.month_pillar, bazi_info.day_pillar, bazi_info.hour_pillar)
+    ]
+    parts = [
+        b'{"solar_date":', dumps(solar_date),
+        b',"lunar_date":', dumps(lunar_date),
+        b',"bazi_string":"', b" ".join([name for name, _ in pillars]),
+        b'","chart_code":', b"%d" % bazi_info.chart_code,
+        b',"five_elements":', dumps(bazi_info.five_elements),
+        b',"pillars":'
+    ]
+    for key, (_, fragment) in zip(_PILLAR_KEYS, pillars):
+        parts.append(key)
+        parts.append(fragment)
+    parts.append(b'},"ten_gods":{')
+    parts.append(b",".join([
+        _key_json(pillar_name) + TEN_GOD_JSON[god.heavenly_stem, god.earthly_branch]
+        for pillar_name, god in bazi_info.ten_gods.items()
+    ]))
+    parts.append(b"}}")
+    return b"".join(parts)
+
+
+def encode_chart_list(charts: Iterable[bytes]) -> bytes:
+    """把多个已编码的排盘结果拼成JSON数组"""
+    return b"[" + b",".join(charts) + b"]"
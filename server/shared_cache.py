@@ -0,0 +1,230 @@
+"""
+跨进程共享缓存
+
+多worker部署时，每个worker是独立的进程，进程内缓存无法共享：一个worker刚排过的盘，
+请求落到另一个worker上又要重新计算。这里用本机的SQLite文件（WAL模式）作为共享后端：
+- WAL模式下读不阻塞写、写不阻塞读，多个worker可以同时读取
+- synchronous=NORMAL，缓存丢失最近的写入无关紧要，换取更少的fsync
+- 每个线程各自持有连接，SQLite连接不能跨线程使用
+- 读写都不阻塞事件循环：写入只放入队列，由后台线程按批在一个事务中写入，队列满时丢弃；
+  读取在调用线程执行，等锁最多 SHARED_CACHE_BUSY_TIMEOUT 秒，数据库被锁住时按未命中处理
+
+按命名空间区分不同的缓存（排盘结果 chart、报告正文 report），各自有过期时间和条目上限。
+值为bytes，调用方负责序列化；get_json/set_json 提供JSON的便捷封装。
+
+配置项（环境变量）：
+- SHARED_CACHE_PATH:        缓存文件路径，默认在系统临时目录下；设为空字符串时关闭共享缓存
+- CHART_CACHE_TTL:          排盘结果的缓存时间（秒），0表示不缓存
+- REPORT_CACHE_TTL:         报告正文的缓存时间（秒），默认0即不缓存（同一八字的用户会看到相同的报告）
+- SHARED_CACHE_MAX_ENTRIES: 每个命名空间的最大条目数，超出时淘汰最早过期的条目
+- SHARED_CACHE_BUSY_TIMEOUT:读取时等待数据库锁的最长时间（秒）
+- SHARED_CACHE_QUEUE_SIZE:  待写入队列的长度
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from server.memory import register_cache
+
+logger = logging.getLogger(__name__)
+
+SHARED_CACHE_PATH        = os.environ.get("SHARED_CACHE_PATH", os.path.join(tempfile.gettempdir(), "fatelling_cache.sqlite3"))
+CHART_CACHE_TTL          = float(os.environ.get("CHART_CACHE_TTL", 30 * 86400))
+REPORT_CACHE_TTL         = float(os.environ.get("REPORT_CACHE_TTL", 0))
+SHARED_CACHE_MAX_ENTRIES = int(os.environ.get("SHARED_CACHE_MAX_ENTRIES", 100000))
+SHARED_CACHE_BUSY_TIMEOUT = float(os.environ.get("SHARED_CACHE_BUSY_TIMEOUT", 0.05))
+SHARED_CACHE_QUEUE_SIZE  = int(os.environ.get("SHARED_CACHE_QUEUE_SIZE", 10000))
+
+# 后台写入线程等待数据库锁的最长时间（秒），不在请求路径上，可以等得久一些
+WRITE_BUSY_TIMEOUT = 5.0
+# 每批最多写入的条目数
+WRITE_BATCH_SIZE = 256
+
+# 每写入多少次清理一次过期和超额的条目
+PRUNE_EVERY = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    namespace  TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    value      BLOB NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_expires ON cache (namespace, expires_at);
+"""
+
+
+class SharedCache:
+    """基于SQLite WAL文件的跨进程缓存的一个命名空间；path为空或ttl<=0时关闭，读取总是未命中"""
+
+    def __init__(
+        self,
+        path: Optional[str],
+        namespace: str,
+        ttl: float,
+        max_entries: int = SHARED_CACHE_MAX_ENTRIES,
+        busy_timeout: float = SHARED_CACHE_BUSY_TIMEOUT,
+        queue_size: int = SHARED_CACHE_QUEUE_SIZE
+    ):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.busy_timeout = busy_timeout
+        self.enabled = bool(path) and ttl > 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.busy = 0
+        self.dropped = 0
+        self._writes = 0
+        self._local = threading.local()
+        self._queue: "queue.Queue[Tuple[str, bytes, float]]" = queue.Queue(queue_size)
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _connect(self, timeout: Optional[float] = None) -> sqlite3.Connection:
+        """当前线程的连接；timeout为等待数据库锁的时间，默认为读取的等待时间，每个线程首次连接时确定"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout if timeout is None else timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        try:
+            row = self._connect().execute(
+                "SELECT value FROM cache WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (self.namespace, key, time.time())
+            ).fetchone()
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e):
+                self.errors += 1
+                logger.warning("读取共享缓存 %s 失败：%s", self.namespace, e)
+            else:
+                # 等锁超时：不在事件循环上继续等待，按未命中处理
+                self.busy += 1
+            return None
+        except sqlite3.Error as e:
+            # 缓存不可用时按未命中处理，不影响请求
+            self.errors += 1
+            logger.warning("读取共享缓存 %s 失败：%s", self.namespace, e)
+            return None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def set(self, key: str, value: bytes) -> None:
+        """放入写入队列，由后台线程写入；队列满时丢弃"""
+        if not self.enabled:
+            return
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait((key, value, time.time() + self.ttl))
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self) -> None:
+        """等待已入队的条目全部写入"""
+        if self._writer is not None:
+            self._queue.join()
+
+    def _ensure_writer(self) -> None:
+        if self._writer is not None:
+            return
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name=f"shared-cache-{self.namespace}", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write_batch(self, batch: List[Tuple[str, bytes, float]]) -> None:
+        try:
+            conn = self._connect(WRITE_BUSY_TIMEOUT)
+            with conn:
+                conn.execute("BEGIN")
+                conn.executemany(
+                    "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    [(self.namespace, key, value, expires_at) for key, value, expires_at in batch]
+                )
+            previous, self._writes = self._writes, self._writes + len(batch)
+            if previous // PRUNE_EVERY != self._writes // PRUNE_EVERY:
+                self.prune()
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning("写入共享缓存 %s 失败（%d 条）：%s", self.namespace, len(batch), e)
+
+    def get_json(self, key: str) -> Any:
+        value = self.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set_json(self, key: str, value: Any) -> None:
+        if self.enabled:
+            self.set(key, json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+    def prune(self) -> int:
+        """删除过期条目，并在超过条目上限时淘汰最早过期的条目，返回删除的条目数"""
+        conn = self._connect()
+        deleted = conn.execute(
+            "DELETE FROM cache WHERE namespace = ? AND expires_at <= ?", (self.namespace, time.time())
+        ).rowcount
+        (count,) = conn.execute("SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)).fetchone()
+        if count > self.max_entries:
+            deleted += conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key IN "
+                "(SELECT key FROM cache WHERE namespace = ? ORDER BY expires_at LIMIT ?)",
+                (self.namespace, self.namespace, count - self.max_entries)
+            ).rowcount
+        return deleted
+
+    def clear(self) -> None:
+        if self.enabled:
+            self._connect().execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+
+    def stats(self) -> Dict[str, Any]:
+        """共享缓存的条目数和字节数（所有worker合计），以及本进程的命中统计"""
+        result: Dict[str, Any] = {
+            "enabled": self.enabled, "hits": self.hits, "misses": self.misses, "errors": self.errors, "busy": self.busy, "dropped": self.dropped
+        }
+        if self.enabled:
+            entries, size = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cache WHERE namespace = ?", (self.namespace,)
+            ).fetchone()
+            result.update({"entries": entries, "bytes": size, "max_entries": self.max_entries, "path": self.path})
+        else:
+            result.update({"entries": 0, "bytes": 0})
+        return result
+
+
+# 全局共享缓存：排盘结果与报告正文
+chart_cache = SharedCache(SHARED_CACHE_PATH, "chart", CHART_CACHE_TTL)
+report_cache = SharedCache(SHARED_CACHE_PATH, "report", REPORT_CACHE_TTL)
+
+register_cache("shared_chart", chart_cache.stats)
+register_cache("shared_report", report_cache.stats)
@@ -0,0 +1,144 @@
+"""
+静态文件：指纹文件名与预压缩
+
+- 指纹：启动时按内容为目录下每个文件算出短哈希，文件可以通过 name.<哈希>.ext 访问。这样的地址内容永不改变，
+  返回 Cache-Control: public, max-age=31536000, immutable；原文件名仍可访问，返回 no-cache，每次用ETag验证
+- 清单：manifest.json 给出原文件名到指纹文件名的映射，前端构建和页面据此引用静态文件
+- 预压缩：文件旁有 .br/.gz 变体且客户端接受时直接返回变体，请求时不再压缩。
+  变体由 precompress（scripts/precompress_static.py）在部署前生成
+"""
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+from typing import Dict, List, Tuple
+
+from fastapi.responses import FileResponse, JSONResponse, Response
+from starlette.datastructures import Headers
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from server.http_cache import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # brotli为可选依赖，未安装时只生成gzip变体
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE_CACHE_CONTROL  = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+MANIFEST_NAME            = "manifest.json"
+
+# 预压缩变体的后缀，按优先级排列
+COMPRESSED_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+# 小于此大小的文件压缩收益不抵开销，不生成变体
+PRECOMPRESS_MIN_SIZE = 512
+
+# 本身已压缩的格式，不再压缩
+_INCOMPRESSIBLE = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".avif", ".woff", ".woff2", ".zip", ".mp4", ".gz", ".br"}
+
+FINGERPRINT_LENGTH = 10
+
+
+def fingerprint_name(name: str, digest: str) -> str:
+    """app.js -> app.<哈希>.js"""
+    root, ext = os.path.splitext(name)
+    return f"{root}.{digest[:FINGERPRINT_LENGTH]}{ext}"
+
+
+def _source_files(directory: str) -> List[Tuple[str, str]]:
+    """目录下的源文件（不含预压缩变体），返回 (相对路径, 完整路径)"""
+    files = []
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            if name.endswith(tuple(COMPRESSED_SUFFIXES.values())):
+                continue
+            full_path = os.path.join(root, name)
+            files.append((os.path.relpath(full_path, directory).replace(os.sep, "/"), full_path))
+    return files
+
+
+def precompress(directory: str, min_size: int = PRECOMPRESS_MIN_SIZE) -> Dict[str, Dict[str, int]]:
+    """为目录下的文件生成 .gz（安装了brotli时还有 .br）变体，只保留比原文件小的变体
+
+    返回 {相对路径: {"original": 原大小, 编码: 变体大小}}
+    """
+    results = {}
+    for relative, full_path in _source_files(directory):
+        if os.path.splitext(relative)[1].lower() in _INCOMPRESSIBLE:
+            continue
+        with open(full_path, "rb") as f:
+            data = f.read()
+        if len(data) < min_size:
+            continue
+        variants = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants["br"] = brotli.compress(data, quality=11)
+        sizes = {"original": len(data)}
+        for encoding, compressed in variants.items():
+            path = full_path + COMPRESSED_SUFFIXES[encoding]
+            if len(compressed) < len(data):
+                with open(path, "wb") as f:
+                    f.write(compressed)
+                sizes[encoding] = len(compressed)
+            elif os.path.exists(path):
+                os.remove(path)
+        results[relative] = sizes
+    return results
+
+
+class FingerprintedStaticFiles(StaticFiles):
+    """支持指纹文件名、清单和预压缩变体的静态文件服务；目录内容在启动时扫描一次"""
+
+    def __init__(self, *, directory: str, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.manifest: Dict[str, str] = {}
+        self._originals: Dict[str, str] = {}
+        self._variants: Dict[str, List[str]] = {}
+        for relative, full_path in _source_files(directory):
+            with open(full_path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            fingerprinted = fingerprint_name(relative, digest)
+            self.manifest[relative] = fingerprinted
+            self._originals[fingerprinted] = relative
+            encodings = [e for e, suffix in COMPRESSED_SUFFIXES.items() if os.path.isfile(full_path + suffix)]
+            if encodings:
+                self._variants[os.path.realpath(full_path)] = encodings
+        logger.debug("静态文件 %d 个，其中 %d 个有预压缩变体", len(self.manifest), len(self._variants))
+
+    def fingerprinted(self, name: str) -> str:
+        """原文件名对应的指纹文件名，未知文件原样返回"""
+        return self.manifest.get(name, name)
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        original = self._originals.get(path)
+        if original is None and path == MANIFEST_NAME and MANIFEST_NAME not in self.manifest:
+            return JSONResponse(self.manifest, headers={"Cache-Control": REVALIDATE_CACHE_CONTROL})
+        response = await super().get_response(original or path, scope)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if original else REVALIDATE_CACHE_CONTROL
+        return response
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        encodings = self._variants.get(str(full_path))
+        if not encodings:
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        request_headers = Headers(scope=scope)
+        accepted = accepted_encodings(request_headers.get("accept-encoding"))
+        encoding = next((e for e in encodings if e in accepted), None)
+        if encoding is None:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        else:
+            variant = str(full_path) + COMPRESSED_SUFFIXES[encoding]
+            media_type = mimetypes.guess_type(str(full_path))[0] or "text/plain"
+            response = FileResponse(variant, status_code=status_code, stat_result=os.stat(variant), media_type=media_type)
+            response.headers["Content-Encoding"] = encoding
+        response.headers["Vary"] = "Accept-Encoding"
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -0,0 +1,262 @@
+"""
+命盘与报告的持久化存储
+
+SQLite数据库（WAL模式），保存用户排过的命盘和生成过的报告，供历史记录接口查询，
+回看时无需再排盘或调用模型：
+- charts：每个用户的每张命盘一行，以命盘编码（见 server/chart_code.py）标识；同一用户再次排到
+  同一张命盘时只更新出生信息和时间
+- reports：生成的报告正文，zlib压缩后存储，按用户和命盘编码关联到命盘
+- 索引：用户+时间（历史列表）、命盘编码、创建时间
+
+写入不在请求路径上执行：请求只把记录放入队列，后台线程按批在一个事务中写入。队列满时丢弃记录并计数，
+不阻塞请求。读取走各线程自己的连接，WAL模式下与后台写入互不阻塞。
+
+配置项（环境变量）：
+- CHART_DB_PATH:        数据库文件路径（如 data/fatelling.db）；默认为空，即关闭持久化。数据库中保存用户的出生信息和报告，
+                        需要历史记录接口时再显式开启，并自行负责文件的访问权限和保留期限
+- STORE_BATCH_SIZE:     每批最多写入的记录数
+- STORE_FLUSH_INTERVAL: 攒批的最长等待时间（秒）
+- STORE_QUEUE_SIZE:     待写入队列的长度
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from server.chart_code import pillars_string
+from server.memory import register_cache
+
+logger = logging.getLogger(__name__)
+
+CHART_DB_PATH        = os.environ.get("CHART_DB_PATH", "")
+STORE_BATCH_SIZE     = int(os.environ.get("STORE_BATCH_SIZE", 200))
+STORE_FLUSH_INTERVAL = float(os.environ.get("STORE_FLUSH_INTERVAL", 0.5))
+STORE_QUEUE_SIZE     = int(os.environ.get("STORE_QUEUE_SIZE", 10000))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS charts (
+    id         INTEGER PRIMARY KEY,
+    owner      TEXT    NOT NULL,
+    chart_code INTEGER NOT NULL,
+    birth      TEXT    NOT NULL,
+    bazi       BLOB    NOT NULL,
+    created_at REAL    NOT NULL,
+    updated_at REAL    NOT NULL,
+    UNIQUE (owner, chart_code)
+);
+CREATE INDEX IF NOT EXISTS charts_owner_updated ON charts (owner, updated_at DESC);
+CREATE INDEX IF NOT EXISTS charts_code ON charts (chart_code);
+CREATE INDEX IF NOT EXISTS charts_created ON charts (created_at);
+
+CREATE TABLE IF NOT EXISTS reports (
+    id         INTEGER PRIMARY KEY,
+    owner      TEXT    NOT NULL,
+    chart_code INTEGER NOT NULL,
+    kind       TEXT    NOT NULL,
+    model      TEXT,
+    content    BLOB    NOT NULL,
+    created_at REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_owner_chart ON reports (owner, chart_code, created_at DESC);
+CREATE INDEX IF NOT EXISTS reports_code ON reports (chart_code);
+CREATE INDEX IF NOT EXISTS reports_created ON reports (created_at);
+"""
+
+_UPSERT_CHART = """
+INSERT INTO charts (owner, chart_code, birth, bazi, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (owner, chart_code) DO UPDATE SET birth = excluded.birth, bazi = excluded.bazi, updated_at = excluded.updated_at
+"""
+
+_INSERT_REPORT = "INSERT INTO reports (owner, chart_code, kind, model, content, created_at) VALUES (?, ?, ?, ?, ?, ?)"
+
+
+def compress_text(text: str) -> bytes:
+    return zlib.compress(text.encode("utf-8"), 6)
+
+
+def decompress_text(data: bytes) -> str:
+    return zlib.decompress(data).decode("utf-8")
+
+
+class ChartStore:
+    """命盘与报告存储；path为空时关闭，写入被忽略、查询返回空"""
+
+    def __init__(
+        self,
+        path: Optional[str] = CHART_DB_PATH,
+        batch_size: int = STORE_BATCH_SIZE,
+        flush_interval: float = STORE_FLUSH_INTERVAL,
+        queue_size: int = STORE_QUEUE_SIZE
+    ):
+        self.path = path
+        self.enabled = bool(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self._queue: "queue.Queue[Tuple[str, tuple]]" = queue.Queue(queue_size)
+        self._local = threading.local()
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    # 写入：请求只入队，后台线程批量写入
+
+    def save_chart(self, owner: str, chart_code: int, birth: Dict[str, Any], bazi: Dict[str, Any]) -> None:
+        """记录用户排过的命盘；bazi为 BaziInfo.model_dump(mode="json") 的结果"""
+        now = time.time()
+        birth_json = json.dumps(birth, ensure_ascii=False, separators=(",", ":"))
+        bazi_blob = compress_text(json.dumps(bazi, ensure_ascii=False, separators=(",", ":")))
+        self._enqueue(_UPSERT_CHART, (owner, chart_code, birth_json, bazi_blob, now, now))
+
+    def save_report(self, owner: str, chart_code: int, kind: str, content: str, model: Optional[str] = None) -> None:
+        """记录生成的报告，kind为报告类型（basic、fate）"""
+        self._enqueue(_INSERT_REPORT, (owner, chart_code, kind, model, compress_text(content), time.time()))
+
+    def _enqueue(self, sql: str, params: tuple) -> None:
+        if not self.enabled:
+            return
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait((sql, params))
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("存储写入队列已满，丢弃一条记录（累计 %d 条）", self.dropped)
+
+    def _ensure_writer(self) -> None:
+        if self._writer is not None:
+            return
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="chart-store-writer", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write_batch(self, batch: List[Tuple[str, tuple]]) -> None:
+        try:
+            conn = self._connect()
+            with conn:
+                for sql, params in batch:
+                    conn.execute(sql, params)
+            self.written += len(batch)
+        except sqlite3.Error as e:
+            logger.error("批量写入 %d 条记录失败：%s", len(batch), e, exc_info=True)
+
+    def flush(self) -> None:
+        """等待已入队的记录全部写入"""
+        if self._writer is not None:
+            self._queue.join()
+
+    # 查询：不经过排盘引擎和模型
+
+    def list_charts(self, owner: str, limit: int = 20, before: Optional[float] = None) -> List[Dict[str, Any]]:
+        """用户的命盘列表，最近排过的在前，四柱由命盘编码直接得出；before为上一页最后一条的updated_at，用于翻页"""
+        if not self.enabled:
+            return []
+        rows = self._connect().execute(
+            "SELECT id, chart_code, birth, created_at, updated_at FROM charts "
+            "WHERE owner = ? AND updated_at < ? ORDER BY updated_at DESC LIMIT ?",
+            (owner, before if before is not None else float("inf"), limit)
+        ).fetchall()
+        counts = self._report_counts(owner, [row[1] for row in rows])
+        return [
+            {
+                "chart_id": chart_id,
+                "chart_code": chart_code,
+                "bazi": pillars_string(chart_code),
+                "birth": json.loads(birth),
+                "created_at": created_at,
+                "updated_at": updated_at,
+                "reports": counts.get(chart_code, 0)
+            }
+            for chart_id, chart_code, birth, created_at, updated_at in rows
+        ]
+
+    def _report_counts(self, owner: str, chart_codes: List[int]) -> Dict[int, int]:
+        if not chart_codes:
+            return {}
+        placeholders = ",".join("?" * len(chart_codes))
+        rows = self._connect().execute(
+            f"SELECT chart_code, COUNT(*) FROM reports WHERE owner = ? AND chart_code IN ({placeholders}) GROUP BY chart_code",
+            (owner, *chart_codes)
+        ).fetchall()
+        return dict(rows)
+
+    def get_chart(self, owner: str, chart_id: int) -> Optional[Dict[str, Any]]:
+        """命盘详情及其全部报告（新的在前）；命盘不存在或不属于该用户时返回None"""
+        if not self.enabled:
+            return None
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT chart_code, birth, bazi, created_at, updated_at FROM charts WHERE id = ? AND owner = ?",
+            (chart_id, owner)
+        ).fetchone()
+        if row is None:
+            return None
+        chart_code, birth, bazi, created_at, updated_at = row
+        reports = conn.execute(
+            "SELECT id, kind, model, content, created_at FROM reports "
+            "WHERE owner = ? AND chart_code = ? ORDER BY created_at DESC",
+            (owner, chart_code)
+        ).fetchall()
+        return {
+            "chart_id": chart_id,
+            "chart_code": chart_code,
+            "birth": json.loads(birth),
+            "bazi": json.loads(decompress_text(bazi)),
+            "created_at": created_at,
+            "updated_at": updated_at,
+            "reports": [
+                {"report_id": report_id, "kind": kind, "model": model, "content": decompress_text(content), "created_at": report_created_at}
+                for report_id, kind, model, content, report_created_at in reports
+            ]
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """待写入队列的占用，用于内存诊断"""
+        return {
+            "enabled": self.enabled,
+            "entries": self._queue.qsize(),
+            "bytes": sum(len(value) for _, params in list(self._queue.queue) for value in params if isinstance(value, (str, bytes))),
+            "written": self.written,
+            "dropped": self.dropped
+        }
+
+
+# 全局存储
+chart_store = ChartStore()
+
+register_cache("chart_store_queue", chart_store.stats)
@@ -0,0 +1,277 @@
+"""
+可续传的报告流
+
+每个报告流拥有唯一ID，生成的SSE事件按序编号后写入有界的环形缓冲区。
+上游生成在后台任务中运行，与具体的客户端连接解耦：客户端断线重连时携带Last-Event-ID，
+即可从断点继续接收，无需再次调用LLM。
+
+缓冲区的淘汰同时基于时间和容量：
+- 单个流最多保留 max_events 个事件（环形缓冲区）
+- 已结束的流在 finished_ttl 秒后淘汰
+- 流的总数超过 max_streams 时，优先淘汰最早结束的流，其次是无人订阅的流
+- 所有连接都断开的进行中流，在 resume_grace 秒内无人重连则取消上游生成
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Any, AsyncGenerator, AsyncIterator, Deque, Dict, Optional, Tuple
+
+from starlette.requests import Request
+
+from server.llm_stream import ClientDisconnectedError, DisconnectMonitor, DISCONNECT_POLL_INTERVAL
+from server.memory import register_cache
+
+logger = logging.getLogger(__name__)
+
+# 事件ID格式："{stream_id}-{seq}"
+EVENT_ID_SEPARATOR = "-"
+
+# 缓冲区默认配置，可通过环境变量覆盖
+REPORT_STREAM_MAX_STREAMS   = int(os.environ.get("REPORT_STREAM_MAX_STREAMS", 256))
+REPORT_STREAM_MAX_EVENTS    = int(os.environ.get("REPORT_STREAM_MAX_EVENTS", 20000))
+REPORT_STREAM_FINISHED_TTL  = float(os.environ.get("REPORT_STREAM_FINISHED_TTL", 300))
+REPORT_STREAM_RESUME_GRACE  = float(os.environ.get("REPORT_STREAM_RESUME_GRACE", 15))
+
+
+def format_sse(event: str, data: Dict[str, Any], event_id: Optional[str] = None) -> str:
+    """格式化一条SSE事件"""
+    id_line = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{id_line}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def parse_event_id(event_id: Optional[str]) -> Optional[Tuple[str, int]]:
+    """解析事件ID，返回(stream_id, seq)，格式不正确时返回None"""
+    if not event_id:
+        return None
+    stream_id, sep, seq = event_id.strip().rpartition(EVENT_ID_SEPARATOR)
+    if not sep or not stream_id or not seq.isdigit():
+        return None
+    return stream_id, int(seq)
+
+
+class ReportStream:
+    """单个报告流：按序保存已生成的SSE事件，支持多个连接从任意偏移量订阅"""
+
+    def __init__(self, stream_id: str, max_events: int):
+        self.stream_id = stream_id
+        self.events: Deque[str] = deque(maxlen=max_events)
+        self.next_seq = 0
+        self.created_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self.cancelled = False
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._cancel_handle: Optional[asyncio.TimerHandle] = None
+        self._new_event = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def first_seq(self) -> int:
+        """缓冲区中最早事件的序号"""
+        return self.next_seq - len(self.events)
+
+    def append(self, event: str, data: Dict[str, Any]) -> None:
+        """追加一条事件并唤醒所有等待中的订阅者"""
+        seq = self.next_seq
+        self.events.append(format_sse(event, data, f"{self.stream_id}{EVENT_ID_SEPARATOR}{seq}"))
+        self.next_seq = seq + 1
+        self._notify()
+
+    def finish(self) -> None:
+        if self.finished_at is None:
+            self.finished_at = time.monotonic()
+            self._notify()
+
+    def cancel(self) -> None:
+        """取消上游生成"""
+        self._cancel_handle = None
+        if self.task is not None and not self.task.done():
+            self.cancelled = True
+            self.task.cancel()
+
+    def can_resume_after(self, seq: int) -> bool:
+        """能否从序号seq之后继续输出：事件仍在缓冲区中，且流未被取消"""
+        return not self.cancelled and self.first_seq - 1 <= seq < self.next_seq
+
+    def _notify(self) -> None:
+        self._new_event.set()
+        self._new_event = asyncio.Event()
+
+    async def subscribe(
+        self,
+        after_seq: int,
+        request: Optional[Request] = None,
+        poll_interval: float = DISCONNECT_POLL_INTERVAL
+    ) -> AsyncGenerator[str, None]:
+        """从序号after_seq之后开始输出事件，直到流结束
+
+        Raises:
+            ClientDisconnectedError: 客户端已断开
+        """
+        monitor = DisconnectMonitor(request, poll_interval)
+        seq = after_seq
+        while True:
+            if seq + 1 < self.first_seq:
+                # 订阅者落后过多，未读事件已被环形缓冲区覆盖
+                raise RuntimeError(f"报告流 {self.stream_id} 的事件 {seq + 1} 已被淘汰")
+
+            pending = list(islice(self.events, seq + 1 - self.first_seq, None))
+            for text in pending:
+                seq += 1
+                yield text
+                if await monitor.check():
+                    raise ClientDisconnectedError()
+
+            # 输出期间可能追加了新事件（包括结束前的最后几个事件），全部输出后才返回
+            if self.finished and seq + 1 >= self.next_seq:
+                return
+            if seq + 1 < self.next_seq:
+                continue
+
+            waiter = self._new_event
+            try:
+                await asyncio.wait_for(waiter.wait(), timeout=poll_interval)
+            except asyncio.TimeoutError:
+                if await monitor.check(force=True):
+                    raise ClientDisconnectedError()
+
+
+class ReportStreamRegistry:
+    """报告流注册表：创建、查找、订阅并淘汰报告流"""
+
+    def __init__(
+        self,
+        max_streams: int = REPORT_STREAM_MAX_STREAMS,
+        max_events: int = REPORT_STREAM_MAX_EVENTS,
+        finished_ttl: float = REPORT_STREAM_FINISHED_TTL,
+        resume_grace: float = REPORT_STREAM_RESUME_GRACE
+    ):
+        self.max_streams = max_streams
+        self.max_events = max_events
+        self.finished_ttl = finished_ttl
+        self.resume_grace = resume_grace
+        self._streams: "OrderedDict[str, ReportStream]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._streams)
+
+    def create(self, events: AsyncIterator[Tuple[str, Dict[str, Any]]]) -> ReportStream:
+        """创建报告流，并在后台任务中消费事件序列
+
+        Args:
+            events: (事件名, 数据) 的异步迭代器，通常由上游LLM生成驱动
+        """
+        self.evict()
+        stream = ReportStream(uuid.uuid4().hex, self.max_events)
+        self._streams[stream.stream_id] = stream
+        stream.task = asyncio.create_task(self._produce(stream, events))
+        return stream
+
+    def get(self, stream_id: str) -> Optional[ReportStream]:
+        """查找报告流；查找前先淘汰已过期的流，没有新请求时过期的流也不会一直占用缓冲区"""
+        self._evict_expired()
+        return self._streams.get(stream_id)
+
+    def resolve(self, last_event_id: Optional[str]) -> Optional[Tuple[ReportStream, int]]:
+        """根据Last-Event-ID查找可续传的报告流，返回(流, 最后收到的序号)"""
+        parsed = parse_event_id(last_event_id)
+        if parsed is None:
+            return None
+        stream_id, seq = parsed
+        stream = self.get(stream_id)
+        if stream is None or not stream.can_resume_after(seq):
+            return None
+        return stream, seq
+
+    async def stream(
+        self,
+        stream: ReportStream,
+        after_seq: int = -1,
+        request: Optional[Request] = None
+    ) -> AsyncGenerator[str, None]:
+        """以订阅者身份输出报告流事件；最后一个订阅者断开后，宽限期内无人重连则取消上游生成"""
+        self._attach(stream)
+        try:
+            async for text in stream.subscribe(after_seq, request):
+                yield text
+        finally:
+            self._detach(stream)
+
+    def stats(self) -> Dict[str, Any]:
+        """缓冲区占用统计，用于内存诊断"""
+        events = sum(len(s.events) for s in self._streams.values())
+        size = sum(sys.getsizeof(e) for s in self._streams.values() for e in s.events)
+        return {
+            "entries": len(self._streams),
+            "events": events,
+            "bytes": size,
+            "active": sum(1 for s in self._streams.values() if not s.finished),
+            "max_entries": self.max_streams
+        }
+
+    def evict(self) -> None:
+        """淘汰过期的流，并将流数量控制在max_streams以内"""
+        self._evict_expired()
+        if len(self._streams) < self.max_streams:
+            return
+        finished = sorted(
+            (s for s in self._streams.values() if s.finished),
+            key=lambda s: s.finished_at
+        )
+        idle = [s for s in self._streams.values() if not s.finished and s.subscribers == 0]
+        for stream in finished + idle:
+            if len(self._streams) < self.max_streams:
+                break
+            self._remove(stream.stream_id)
+
+    def _evict_expired(self) -> None:
+        """淘汰结束超过finished_ttl的流"""
+        now = time.monotonic()
+        for stream_id, stream in list(self._streams.items()):
+            if stream.finished and now - stream.finished_at >= self.finished_ttl:
+                self._remove(stream_id)
+
+    def _remove(self, stream_id: str) -> None:
+        stream = self._streams.pop(stream_id)
+        stream.cancel()
+
+    def _attach(self, stream: ReportStream) -> None:
+        stream.subscribers += 1
+        if stream._cancel_handle is not None:
+            stream._cancel_handle.cancel()
+            stream._cancel_handle = None
+
+    def _detach(self, stream: ReportStream) -> None:
+        stream.subscribers -= 1
+        if stream.subscribers > 0 or stream.finished:
+            return
+        if self.resume_grace <= 0:
+            stream.cancel()
+        else:
+            loop = asyncio.get_running_loop()
+            stream._cancel_handle = loop.call_later(self.resume_grace, stream.cancel)
+
+    async def _produce(self, stream: ReportStream, events: AsyncIterator[Tuple[str, Dict[str, Any]]]) -> None:
+        try:
+            async for event, data in events:
+                stream.append(event, data)
+        except asyncio.CancelledError:
+            logger.info("报告流 %s 已取消生成（已缓存 %d 个事件）", stream.stream_id, stream.next_seq)
+            raise
+        finally:
+            stream.finish()
+
+
+# 全局报告流注册表
+report_streams = ReportStreamRegistry()
+register_cache("report_streams", report_streams.stats)
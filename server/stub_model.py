@@ -0,0 +1,211 @@
+"""
+本地桩模型
+
+不依赖任何模型服务的假聊天模型（MODEL_SOURCE=stub），用于端到端测试和压测：
+按配置的首token时间（TTFT）和生成速度（tokens/s）流式输出固定文本，并可按比例注入错误。
+给定随机种子时，进程内的错误注入序列可复现。
+
+可以模拟提示词计算（prefill）的耗时和后端的前缀缓存：与Ollama一样，每个槽位保留上一个请求的提示词，
+新请求与某个槽位的公共前缀不再计算，首token时间只包含未命中部分的计算时间。
+结束块的 prompt_eval_count 与Ollama一致，为实际计算的token数。
+
+配置项（环境变量，也可作为 get_chat_model("stub", ...) 的参数传入）：
+- STUB_LLM_TEXT:        输出文本
+- STUB_LLM_TTFT:        首token时间（秒）
+- STUB_LLM_TPS:         生成速度（tokens/s），0表示不限速
+- STUB_LLM_ERROR_RATE:  请求在输出首token前失败的概率
+- STUB_LLM_SEED:        随机种子
+- STUB_LLM_PROMPT_TPS:  提示词计算速度（tokens/s），0表示不计耗时
+- STUB_LLM_CACHE_SLOTS: 前缀缓存的槽位数（对应Ollama的并行数），0表示不缓存
+"""
+
+import asyncio
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel, agenerate_from_stream, generate_from_stream
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from pydantic import Field
+
+DEFAULT_STUB_TEXT = (
+    "## 命盘概述\n\n"
+    "日主得令，五行流通有情。命局以印星为用，喜木火调候，忌金水过旺。\n\n"
+    "## 性格与事业\n\n"
+    "为人稳重踏实，思虑周全，适合技术、研究或管理类工作。\n\n"
+    "## 财运与健康\n\n"
+    "正财稳定，宜稳健理财；注意脾胃与作息规律。\n"
+)
+
+
+class StubLLMError(RuntimeError):
+    """桩模型注入的错误"""
+
+
+# 按随机种子共享的随机数生成器：每次请求都会创建新的模型实例，共享后错误注入序列在进程内可复现
+_RANDOMS: Dict[Optional[int], random.Random] = {}
+
+
+def _shared_random(seed: Optional[int]) -> random.Random:
+    rng = _RANDOMS.get(seed)
+    if rng is None:
+        rng = _RANDOMS[seed] = random.Random(seed)
+    return rng
+
+
+# 进程内共享的前缀缓存：各槽位上一个请求的提示词，最近使用的在后
+_PROMPT_SLOTS: List[str] = []
+
+
+def _evaluate_prompt(prompt: str, slots: int) -> int:
+    """模拟后端的前缀缓存，返回需要计算的token数（每个字符视为一个token）"""
+    if slots <= 0:
+        return len(prompt)
+    best, cached = -1, 0
+    for i, previous in enumerate(_PROMPT_SLOTS):
+        common = len(os.path.commonprefix([previous, prompt]))
+        if common > cached:
+            best, cached = i, common
+    # 命中的槽位被新提示词覆盖；未命中时占用最久未用的槽位
+    if best >= 0:
+        _PROMPT_SLOTS.pop(best)
+    elif len(_PROMPT_SLOTS) >= slots:
+        _PROMPT_SLOTS.pop(0)
+    _PROMPT_SLOTS.append(prompt)
+    return len(prompt) - cached
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+class StubChatModel(BaseChatModel):
+    """按固定速度流式输出文本的本地桩模型，每个字符视为一个token"""
+
+    text: str = Field(default_factory=lambda: os.environ.get("STUB_LLM_TEXT", DEFAULT_STUB_TEXT))
+    time_to_first_token: float = Field(default_factory=lambda: _env_float("STUB_LLM_TTFT", 0.2))
+    tokens_per_second: float = Field(default_factory=lambda: _env_float("STUB_LLM_TPS", 50))
+    error_rate: float = Field(default_factory=lambda: _env_float("STUB_LLM_ERROR_RATE", 0))
+    seed: Optional[int] = Field(default_factory=lambda: int(os.environ["STUB_LLM_SEED"]) if "STUB_LLM_SEED" in os.environ else None)
+    prompt_tokens_per_second: float = Field(default_factory=lambda: _env_float("STUB_LLM_PROMPT_TPS", 0))
+    cache_slots: int = Field(default_factory=lambda: int(os.environ.get("STUB_LLM_CACHE_SLOTS", 1)))
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _should_fail(self) -> bool:
+        return self.error_rate > 0 and _shared_random(self.seed).random() < self.error_rate
+
+    def _token_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _prompt(self, messages: List[BaseMessage]) -> str:
+        return "".join(str(message.content) for message in messages)
+
+    def _prefill(self, messages: List[BaseMessage]) -> Tuple[int, float]:
+        """计算提示词：返回实际计算的token数和耗时（首token时间加上未命中前缀部分的计算时间）"""
+        evaluated = _evaluate_prompt(self._prompt(messages), self.cache_slots)
+        delay = self.time_to_first_token
+        if self.prompt_tokens_per_second > 0:
+            delay += evaluated / self.prompt_tokens_per_second
+        return evaluated, delay
+
+    def _final_chunk(self, messages: List[BaseMessage], started_at: float, first_token_at: float, evaluated: int) -> ChatGenerationChunk:
+        """结束块：携带与Ollama一致的耗时字段（纳秒）和token用量"""
+        finished_at = time.perf_counter()
+        input_tokens, output_tokens = len(self._prompt(messages)), len(self.text)
+        return ChatGenerationChunk(message=AIMessageChunk(
+            content="",
+            response_metadata={
+                "model": "stub",
+                "done": True,
+                "done_reason": "stop",
+                "total_duration": int((finished_at - started_at) * 1e9),
+                "load_duration": 0,
+                "prompt_eval_count": evaluated,
+                "prompt_eval_duration": int((first_token_at - started_at) * 1e9),
+                "eval_count": output_tokens,
+                "eval_duration": int((finished_at - first_token_at) * 1e9),
+            },
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            }
+        ))
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        started_at = time.perf_counter()
+        evaluated, prefill = self._prefill(messages)
+        time.sleep(prefill)
+        if self._should_fail():
+            raise StubLLMError("桩模型注入的错误")
+        first_token_at = time.perf_counter()
+        delay = self._token_delay()
+        for i, char in enumerate(self.text):
+            # 按绝对时间表输出，避免累计误差
+            wait = first_token_at + i * delay - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=char))
+            if run_manager:
+                run_manager.on_llm_new_token(char, chunk=chunk)
+            yield chunk
+        yield self._final_chunk(messages, started_at, first_token_at, evaluated)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        started_at = time.perf_counter()
+        evaluated, prefill = self._prefill(messages)
+        await asyncio.sleep(prefill)
+        if self._should_fail():
+            raise StubLLMError("桩模型注入的错误")
+        first_token_at = time.perf_counter()
+        delay = self._token_delay()
+        for i, char in enumerate(self.text):
+            wait = first_token_at + i * delay - time.perf_counter()
+            # 不限速时也让出事件循环，保持与真实后端一致的调度行为
+            await asyncio.sleep(wait if wait > 0 else 0)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=char))
+            if run_manager:
+                await run_manager.on_llm_new_token(char, chunk=chunk)
+            yield chunk
+        yield self._final_chunk(messages, started_at, first_token_at, evaluated)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        return generate_from_stream(self._stream(messages, stop, run_manager, **kwargs))
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        return await agenerate_from_stream(self._astream(messages, stop, run_manager, **kwargs))
+
+
+def get_stub_chat_model(**kwargs) -> StubChatModel:
+    """创建桩模型，未传入的参数从环境变量读取"""
+    return StubChatModel(**kwargs)
@@ -7,9 +7,9 @@ setup(
     install_requires=[
         "sxtwl",
         "python-dateutil>=2.8.2",
-        "fastapi>=0.68.0",
-        "uvicorn>=0.15.0",
-        "pydantic>=1.8.0",
+        "fastapi>=0.115.0",
+        "uvicorn>=0.41.0",
+        "pydantic>=2",
         "langchain>=0.3.15",
         "langchain-ollama",
         "langchain-core",
@@ -25,5 +25,9 @@ setup(
         "pytest>=7.4.0",
         "httpx>=0.24.0",
     ],
-    python_requires=">=3.8",
+    extras_require={
+        # 可选的加速依赖：orjson 编码JSON响应，brotli 压缩响应；未安装时退回标准库json和gzip
+        "speedups": ["orjson>=3.9", "brotli"],
+    },
+    python_requires=">=3.9",
 ) 
\ No newline at end of file
@@ -0,0 +1,16 @@
+"""
+测试公共配置：默认使用本地桩模型，测试无需连接真实的模型服务
+如需针对真实模型运行，可在运行前设置 MODEL_SOURCE=local 或 MODEL_SOURCE=aliyun
+"""
+
+import os
+
+os.environ.setdefault("MODEL_SOURCE", "stub")
+os.environ.setdefault("STUB_LLM_TTFT", "0")
+os.environ.setdefault("STUB_LLM_TPS", "0")
+# 共享缓存默认关闭，避免测试之间通过缓存文件相互影响；缓存相关测试自行开启
+os.environ.setdefault("SHARED_CACHE_PATH", "")
+# 历史记录存储默认关闭，相关测试使用临时数据库
+os.environ.setdefault("CHART_DB_PATH", "")
+# 管理接口未配置令牌时拒绝访问，测试使用固定的令牌
+os.environ.setdefault("ADMIN_TOKEN", "test-admin-token")
@@ -58,12 +58,12 @@ def test_fate_report(test_client):
     # 测试POST方法
     response = test_client.post("/api/fate_report", json=test_birth_info)
     assert response.status_code == 200
-    assert response.headers["content-type"] == "text/event-stream"
+    assert response.headers["content-type"].startswith("text/event-stream")
     
     # 测试GET方法
     response = test_client.get(f"/api/fate_report?data={json.dumps(test_birth_info)}")
     assert response.status_code == 200
-    assert response.headers["content-type"] == "text/event-stream"
+    assert response.headers["content-type"].startswith("text/event-stream")
 
 def test_invalid_input(test_client):
     """测试无效输入的错误处理"""
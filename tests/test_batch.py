@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试文件：测试批量排盘接口
+- JSON数组与NDJSON两种输入，结果按输入顺序返回，单条记录的错误写在该行中
+- 请求体与记录数的限制，以及在途块数对读取输入的背压
+"""
+
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from server.app import app
+from server.batch import BatchLimitError, iter_ndjson, read_json_array, stream_batch
+
+BIRTH = {"year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 0, "gender": "male"}
+OTHER = {"year": 1985, "month": 6, "day": 15, "hour": 8, "minute": 30, "gender": "female"}
+
+
+def parse_lines(text):
+    return [json.loads(line) for line in text.splitlines()]
+
+
+async def body_of(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def collect(agen):
+    async def run():
+        return [item async for item in agen]
+    return asyncio.run(run())
+
+
+def test_batch_array_and_ndjson():
+    """两种输入的结果一致，顺序与输入相同；无效记录返回该行的错误，不影响其他记录"""
+    client = TestClient(app)
+    single = client.post("/api/calculate_bazi", json=OTHER).json()
+
+    response = client.post("/api/calculate_bazi/batch", json=[BIRTH, {"year": 1990}, OTHER, BIRTH])
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = parse_lines(response.text)
+    assert [line["index"] for line in lines] == [0, 1, 2, 3]
+    assert lines[1]["error"]["status"] == 422
+    assert lines[2]["result"] == single
+    assert lines[0]["result"] == lines[3]["result"]
+
+    body = "\n".join([json.dumps(BIRTH), "", "not json", json.dumps(OTHER)])
+    ndjson = parse_lines(client.post("/api/calculate_bazi/batch", content=body,
+                                     headers={"Content-Type": "application/x-ndjson"}).text)
+    assert [line["index"] for line in ndjson] == [0, 1, 2]
+    assert ndjson[0]["result"] == lines[0]["result"] and ndjson[2]["result"] == single
+    assert ndjson[1]["error"]["status"] == 400
+
+    assert client.post("/api/calculate_bazi/batch", json=BIRTH).status_code == 400
+
+
+def test_limits_and_backpressure():
+    """超出限制：数组在返回前拒绝，NDJSON处理完已读记录后以一行错误结束；在途块数限制输入的读取"""
+    with pytest.raises(BatchLimitError):
+        asyncio.run(read_json_array(body_of(b"[1,2,3]"), max_records=2))
+    with pytest.raises(BatchLimitError):
+        asyncio.run(read_json_array(body_of(b"[1,", b"2,3]"), max_bytes=4))
+
+    def process(chunk):
+        return b"".join(b"%d\n" % index for index, _ in chunk)
+
+    records = iter_ndjson(body_of(b"{}\n{}\n", b"{}\n{}\n"), max_records=3)
+    lines = b"".join(collect(stream_batch(records, process, chunk_size=2))).splitlines()
+    assert lines[:3] == [b"0", b"1", b"2"]
+    assert json.loads(lines[3])["error"]["status"] == 413
+
+    pulled = []
+
+    async def numbered():
+        for i in range(100):
+            pulled.append(i)
+            yield i, {}
+
+    async def first_output():
+        stream = stream_batch(numbered(), process, chunk_size=5, max_inflight=2)
+        first = await stream.__anext__()
+        await stream.aclose()
+        return first
+
+    assert asyncio.run(first_output()) == b"0\n1\n2\n3\n4\n"
+    assert len(pulled) == 10
@@ -6,6 +6,7 @@
 - solar_to_lunar: 阳历转农历（静态方法）
 - lunar_to_solar: 农历转阳历（静态方法）
 - calculate_bazi_from_lunar: 农历日期计算八字（实例方法）
+- calculate_bazi_from_solar: 阳历日期计算八字（实例方法）
 """
 
 import pytest
@@ -121,11 +122,19 @@ class TestBaziCalculator:
     def test_calculate_bazi_from_solar(self):
         """测试阳历日期计算八字功能"""
         calculator = BaziCalculator()
+        # 2023年1月1日在立春之前，年柱仍为壬寅
         result1 = calculator.calculate_bazi_from_solar(
             solar_year=2023, 
             solar_month=1, 
             solar_day=1, 
+            hour=12, 
+            minute=0, 
+            gender='男'
         )
+        pillars = [result1[pillar][STEM] + result1[pillar][BRANCH] for pillar in (YEAR, MONTH, DAY, HOUR)]
+        assert pillars == ["壬寅", "壬子", "己未", "庚午"]
+        assert result1[HOUR][HIDDEN_STEM] == ["丁", "己"]
+        assert DECADE_PILLAR in result1
 
 if __name__ == "__main__":
     pytest.main(["-v", __file__]) 
\ No newline at end of file
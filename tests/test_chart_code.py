@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试文件：测试命盘编码
+- 编码与BaziInfo互相转换，结果与排盘引擎一致
+- 编码为32位整数，相等和哈希按编码比较
+- 无效的编码或命盘抛出ValueError
+"""
+
+import datetime
+import random
+
+import pytest
+
+from server.chart_code import STEMS, decode_chart, encode_chart, pillars_string
+from server.define import BaziInfo, Gender, SolarBirthInfo
+from server.fate_owner import FateOwner
+
+
+def random_charts(count: int, seed: int = 7):
+    rng = random.Random(seed)
+    for _ in range(count):
+        date = datetime.date(1900, 2, 1) + datetime.timedelta(days=rng.randrange(73000))
+        gender = rng.choice(["male", "female"])
+        birth = SolarBirthInfo(gender=gender, year=date.year, month=date.month, day=date.day,
+                               hour=rng.randrange(24), minute=rng.randrange(60))
+        fate_owner = FateOwner(gender=Gender.MALE if gender == "male" else Gender.FEMALE, solar_birth_info=birth)
+        yield fate_owner.gender, fate_owner.calculate_bazi()
+
+
+def test_round_trip():
+    """编码后解码得到与排盘引擎完全相同的八字信息"""
+    for gender, bazi_info in random_charts(60):
+        code = encode_chart(bazi_info, gender)
+        assert 0 <= code < 2 ** 32
+        assert code == bazi_info.chart_code
+        decoded = BaziInfo.from_chart_code(code)
+        assert decoded.model_dump() == bazi_info.model_dump()
+        assert pillars_string(code) == bazi_info.get_bazi_string()
+
+
+def test_equality_and_hash():
+    """相同命盘相等且哈希相同，可直接作为字典键；不同命盘的编码不同"""
+    charts = [bazi_info for _, bazi_info in random_charts(30, seed=11)]
+    copies = [BaziInfo.model_validate(bazi_info.model_dump()) for bazi_info in charts]
+    assert copies == charts
+    assert {bazi_info: i for i, bazi_info in enumerate(charts)}[copies[5]] == 5
+    assert len({bazi_info.chart_code for bazi_info in charts}) == len(charts)
+
+    # 修改字段后缓存的编码失效：时干换成不符合五鼠遁的天干后无法再编码
+    changed = copies[0].model_copy()
+    assert changed.chart_code == charts[0].chart_code
+    hour_stem = STEMS[(STEMS.index(changed.hour_pillar.heavenly_stem) + 2) % 10]
+    changed.hour_pillar = changed.hour_pillar.model_copy(update={"heavenly_stem": hour_stem})
+    with pytest.raises(ValueError):
+        changed.chart_code
+
+    # 无法编码的命盘按字段比较和哈希，同样可以放入集合
+    unencodable = [BaziInfo.model_validate({**bazi_info.model_dump(), "destiny_cycle": None}) for bazi_info in charts[:2]]
+    with pytest.raises(ValueError):
+        unencodable[0].chart_code
+    assert len({unencodable[0], unencodable[1], unencodable[0].model_copy()}) == 2
+
+
+def test_invalid():
+    """编码越界、命盘与性别或五鼠遁规则不符时抛出ValueError"""
+    gender, bazi_info = next(random_charts(1))
+    other = Gender.FEMALE if gender is Gender.MALE else Gender.MALE
+    with pytest.raises(ValueError):
+        encode_chart(bazi_info, other)
+    with pytest.raises(ValueError):
+        decode_chart(2 ** 32)
+
+    # 时干换成阴阳相同的另一个天干，不再符合五鼠遁
+    hour_stem = STEMS[(STEMS.index(bazi_info.hour_pillar.heavenly_stem) + 2) % 10]
+    broken = bazi_info.model_copy(update={"hour_pillar": bazi_info.hour_pillar.model_copy(update={"heavenly_stem": hour_stem})})
+    with pytest.raises(ValueError):
+        encode_chart(broken)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试文件：测试注入报告提示词的命盘事实
+- 大运年份与排盘引擎一致，流年干支和五行分值正确
+- 报告提示词包含命盘事实，系统消息不再要求模型自行排大运
+"""
+
+from server.bazi_calculator import BaziCalculator
+from server.chart_facts import element_scores, format_chart_facts, year_pillar_name
+from server.define import Gender, SolarBirthInfo
+from server.fate_owner import FateOwner
+from server.prompt_templates import BAZI_REPORT_SYSTEM_PROMPT, get_bazi_report_prompt
+
+BIRTH = SolarBirthInfo(gender="male", year=1990, month=1, day=1, hour=12, minute=0)
+
+
+def test_facts_match_engine():
+    """大运起始年份取自引擎的输出，当前大运和流年按当前年份标出"""
+    bazi_info = FateOwner(gender=Gender.MALE, solar_birth_info=BIRTH).calculate_bazi()
+    engine_cycles = BaziCalculator().calculate_bazi_from_solar(1990, 1, 1, 12, 0, "男")["da_yun"]["cycles"]
+
+    facts = format_chart_facts(bazi_info, BIRTH, 2026)
+    for cycle in engine_cycles:
+        year = cycle["year"]
+        assert f"| {cycle['tian_gan']}{cycle['di_zhi']}" in facts["chart_facts"]
+        assert f"| {year}-{year + 9} | {year - 1990}-{year - 1990 + 9} |" in facts["chart_facts"]
+    assert facts["current_dayun"] == "壬申"
+    assert facts["current_liunian"] == year_pillar_name(2026) == "丙午"
+    assert "2026丙午（当前）" in facts["chart_facts"]
+    assert "| 天干十神 | 伤官 | 比肩 | 日主 | 偏印 |" in facts["chart_facts"]
+
+    scores = element_scores(bazi_info)
+    assert sum(scores.values()) == 8
+    assert scores == {"木": 1.6, "火": 3.6, "土": 1.5, "金": 0.3, "水": 1.0}
+
+    assert format_chart_facts(bazi_info, BIRTH, 1991)["current_dayun"] == "未起运"
+
+
+def test_report_prompt_injects_facts():
+    """命盘事实放在用户消息中，系统消息只保留分析和写作要求"""
+    bazi_info = FateOwner(gender=Gender.MALE, solar_birth_info=BIRTH).calculate_bazi()
+    facts = format_chart_facts(bazi_info, BIRTH, 2026)
+    prompt = get_bazi_report_prompt({"gender": "male", "bazi": bazi_info.get_bazi_string(), "current_date": "2026年", **facts})
+
+    assert facts["chart_facts"] in prompt
+    assert "- 当前大运：壬申\n" in prompt
+    assert "- 当前流年：丙午\n" in prompt
+    assert "排出大运" not in BAZI_REPORT_SYSTEM_PROMPT
+    assert "地支藏干" not in BAZI_REPORT_SYSTEM_PROMPT
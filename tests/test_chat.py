@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试文件：测试多轮追问会话
+- 每轮请求带上会话上下文和此前的问答，回答完整生成后计入历史
+- 历史超出预算时较早的轮次被压缩为摘要，会话按LRU和空闲时间淘汰
+"""
+
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage
+
+import server.app as server_app
+from server.app import app
+from server.chat_sessions import ChatSessionStore
+from server.prompt_templates import BAZI_REPORT_SYSTEM_PROMPT, CHAT_FOLLOWUP_PROMPT, CHAT_SUMMARY_HEADER
+from server.stream_replay import report_streams
+
+test_birth_info = {"year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 0, "gender": "male"}
+
+
+class EchoModel:
+    """记录每次收到的消息，回答为"答"加上问题；摘要请求返回固定的摘要"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def astream(self, messages):
+        self.calls.append(messages)
+        for char in "答" + messages[-1].content:
+            yield AIMessageChunk(content=char)
+
+    async def ainvoke(self, messages):
+        self.calls.append(messages)
+        return AIMessage(content="<think>想想</think>问过五行")
+
+
+def message_text(response) -> str:
+    return "".join(json.loads(line[6:])["text"] for line in response.text.splitlines() if line.startswith("data: {\"text\""))
+
+
+def test_chat_session_keeps_history(monkeypatch):
+    """第二轮请求带上第一轮的问答，上下文前缀在各轮之间不变；未知会话返回404"""
+    model = EchoModel()
+    monkeypatch.setattr(report_streams, "resume_grace", 0)
+    monkeypatch.setattr(server_app, "get_chat_model", lambda model_source: model)
+    client = TestClient(app)
+
+    created = client.post("/api/chat", json=test_birth_info).json()
+    session_id = created["session_id"]
+    assert created["backend"] == "stub"
+
+    first = client.post(f"/api/chat/{session_id}", json={"message": "五行缺什么"})
+    assert first.status_code == 200
+    assert message_text(first) == "答五行缺什么"
+    second = client.post(f"/api/chat/{session_id}", json={"message": "适合什么工作"})
+    assert message_text(second) == "答适合什么工作"
+
+    prefix = model.calls[0][:-1]
+    assert prefix[0] == SystemMessage(content=BAZI_REPORT_SYSTEM_PROMPT)
+    assert prefix[-1].content == CHAT_FOLLOWUP_PROMPT
+    assert model.calls[1][:len(prefix)] == prefix
+    assert [m.content for m in model.calls[1][len(prefix):]] == ["五行缺什么", "答五行缺什么", "适合什么工作"]
+    assert client.get(f"/api/chat/{session_id}").json()["turns"] == 2
+
+    assert client.post(f"/api/chat/{session_id}", json={"message": ""}).status_code == 422
+    assert client.delete(f"/api/chat/{session_id}").json() == {"deleted": True}
+    assert client.post(f"/api/chat/{session_id}", json={"message": "还在吗"}).status_code == 404
+
+
+def test_history_budget_and_eviction(monkeypatch):
+    """超出预算时压缩较早的轮次、保留最近的轮次；会话数超过上限淘汰最久未用的，空闲超时的会话失效"""
+    store = ChatSessionStore(max_sessions=2, ttl=60)
+    context = [SystemMessage(content="系统"), HumanMessage(content="命主")]
+    session = store.create(None, "stub", context)
+    session.turns = [(f"问{i}", "答" * 40) for i in range(4)]
+
+    model = EchoModel()
+    assert not asyncio.run(session.compact(model, "新问题", budget=1000, keep_turns=2))
+    assert asyncio.run(session.compact(model, "新问题", budget=120, keep_turns=2))
+    assert session.summary == "问过五行"
+    assert [q for q, _ in session.turns] == ["问2", "问3"]
+    # 摘要请求与之前的轮次共享上下文前缀
+    assert model.calls[0][:2] == context and model.calls[0][3].content == "答" * 40
+    assert session.messages("新问题")[2] == SystemMessage(content=CHAT_SUMMARY_HEADER + "问过五行")
+
+    class BrokenModel:
+        async def ainvoke(self, messages):
+            raise RuntimeError("后端不可用")
+
+    session.turns += [("问4", "答" * 40)]
+    assert asyncio.run(session.compact(BrokenModel(), "新问题", budget=120, keep_turns=1))
+    assert session.summary == "问过五行\n用户还问过：问2；问3"
+
+    second = store.create("alice", "stub", context)
+    assert store.get(second.session_id) is None
+    assert store.get(session.session_id) is session
+    store.create(None, "stub", context)
+    assert store.get(second.session_id, "alice") is None and len(store) == 2
+
+    monkeypatch.setattr(store, "ttl", 0)
+    assert store.get(session.session_id) is None
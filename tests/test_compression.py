@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试文件：测试响应压缩
+- JSON按Accept-Encoding协商压缩，小响应不压缩，强ETag改为弱ETag
+- SSE流式压缩在事件边界flush，每个事件到达客户端时即可完整解压
+"""
+
+import asyncio
+import zlib
+
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from server.app import app
+from server.compression import CompressionMiddleware
+
+BIRTH = {"year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 0, "gender": "male"}
+
+
+def test_json_negotiation():
+    """接受gzip时压缩排盘结果，内容不变；不接受或响应太小时原样返回"""
+    client = TestClient(app)
+    plain = client.post("/api/calculate_bazi", json=BIRTH, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+
+    compressed = client.post("/api/calculate_bazi", json=BIRTH, headers={"Accept-Encoding": "gzip;q=1, br;q=0"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in compressed.headers["vary"]
+    assert int(compressed.headers["content-length"]) < len(plain.content)
+    assert compressed.content == plain.content
+    assert compressed.headers["etag"] == "W/" + plain.headers["etag"]
+
+    tiny = client.get("/api/test", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in tiny.headers
+
+
+def test_sse_flushes_at_event_boundaries():
+    """每个完整事件发出后立即可解压；半个事件留在压缩器中，凑齐后再发送"""
+    events = [f"event: message\ndata: {{\"text\": \"第{i}段命理分析\"}}\n\n".encode("utf-8") for i in range(5)]
+    pieces = [events[0], events[1][:10], events[1][10:], *events[2:]]
+
+    async def body():
+        for piece in pieces:
+            yield piece
+
+    async def endpoint(scope, receive, send):
+        await StreamingResponse(body(), media_type="text/event-stream")(scope, receive, send)
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def receive():
+        await asyncio.sleep(3600)
+
+    scope = {"type": "http", "method": "POST", "path": "/", "headers": [(b"accept-encoding", b"gzip")],
+             "asgi": {"spec_version": "2.4"}}
+    asyncio.run(CompressionMiddleware(endpoint)(scope, receive, send))
+
+    start, *chunks = sent
+    assert (b"content-encoding", b"gzip") in start["headers"]
+    assert not any(name == b"content-length" for name, _ in start["headers"])
+    decompressor = zlib.decompressobj(31)
+    received = [decompressor.decompress(chunk["body"]) for chunk in chunks]
+    assert received[:5] == events
+    assert b"".join(received) == b"".join(events)
+    assert chunks[-1]["more_body"] is False
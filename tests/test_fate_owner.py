@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试文件：测试FateOwner的排盘结果构建
+- 直接构建的BaziInfo与逐字段校验构建的结果一致
+- 干支柱和十神为共享且不可修改的实例
+"""
+
+import pytest
+from pydantic import ValidationError
+
+from server.define import BaziInfo, Gender, PillarInfo, SolarBirthInfo
+from server.fate_owner import PILLARS, FateOwner
+
+
+def make_owner(gender: str = "male") -> FateOwner:
+    birth = SolarBirthInfo(gender=gender, year=1990, month=1, day=1, hour=12, minute=0)
+    return FateOwner(gender=Gender.MALE if gender == "male" else Gender.FEMALE, solar_birth_info=birth)
+
+
+def test_matches_validated_model():
+    """跳过校验构建的结果与完整校验后的模型相同，序列化结果也相同"""
+    bazi_info = make_owner().calculate_bazi()
+    validated = BaziInfo.model_validate(bazi_info.model_dump())
+    assert validated.model_dump() == bazi_info.model_dump()
+    assert validated.model_dump_json() == bazi_info.model_dump_json()
+    assert bazi_info.get_bazi_string() == "己巳 丙子 丙寅 甲午"
+
+
+def test_flyweights_shared_and_frozen():
+    """不同命主的相同干支柱是同一个实例，且不可修改"""
+    first = make_owner("male").calculate_bazi()
+    second = make_owner("female").calculate_bazi()
+    assert len(PILLARS) == 60
+    assert first.day_pillar is second.day_pillar is PILLARS["丙", "寅"]
+    assert first.ten_gods["year"] is second.ten_gods["year"]
+    with pytest.raises(ValidationError):
+        first.day_pillar.heavenly_stem = "甲"
+    # 藏干和藏干十神是元组，不能就地修改共享实例
+    with pytest.raises(AttributeError):
+        first.day_pillar.hidden_stem.append("甲")
+    with pytest.raises(TypeError):
+        first.ten_gods["year"].hidden_stems[0] = "比肩"
+
+    # 未提供藏干时仍按地支补全
+    assert PillarInfo(heavenly_stem="甲", earthly_branch="寅").hidden_stem == ("甲", "丙", "戊")
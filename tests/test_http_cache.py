@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试文件：测试HTTP缓存语义
+- 排盘结果带确定的ETag和长期缓存头，GET形式的条件请求返回304且不排盘
+- 静态文件的指纹文件名、清单与预压缩变体
+"""
+
+import gzip
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import server.app as app_module
+from server.app import app
+from server.fate_owner import FateOwner
+from server.static_files import FingerprintedStaticFiles, precompress
+
+BIRTH = {"year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 0, "gender": "male"}
+
+
+def test_chart_etag_and_conditional_get(monkeypatch):
+    """POST与GET返回相同的内容和ETag；ETag随引擎版本变化；If-None-Match命中时返回304，不排盘"""
+    client = TestClient(app)
+    posted = client.post("/api/calculate_bazi", json=BIRTH)
+    fetched = client.get("/api/calculate_bazi", params=BIRTH)
+    assert fetched.status_code == 200 and fetched.content == posted.content
+    etag = fetched.headers["etag"]
+    assert posted.headers["etag"] == etag
+    assert "immutable" in fetched.headers["cache-control"]
+    assert client.get("/api/calculate_bazi", params={**BIRTH, "minute": 1}).headers["etag"] != etag
+
+    def fail(*args, **kwargs):
+        raise AssertionError("条件请求命中时不应排盘")
+
+    monkeypatch.setattr(FateOwner, "calculate_bazi", fail)
+    cached = client.get("/api/calculate_bazi", params=BIRTH, headers={"If-None-Match": f'W/"other", {etag}'})
+    assert cached.status_code == 304 and cached.content == b""
+    assert cached.headers["etag"] == etag
+
+    monkeypatch.setattr(app_module, "ENGINE_VERSION", "next")
+    assert app_module.chart_etag(app_module.SolarBirthInfo(**BIRTH)) != etag
+    assert client.get("/api/calculate_bazi", params={**BIRTH, "gender": "x", "year": 1800}).status_code == 422
+
+
+def test_fingerprinted_static_files(tmp_path):
+    """指纹地址长期缓存，原地址每次验证；客户端接受gzip时返回预压缩变体"""
+    script = "console.log('飞灵');\n" * 100
+    (tmp_path / "app.js").write_text(script, encoding="utf-8")
+    (tmp_path / "tiny.css").write_text("body{}", encoding="utf-8")
+    sizes = precompress(str(tmp_path))
+    assert sizes["app.js"]["gzip"] < sizes["app.js"]["original"] and "tiny.css" not in sizes
+
+    static_files = FingerprintedStaticFiles(directory=str(tmp_path))
+    static_app = FastAPI()
+    static_app.mount("/static", static_files)
+    client = TestClient(static_app)
+
+    fingerprinted = static_files.fingerprinted("app.js")
+    assert fingerprinted != "app.js" and fingerprinted.endswith(".js")
+    assert client.get("/static/manifest.json").json() == static_files.manifest
+
+    compressed = client.get(f"/static/{fingerprinted}", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.headers["vary"] == "Accept-Encoding"
+    assert compressed.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert compressed.headers["content-type"].startswith("text/javascript")
+    assert compressed.text == script
+
+    plain = client.get("/static/app.js", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers and plain.text == script
+    assert plain.headers["cache-control"] == "no-cache"
+    revalidated = client.get("/static/app.js", headers={"Accept-Encoding": "identity", "If-None-Match": plain.headers["etag"]})
+    assert revalidated.status_code == 304
+    assert client.get("/static/app.0000000000.js").status_code == 404
+    assert gzip.decompress((tmp_path / "app.js.gz").read_bytes()).decode("utf-8") == script
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试文件：测试多后端LLM路由
+使用本地桩模型作为后端，覆盖按延迟选择、首token前的failover、对冲请求和熔断
+"""
+
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessageChunk
+
+from server.llm_router import Backend, LLMRouter, FAILURE_THRESHOLD
+
+
+class StubBackendModel:
+    """本地桩后端：可配置首token延迟、输出内容和首token前失败"""
+
+    def __init__(self, text: str = "ok", first_token_delay: float = 0.0, fail: bool = False):
+        self.text = text
+        self.first_token_delay = first_token_delay
+        self.fail = fail
+        self.calls = 0
+        self.cancelled = False
+
+    async def astream(self, messages):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.first_token_delay)
+            if self.fail:
+                raise ConnectionError("backend unavailable")
+            for char in self.text:
+                yield AIMessageChunk(content=char)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+async def collect(router: LLMRouter) -> str:
+    return "".join([chunk.content async for chunk in router.astream([])])
+
+
+def test_routes_to_fastest_backend():
+    """积累TTFT统计后，请求发往EWMA最小的后端"""
+    slow = StubBackendModel("slow", first_token_delay=0.05)
+    fast = StubBackendModel("fast", first_token_delay=0.0)
+    router = LLMRouter([Backend("slow", slow), Backend("fast", fast)])
+
+    async def scenario():
+        # 先各探测一次，建立统计
+        await collect(router)
+        await collect(router)
+        return [await collect(router) for _ in range(3)]
+
+    assert asyncio.run(scenario()) == ["fast"] * 3
+
+
+def test_failover_before_first_token():
+    """首个后端在输出首token前失败时，由下一个后端接替"""
+    broken = StubBackendModel(fail=True)
+    healthy = StubBackendModel("healthy")
+    router = LLMRouter([Backend("broken", broken), Backend("healthy", healthy)])
+
+    assert asyncio.run(collect(router)) == "healthy"
+    assert broken.calls == 1
+    assert router.backends[0].stats.error_rate > 0
+
+
+def test_all_backends_fail():
+    """所有后端都失败时抛出最后一个错误"""
+    router = LLMRouter([Backend("a", StubBackendModel(fail=True)), Backend("b", StubBackendModel(fail=True))])
+    with pytest.raises(ConnectionError):
+        asyncio.run(collect(router))
+
+
+def test_hedged_request_wins_and_cancels_primary():
+    """主后端首token超时后发出对冲请求，先到者胜出，另一方被取消"""
+    stalled = StubBackendModel("stalled", first_token_delay=5)
+    backup = StubBackendModel("backup")
+    router = LLMRouter(
+        [Backend("stalled", stalled), Backend("backup", backup)],
+        hedge=True, hedge_min_delay=0.05, hedge_default_delay=0.05
+    )
+
+    assert asyncio.run(asyncio.wait_for(collect(router), timeout=2)) == "backup"
+    assert stalled.cancelled
+    assert router.backends[0].stats.in_flight == 0
+
+
+def test_unhealthy_backend_is_skipped():
+    """连续失败的后端被熔断，后续请求不再发往该后端"""
+    flaky = StubBackendModel(fail=True)
+    stable = StubBackendModel("stable", first_token_delay=0.01)
+    router = LLMRouter([Backend("flaky", flaky), Backend("stable", stable)])
+
+    async def scenario():
+        for _ in range(FAILURE_THRESHOLD):
+            # 让flaky保持最高优先级，直到熔断
+            router.backends[1].stats.ewma_ttft = 10.0
+            await collect(router)
+
+    asyncio.run(scenario())
+    calls = flaky.calls
+    assert not router.backends[0].stats.healthy
+    assert asyncio.run(collect(router)) == "stable"
+    assert flaky.calls == calls
+
+
+def test_pick_keeps_pinned_backend():
+    """固定的后端健康时继续使用，熔断后换到当前最优的后端"""
+    router = LLMRouter([Backend("a", StubBackendModel()), Backend("b", StubBackendModel())])
+    router.backends[0].stats.ewma_ttft = 1.0
+    assert router.pick().name == "b"
+    assert router.pick("a").name == "a"
+
+    router.backends[0].stats.open_until = float("inf")
+    assert router.pick("a").name == "b"
+
+
+def test_per_backend_concurrency_limit():
+    """每个后端的并发不超过其上限：较快的后端占满后请求发往其他后端，全部占满时等待槽位释放"""
+    fast = Backend("fast", StubBackendModel("fast", first_token_delay=0.02), max_concurrency=1)
+    slow = Backend("slow", StubBackendModel("slow", first_token_delay=0.02), max_concurrency=1)
+    fast.stats.ewma_ttft, slow.stats.ewma_ttft = 0.1, 1.0
+    router = LLMRouter([fast, slow])
+    assert router.max_concurrency == 2
+
+    async def scenario():
+        peak = {}
+
+        async def watch():
+            while True:
+                for backend in router.backends:
+                    peak[backend.name] = max(peak.get(backend.name, 0), backend.stats.in_flight)
+                await asyncio.sleep(0)
+
+        watcher = asyncio.create_task(watch())
+        results = await asyncio.gather(*[collect(router) for _ in range(3)])
+        watcher.cancel()
+        return results, peak
+
+    results, peak = asyncio.run(scenario())
+    assert sorted(results) == ["fast", "fast", "slow"]
+    assert peak == {"fast": 1, "slow": 1}
+    assert fast.stats.in_flight == slow.stats.in_flight == 0
+
+    # 固定后端的路由器与原路由器共享槽位
+    assert router.pinned(fast).backends == [fast]
+
+
+def test_ainvoke_concatenates_chunks():
+    """ainvoke汇总流式内容"""
+    router = LLMRouter([Backend("only", StubBackendModel("命理"))])
+    assert asyncio.run(router.ainvoke([])).content == "命理"
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
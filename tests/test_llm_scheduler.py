@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试文件：测试LLM任务调度
+- 每个后端的并发上限与优先级排队，占用多个槽位的任务
+- 队列已满时的准入控制（429 + Retry-After）
+- 任务状态查询接口与队列指标
+"""
+
+import asyncio
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server.app as server_app
+import server.llm_scheduler as llm_scheduler_module
+from server.app import app
+from server.llm_scheduler import LLMScheduler, JobStatus, Priority, QueueFullError, per_worker
+from server.metrics import registry
+
+
+def test_concurrency_limit_and_priority():
+    """超过并发上限的任务排队，高优先级任务先获得槽位"""
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=10)
+        running = scheduler.submit("local")
+        normal = scheduler.submit("local", Priority.NORMAL)
+        paid = scheduler.submit("local", Priority.HIGH)
+        statuses = (running.status, normal.status, paid.status)
+        positions = (scheduler.position(paid), scheduler.position(normal))
+
+        scheduler.finish(running)
+        after_first = (paid.status, normal.status)
+        scheduler.finish(paid)
+        return statuses, positions, after_first, normal.status
+
+    statuses, positions, after_first, last = asyncio.run(scenario())
+    assert statuses == (JobStatus.RUNNING, JobStatus.QUEUED, JobStatus.QUEUED)
+    assert positions == (0, 1)
+    assert after_first == (JobStatus.RUNNING, JobStatus.QUEUED)
+    assert last is JobStatus.RUNNING
+
+
+def test_multi_slot_jobs():
+    """占用多个槽位的任务等到槽位足够才开始，后面的任务不越过它；槽位数不超过并发上限"""
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=3, max_queue=10)
+        single = scheduler.submit("local")
+        sections = scheduler.submit("local", slots=3)
+        later = scheduler.submit("local")
+        queued = (sections.status, later.status)
+
+        scheduler.finish(single)
+        after_single = (sections.status, later.status, scheduler.stats()["local"]["running"])
+        scheduler.finish(sections)
+        oversized = scheduler.submit("local", slots=10)
+        return queued, after_single, later.status, oversized.slots
+
+    queued, after_single, later, oversized_slots = asyncio.run(scenario())
+    assert queued == (JobStatus.QUEUED, JobStatus.QUEUED)
+    assert after_single == (JobStatus.RUNNING, JobStatus.QUEUED, 3)
+    assert later is JobStatus.RUNNING
+    assert oversized_slots == 3
+
+
+def test_backends_are_independent():
+    """并发上限按后端分别计算"""
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=10)
+        return scheduler.submit("local").status, scheduler.submit("aliyun").status
+
+    assert asyncio.run(scenario()) == (JobStatus.RUNNING, JobStatus.RUNNING)
+
+
+def test_limits_split_across_workers(monkeypatch):
+    """整个服务的上限按worker数平分，每个worker至少为1"""
+    monkeypatch.setattr(llm_scheduler_module, "WEB_CONCURRENCY", 4)
+    assert per_worker(8) == 2
+    assert per_worker(2) == 1
+
+
+def test_router_pool_grows_with_backend_limits():
+    """调整并发上限后立即启动排队的任务"""
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=10)
+        scheduler.submit("router")
+        waiting = scheduler.submit("router")
+        before = waiting.status
+        scheduler.set_max_concurrency("router", 2)
+        return before, waiting.status
+
+    assert asyncio.run(scenario()) == (JobStatus.QUEUED, JobStatus.RUNNING)
+
+
+def test_queue_full_rejects_with_retry_after():
+    """排队任务数达到上限后拒绝新任务"""
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=1)
+        scheduler.submit("local")
+        scheduler.submit("local")
+        with pytest.raises(QueueFullError) as exc_info:
+            scheduler.submit("local")
+        return exc_info.value.retry_after
+
+    assert asyncio.run(scenario()) >= 1
+
+
+def test_cancelled_waiter_leaves_queue():
+    """等待中的任务被取消后移出队列，槽位交给后续任务"""
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=10)
+        running = scheduler.submit("local")
+        cancelled = scheduler.submit("local")
+        waiting = scheduler.submit("local")
+
+        waiter = asyncio.create_task(scheduler.wait(cancelled))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+        scheduler.finish(running)
+        await asyncio.wait_for(scheduler.wait(waiting), timeout=1)
+        return cancelled.status, waiting.status, scheduler.stats()["local"]["queued"]
+
+    assert asyncio.run(scenario()) == (JobStatus.CANCELLED, JobStatus.RUNNING, 0)
+
+
+def test_api_rejects_when_queue_full(monkeypatch):
+    """队列已满时报告接口返回429及Retry-After"""
+    scheduler = LLMScheduler(max_concurrency=1, max_queue=0)
+    monkeypatch.setattr(server_app, "llm_scheduler", scheduler)
+
+    async def occupy():
+        return scheduler.submit(os.environ.get("MODEL_SOURCE", "local"))
+
+    with TestClient(app) as client:
+        client.portal.call(occupy)
+        response = client.post("/api/fate_report", json={
+            "year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 0, "gender": "male"
+        })
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
+
+
+def test_job_status_api(monkeypatch):
+    """任务状态接口返回排队位置和状态"""
+    scheduler = LLMScheduler(max_concurrency=1, max_queue=10)
+    monkeypatch.setattr(server_app, "llm_scheduler", scheduler)
+
+    async def submit():
+        return scheduler.submit("local"), scheduler.submit("local")
+
+    with TestClient(app) as client:
+        running, queued = client.portal.call(submit)
+        response = client.get(f"/api/jobs/{queued.job_id}")
+        missing = client.get("/api/jobs/missing")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "queued"
+    assert data["position"] == 0
+    assert missing.status_code == 404
+
+
+def test_queue_metrics_exported():
+    """队列深度和等待时间以Prometheus格式导出"""
+    client = TestClient(app)
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert "llm_queue_depth" in response.text
+    assert "llm_queue_wait_seconds" in response.text
+    assert registry.get("llm_jobs_rejected_total") is not None
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试文件：测试流式命理报告在客户端断开时取消上游LLM生成
+使用本地桩模型代替真实LLM，直接通过ASGI接口驱动应用以模拟客户端断开
+另测试分节生成时多个流的按序合并，以及推理模型 <think> 内容的过滤
+"""
+
+import asyncio
+import json
+from typing import List
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessageChunk
+
+import server.app as server_app
+from server.app import app
+from server.llm_stream import ReasoningFilter, merge_ordered_streams, strip_reasoning
+from server.prompt_templates import REPORT_SECTIONS
+from server.stream_replay import report_streams
+
+# 测试数据
+test_birth_info = {
+    "year": 1990,
+    "month": 1,
+    "day": 1,
+    "hour": 12,
+    "minute": 0,
+    "gender": "male"
+}
+
+
+class StubChatModel:
+    """本地桩模型：按固定间隔逐个输出token，并记录实际生成数量和是否被取消"""
+
+    def __init__(self, num_tokens: int = 1000, token_delay: float = 0.01, first_token_delay: float = 0.0):
+        self.num_tokens = num_tokens
+        self.token_delay = token_delay
+        self.first_token_delay = first_token_delay
+        self.emitted = 0
+        self.cancelled = False
+        self.calls = 0
+
+    async def astream(self, messages):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.first_token_delay)
+            for _ in range(self.num_tokens):
+                await asyncio.sleep(self.token_delay)
+                self.emitted += 1
+                yield AIMessageChunk(content="命")
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+async def stream_fate_report(disconnect_after_events: int, last_event_id: str = None) -> List[str]:
+    """以ASGI方式请求流式报告，收到指定数量的message事件后模拟客户端断开
+
+    Args:
+        disconnect_after_events: 收到多少个message事件后断开
+        last_event_id: 断线重连时携带的Last-Event-ID
+
+    Returns:
+        客户端收到的SSE事件文本列表
+    """
+    body = json.dumps(test_birth_info).encode()
+    disconnected = asyncio.Event()
+    body_sent = False
+    received_events = 0
+    chunks = []
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal received_events
+        if message["type"] != "http.response.body":
+            return
+        chunk = message.get("body", b"").decode()
+        if not chunk:
+            return
+        chunks.append(chunk)
+        if "event: message" in chunk:
+            received_events += 1
+        if received_events >= disconnect_after_events:
+            disconnected.set()
+
+    headers = [(b"content-type", b"application/json")]
+    if last_event_id is not None:
+        headers.append((b"last-event-id", last_event_id.encode()))
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.4"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/api/fate_report",
+        "raw_path": b"/api/fate_report",
+        "query_string": b"",
+        "root_path": "",
+        "headers": headers,
+        "client": ("testclient", 50000),
+        "server": ("testserver", 80),
+    }
+    await asyncio.wait_for(app(scope, receive, send), timeout=5)
+    return chunks
+
+
+def count_messages(chunks: List[str]) -> int:
+    """统计message事件数"""
+    return sum("event: message" in chunk for chunk in chunks)
+
+
+@pytest.fixture
+def stub_llm(monkeypatch):
+    """将报告接口使用的模型替换为本地桩模型，并关闭断线续传的宽限期"""
+    monkeypatch.setattr(report_streams, "resume_grace", 0)
+
+    def install(**kwargs) -> StubChatModel:
+        model = StubChatModel(**kwargs)
+        monkeypatch.setattr(server_app, "get_chat_model", lambda model_source: model)
+        return model
+    return install
+
+
+def test_disconnect_cancels_generation(stub_llm):
+    """客户端在输出过程中断开后，上游生成应被取消"""
+    model = stub_llm(num_tokens=1000, token_delay=0.01)
+
+    async def scenario():
+        chunks = await stream_fate_report(disconnect_after_events=5)
+        await asyncio.sleep(0.1)
+        return count_messages(chunks), model.cancelled
+
+    received, cancelled = asyncio.run(scenario())
+    assert received >= 5
+    assert cancelled
+    assert model.emitted < model.num_tokens
+
+
+def test_disconnect_before_first_token(stub_llm):
+    """模型尚未输出首个token时客户端断开，也应及时取消上游生成"""
+    model = stub_llm(num_tokens=10, first_token_delay=30)
+
+    async def scenario():
+        chunks = await stream_fate_report(disconnect_after_events=0)
+        await asyncio.sleep(0.1)
+        return count_messages(chunks), model.cancelled
+
+    received, cancelled = asyncio.run(scenario())
+    assert received == 0
+    assert cancelled
+    assert model.emitted == 0
+
+
+def test_stream_completes_without_disconnect(stub_llm):
+    """客户端保持连接时，应完整输出所有内容"""
+    model = stub_llm(num_tokens=20, token_delay=0)
+    chunks = asyncio.run(stream_fate_report(disconnect_after_events=10**6))
+
+    assert count_messages(chunks) == 20
+    assert "event: end" in chunks[-1]
+    assert not model.cancelled
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
+
+
+def test_merge_ordered_streams():
+    """各流并行生成、按顺序输出：总耗时接近最慢的流，并发数不超过上限，未结束的流在合并中止时被取消"""
+    running, peak, cancelled = 0, 0, []
+
+    async def section(name: str, tokens: int, delay: float):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            for i in range(tokens):
+                await asyncio.sleep(delay)
+                yield f"{name}{i}"
+        except asyncio.CancelledError:
+            cancelled.append(name)
+            raise
+        finally:
+            running -= 1
+
+    async def merged(max_concurrency):
+        # 后面的节更快结束，输出仍按顺序
+        streams = [section("甲", 5, 0.02), section("乙", 5, 0.01), section("丙", 5, 0.005)]
+        started_at = asyncio.get_running_loop().time()
+        items = [item async for item in merge_ordered_streams(streams, max_concurrency, separator="|")]
+        return items, asyncio.get_running_loop().time() - started_at
+
+    items, elapsed = asyncio.run(merged(3))
+    assert items == [f"甲{i}" for i in range(5)] + ["|"] + [f"乙{i}" for i in range(5)] + ["|"] + [f"丙{i}" for i in range(5)]
+    assert peak == 3
+    assert elapsed < 0.1 + 0.05 + 0.025
+
+    peak = 0
+    items, _ = asyncio.run(merged(2))
+    assert peak == 2
+    assert items[0] == "甲0" and items[-1] == "丙4"
+
+    async def close_early():
+        merge = merge_ordered_streams([section("甲", 5, 0.01), section("乙", 100, 0.01)], 2)
+        assert await merge.__anext__() == "甲0"
+        await merge.aclose()
+        await asyncio.sleep(0.05)
+
+    asyncio.run(close_early())
+    assert "乙" in cancelled
+
+
+def test_sections_report(stub_llm):
+    """mode=sections时每节单独请求模型，各节按顺序拼接；无效的生成方式返回400"""
+    model = stub_llm(num_tokens=3, token_delay=0.001)
+    client = TestClient(app)
+    response = client.post("/api/fate_report?mode=sections", json=test_birth_info)
+    assert response.status_code == 200
+    text = "".join(json.loads(line[6:])["text"] for line in response.text.splitlines() if line.startswith("data: {\"text\""))
+    assert model.calls == len(REPORT_SECTIONS)
+    assert text == "\n\n".join(["命命命"] * len(REPORT_SECTIONS))
+
+    assert client.post("/api/fate_report?mode=bogus", json=test_birth_info).status_code == 400
+
+
+def test_sections_reasoning_filtered_per_section(monkeypatch):
+    """分节生成时每节分别过滤推理内容：某节的<think>没有闭合，后面章节的正文仍正常输出"""
+    class SectionModel:
+        def __init__(self):
+            self.calls = 0
+
+        async def astream(self, messages):
+            self.calls += 1
+            pieces = ["<think>推理被截断"] if self.calls == 1 else ["<think>想", "</think>", f"第{self.calls}节"]
+            for piece in pieces:
+                yield AIMessageChunk(content=piece)
+
+    monkeypatch.setattr(report_streams, "resume_grace", 0)
+    monkeypatch.setattr(server_app, "get_chat_model", lambda model_source: SectionModel())
+    response = TestClient(app).post("/api/fate_report?mode=sections", json=test_birth_info)
+    text = "".join(json.loads(line[6:])["text"] for line in response.text.splitlines() if line.startswith("data: {\"text\""))
+    expected = [""] + [f"第{i}节" for i in range(2, len(REPORT_SECTIONS) + 1)]
+    assert text == "\n\n".join(expected)
+    assert "推理" not in text
+
+
+def test_reasoning_filter_split_tags():
+    """标签被拆在任意位置时都能正确区分推理内容和正文，正文开头的空行去掉"""
+    text = "<think>先看日主\n</think>\n\n## 命盘<b>概述</b>"
+    for size in range(1, len(text) + 1):
+        reasoning_filter = ReasoningFilter()
+        parts = []
+        for i in range(0, len(text), size):
+            parts += reasoning_filter.feed(text[i:i + size])
+        parts += reasoning_filter.flush()
+        assert "".join(t for is_reasoning, t in parts if is_reasoning) == "先看日主\n"
+        assert "".join(t for is_reasoning, t in parts if not is_reasoning) == "## 命盘<b>概述</b>"
+    assert strip_reasoning("没有推理内容<thi") == "没有推理内容<thi"
+
+
+def test_reasoning_routed_to_event(monkeypatch, stub_llm):
+    """REPORT_REASONING=event时推理内容作为reasoning事件发送，正文不含推理内容，并记录首个可见token的时间"""
+    class ThinkingModel:
+        async def astream(self, messages):
+            for piece in ["<th", "ink>推", "理</thi", "nk>\n\n正", "文"]:
+                yield AIMessageChunk(content=piece)
+
+    monkeypatch.setattr(report_streams, "resume_grace", 0)
+    monkeypatch.setattr(server_app, "get_chat_model", lambda model_source: ThinkingModel())
+    monkeypatch.setattr(server_app, "REPORT_REASONING", "event")
+    response = TestClient(app).post("/api/fate_report", json=test_birth_info)
+
+    events = [block.split("\n") for block in response.text.split("\n\n") if block.strip()]
+    data = {name: [] for name in ("reasoning", "message")}
+    for lines in events:
+        name = next(line[7:] for line in lines if line.startswith("event: "))
+        if name in data:
+            data[name].append(json.loads(next(line[6:] for line in lines if line.startswith("data: ")))["text"])
+    assert "".join(data["reasoning"]) == "推理"
+    assert "".join(data["message"]) == "正文"
+    assert "llm_time_to_first_visible_token_seconds" in TestClient(app).get("/metrics").text
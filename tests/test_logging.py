@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试文件：测试结构化日志
+- JSON格式与请求ID
+- 按代码位置限速
+- 访问日志中的阶段耗时
+"""
+
+import io
+import json
+import logging
+
+from fastapi.testclient import TestClient
+
+from server.app import app
+from server.logging_config import RateLimitFilter, build_queue_handler, request_id_var
+
+BIRTH = {"year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 0, "gender": "male"}
+
+
+def test_json_output_through_queue():
+    """日志经队列在后台线程写出为JSON，带请求ID、附加字段和异常信息"""
+    stream = io.StringIO()
+    handler, listener = build_queue_handler("json", stream, rate_limit=0)
+    logger = logging.getLogger("test.logging.json")
+    logger.addHandler(handler)
+    logger.propagate = False
+    listener.start()
+    token = request_id_var.set("req-1")
+    try:
+        logger.warning("排盘耗时 %.1fms", 12.34, extra={"stage": "charting"})
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            logger.error("失败", exc_info=True)
+    finally:
+        request_id_var.reset(token)
+        listener.stop()
+        logger.removeHandler(handler)
+
+    first, second = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert first["message"] == "排盘耗时 12.3ms"
+    assert first["request_id"] == "req-1"
+    assert first["stage"] == "charting"
+    assert "ZeroDivisionError" in second["exc_info"]
+
+
+def test_rate_limit_per_call_site():
+    """同一位置超过速率的INFO日志被丢弃，丢弃条数附在下一条输出上；WARNING不限速"""
+    rate_filter = RateLimitFilter(rate=1, burst=2)
+
+    def record(level=logging.INFO, lineno=10):
+        return logging.LogRecord("test", level, "app.py", lineno, "msg", (), None)
+
+    passed = [rate_filter.filter(record()) for _ in range(5)]
+    assert passed == [True, True, False, False, False]
+    assert rate_filter.filter(record(lineno=11))
+    assert all(rate_filter.filter(record(logging.WARNING)) for _ in range(5))
+    access = logging.LogRecord("server.access", logging.INFO, "app.py", 10, "msg", (), None)
+    assert all(rate_filter.filter(access) for _ in range(5))
+
+    rate_filter._buckets[("app.py", 10)][0] = 1
+    resumed = record()
+    assert rate_filter.filter(resumed)
+    assert resumed.suppressed == 3
+
+
+def test_request_id_and_access_log(caplog):
+    """沿用请求头中的请求ID，访问日志包含各阶段耗时"""
+    client = TestClient(app)
+    with caplog.at_level(logging.INFO, logger="server.access"):
+        response = client.post("/api/calculate_bazi", json=BIRTH, headers={"X-Request-Id": "trace-42"})
+        generated = client.get("/api/test")
+
+    assert response.headers["x-request-id"] == "trace-42"
+    assert len(generated.headers["x-request-id"]) == 32
+    access = [r for r in caplog.records if r.name == "server.access" and r.path == "/api/calculate_bazi"]
+    assert access and access[-1].status == 200
+    assert {"validation", "charting"} <= set(access[-1].stages)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试文件：测试内存诊断
+- 缓存登记与占用统计
+- tracemalloc开关、分配热点与快照差异
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server.admin as admin
+from server.app import app
+from server.memory import CacheRegistry, approx_size, memory_tracer
+
+
+@pytest.fixture
+def client():
+    yield TestClient(app, headers={"X-Admin-Token": admin.ADMIN_TOKEN})
+    memory_tracer.stop()
+
+
+def test_cache_registry():
+    """登记的缓存按名称返回统计，统计失败不影响其他缓存"""
+    registry = CacheRegistry()
+    data = {i: "x" * 100 for i in range(10)}
+    registry.register("data", lambda: {"entries": len(data), "bytes": approx_size(data)})
+    registry.register("broken", lambda: 1 / 0)
+    with pytest.raises(ValueError):
+        registry.register("data", dict)
+
+    stats = registry.stats()
+    assert stats["data"]["entries"] == 10
+    assert stats["data"]["bytes"] > 10 * 100
+    assert "error" in stats["broken"]
+
+
+def test_builtin_caches_registered(client):
+    """报告流缓冲区、任务记录和剖析结果都已登记"""
+    caches = client.get("/admin/memory/caches").json()
+    for name in ("report_streams", "llm_jobs", "profiles"):
+        assert {"entries", "bytes"} <= set(caches[name])
+
+
+def test_tracemalloc_lifecycle(client):
+    """开启tracemalloc后可查询分配热点和快照差异，关闭后接口返回409"""
+    assert client.get("/admin/memory/top").status_code == 409
+
+    assert client.post("/admin/memory/tracemalloc/start", params={"frames": 1000}).status_code == 422
+    assert client.post("/admin/memory/tracemalloc/start", params={"frames": 5}).json()["tracing"] is True
+    retained = [bytearray(1024) for _ in range(2000)]  # noqa: F841  制造约2MB的分配
+
+    top = client.get("/admin/memory/top", params={"limit": 5}).json()
+    assert top and {"file", "line", "size", "count"} <= set(top[0])
+
+    diff = client.get("/admin/memory/diff", params={"limit": 5}).json()
+    assert any(entry["size_diff"] >= 1024 * 2000 and entry["file"].endswith("test_memory.py") for entry in diff)
+    assert client.get("/admin/memory/diff", params={"group_by": "bogus"}).status_code == 400
+
+    summary = client.get("/admin/memory").json()
+    assert summary["traced_bytes"] > 0 and "caches" in summary
+
+    assert client.post("/admin/memory/tracemalloc/stop").json()["tracing"] is False
+    assert client.get("/admin/memory/diff").status_code == 409
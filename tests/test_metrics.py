@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试文件：测试运行指标
+- 直方图计时与Prometheus文本导出
+- 各接口请求阶段的耗时与错误计数
+- 从模型响应元数据中采集的首token时间、生成速度和后端耗时
+- 多线程记录与导出
+"""
+
+import os
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from server.app import app
+from server.metrics import MetricsRegistry, registry
+
+BIRTH = {"year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 0, "gender": "male"}
+
+
+def sample_value(name: str, **labels) -> float:
+    """从全局注册表中读取指标的当前值，没有该样本时返回0"""
+    metric_name = name
+    for suffix in ("_count", "_sum"):
+        if name.endswith(suffix) and registry.get(name[:-len(suffix)]) is not None:
+            metric_name = name[:-len(suffix)]
+    metric = registry.get(metric_name)
+    key = tuple(str(labels[n]) for n in metric.labelnames)
+    child = metric._children.get(key)
+    if child is None:
+        return 0
+    if name.endswith("_count"):
+        return child.count
+    if name.endswith("_sum"):
+        return child.sum
+    return child.value
+
+
+def test_histogram_timer_and_render():
+    """计时器把耗时记入直方图，导出累积分桶"""
+    metrics = MetricsRegistry()
+    histogram = metrics.histogram("stage_seconds", "阶段耗时", ["stage"], buckets=(0.01, 1))
+    with histogram.labels("charting").time():
+        time.sleep(0.02)
+
+    text = metrics.render()
+    assert 'stage_seconds_bucket{stage="charting",le="0.01"} 0' in text
+    assert 'stage_seconds_bucket{stage="charting",le="+Inf"} 1' in text
+    assert 'stage_seconds_count{stage="charting"} 1' in text
+
+
+def test_request_stage_metrics():
+    """排盘接口记录各阶段耗时，参数校验失败计入validation错误"""
+    before_charting = sample_value("request_stage_seconds_count", endpoint="calculate_bazi", stage="charting")
+    before_errors = sample_value("request_errors_total", endpoint="calculate_bazi", stage="validation")
+
+    client = TestClient(app)
+    assert client.post("/api/calculate_bazi", json=BIRTH).status_code == 200
+    assert client.post("/api/calculate_bazi", json={**BIRTH, "month": 13}).status_code == 422
+
+    assert sample_value("request_stage_seconds_count", endpoint="calculate_bazi", stage="charting") == before_charting + 1
+    assert sample_value("request_errors_total", endpoint="calculate_bazi", stage="validation") == before_errors + 1
+    text = client.get("/metrics").text
+    assert 'request_stage_seconds_count{endpoint="calculate_bazi",stage="validation"}' in text
+
+
+def test_llm_metrics_from_response_metadata():
+    """生成结束后记录首token时间、生成速度、token数和后端报告的各阶段耗时"""
+    backend = os.environ.get("MODEL_SOURCE", "local")
+    before_ttft = sample_value("llm_time_to_first_token_seconds_count", backend=backend)
+    before_tokens = sample_value("llm_output_tokens_total", backend=backend)
+
+    with TestClient(app) as client:
+        with client.stream("POST", "/api/fate_report", json=BIRTH) as response:
+            body = "".join(response.iter_text())
+        assert "event: end" in body
+        assert client.post("/api/basic_report", json=BIRTH).status_code == 200
+
+    assert sample_value("llm_time_to_first_token_seconds_count", backend=backend) == before_ttft + 1
+    assert sample_value("llm_output_tokens_total", backend=backend) > before_tokens
+    assert sample_value("llm_backend_duration_seconds_count", backend=backend, phase="total") >= 2
+    assert sample_value("request_stage_seconds_count", endpoint="basic_report", stage="llm") >= 1
+    assert sample_value("request_stage_seconds_count", endpoint="fate_report", stage="prompt_build") >= 1
+
+
+def test_concurrent_recording_and_render():
+    """多个线程同时新增子指标、累加和导出，不丢失更新，导出不因字典变化而失败"""
+    metrics = MetricsRegistry()
+    counter = metrics.counter("threads_total", "并发测试", ["worker", "i"])
+    histogram = metrics.histogram("threads_seconds", "并发测试", ["worker"])
+    n, workers = 2000, 4
+    errors = []
+
+    def record(worker: int):
+        for i in range(n):
+            counter.labels(worker, i % 50).inc()
+            histogram.labels(worker).observe(0.001)
+
+    def render():
+        try:
+            for _ in range(50):
+                metrics.render()
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=record, args=(w,)) for w in range(workers)] + [threading.Thread(target=render)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert sum(child.value for child in counter._children.values()) == n * workers
+    assert sum(child.count for child in histogram._children.values()) == n * workers
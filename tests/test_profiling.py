@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试文件：测试请求级性能剖析
+- 按请求头和按比例采样触发剖析
+- cprofile模式导出pstats，sample模式导出折叠栈
+- 管理接口列出和下载剖析结果
+"""
+
+import marshal
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server.admin as admin
+from server.app import app
+from server.profiling import ProfileStore, ProfilingMiddleware, profile_store
+
+ADMIN_HEADERS = {"X-Admin-Token": admin.ADMIN_TOKEN}
+BIRTH = {"year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 0, "gender": "male"}
+
+
+@pytest.fixture(autouse=True)
+def clear_profiles():
+    profile_store.clear()
+    yield
+    profile_store.clear()
+
+
+def test_profile_on_header_with_cprofile():
+    """带X-Profile请求头的请求被剖析，结果包含排盘调用并可下载为pstats"""
+    client = TestClient(ProfilingMiddleware(app, mode="cprofile", sample_every=0), headers=ADMIN_HEADERS)
+    plain = client.post("/api/calculate_bazi", json=BIRTH)
+    response = client.post("/api/calculate_bazi", json=BIRTH, headers={"X-Profile": "1"})
+
+    assert "x-profile-id" not in plain.headers
+    profile_id = response.headers["x-profile-id"]
+
+    listing = client.get("/admin/profiles").json()
+    assert [p["profile_id"] for p in listing] == [profile_id]
+    assert listing[0]["path"] == "/api/calculate_bazi"
+    assert listing[0]["status"] == 200
+
+    text = client.get(f"/admin/profiles/{profile_id}").text
+    assert "calculate_bazi" in text
+
+    raw = client.get(f"/admin/profiles/{profile_id}", params={"format": "pstats"}).content
+    functions = {name for _, _, name in marshal.loads(raw)}
+    assert "_calculate_bazi" in functions
+
+    assert client.get(f"/admin/profiles/{profile_id}", params={"format": "collapsed"}).status_code == 400
+    assert client.get("/admin/profiles/missing").status_code == 404
+
+
+def test_sampled_profiles_with_collapsed_stacks():
+    """按比例采样，sample模式输出折叠栈；只保留最近K份结果"""
+    store = ProfileStore(keep=2)
+    client = TestClient(ProfilingMiddleware(app, store=store, mode="sample", sample_every=2, sample_interval=0.001), headers=ADMIN_HEADERS)
+    for _ in range(6):
+        client.post("/api/calculate_bazi", json=BIRTH)
+
+    profiles = store.list()
+    assert len(profiles) == 2
+    collapsed = profiles[0].to_collapsed()
+    assert collapsed
+    stack, count = collapsed.splitlines()[0].rsplit(" ", 1)
+    assert int(count) >= 1 and ";" in stack
+    with pytest.raises(ValueError):
+        profiles[0].to_pstats()
+
+
+def test_admin_token(monkeypatch):
+    """管理接口需要令牌；未配置ADMIN_TOKEN时一律拒绝"""
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", "secret")
+    client = TestClient(app)
+    assert client.get("/admin/profiles").status_code == 403
+    assert client.get("/admin/profiles", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.get("/admin/profiles", headers={"X-Admin-Token": "secret"}).status_code == 200
+
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", None)
+    assert client.get("/admin/profiles").status_code == 403
+    assert client.get("/admin/profiles", headers={"X-Admin-Token": ""}).status_code == 403
+    assert client.post("/admin/memory/tracemalloc/start", params={"frames": 1000}).status_code == 403
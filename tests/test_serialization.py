@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试文件：测试排盘结果的JSON序列化
+- 预编码片段拼出的响应与原先由字典编码的响应逐字节一致
+- 未安装 orjson 时退回标准库，输出不变
+"""
+
+import random
+from datetime import date, timedelta
+
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+import server.serialization as serialization
+from server.app import app
+from server.define import Gender, SolarBirthInfo
+from server.fate_owner import FateOwner
+from server.serialization import encode_chart_list, encode_chart_response
+
+
+def chart_dict(birth_info, fate_owner, bazi_info):
+    """原先排盘接口返回的字典"""
+    return {
+        "solar_date": str(birth_info),
+        "lunar_date": str(fate_owner.lunar_birth_info) if fate_owner.lunar_birth_info else None,
+        "bazi_string": bazi_info.get_bazi_string(),
+        "chart_code": bazi_info.chart_code,
+        "five_elements": bazi_info.five_elements,
+        "pillars": {
+            name: {"heavenly_stem": pillar.heavenly_stem, "earthly_branch": pillar.earthly_branch}
+            for name, pillar in (("year", bazi_info.year_pillar), ("month", bazi_info.month_pillar),
+                                 ("day", bazi_info.day_pillar), ("hour", bazi_info.hour_pillar))
+        },
+        "ten_gods": {
+            pillar: {"heavenly_stem": god.heavenly_stem, "earthly_branch": god.earthly_branch}
+            for pillar, god in bazi_info.ten_gods.items()
+        }
+    }
+
+
+def sample_charts(n, seed=7):
+    rng = random.Random(seed)
+    for _ in range(n):
+        day = date(1900, 1, 1) + timedelta(days=rng.randrange(200 * 365))
+        gender = rng.choice([Gender.MALE, Gender.FEMALE])
+        birth_info = SolarBirthInfo(year=day.year, month=day.month, day=day.day, hour=rng.randrange(24),
+                                    minute=rng.randrange(60), gender=gender)
+        fate_owner = FateOwner(gender=gender, solar_birth_info=birth_info)
+        yield birth_info, fate_owner, fate_owner.calculate_bazi()
+
+
+def test_matches_dict_encoding(monkeypatch):
+    """随机命盘的编码结果与 JSONResponse 编码原字典逐字节一致，标准库退路也一样"""
+    charts = list(sample_charts(50))
+    expected = [JSONResponse(chart_dict(*chart)).body for chart in charts]
+    encoded = [encode_chart_response(str(b), str(f.lunar_birth_info), bazi) for b, f, bazi in charts]
+    assert encoded == expected
+    assert encode_chart_list(encoded) == JSONResponse([chart_dict(*chart) for chart in charts]).body
+
+    monkeypatch.setattr(serialization, "orjson", None)
+    birth_info, fate_owner, bazi_info = charts[0]
+    assert encode_chart_response(str(birth_info), str(fate_owner.lunar_birth_info), bazi_info) == expected[0]
+
+
+def test_calculate_bazi_response():
+    """排盘接口返回预编码的字节串，内容类型仍为JSON"""
+    birth = {"year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 0, "gender": "male"}
+    response = TestClient(app).post("/api/calculate_bazi", json=birth, headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    body = response.json()
+    assert body["bazi_string"] == "己巳 丙子 丙寅 甲午"
+    assert body["pillars"]["year"] == {"heavenly_stem": "己", "earthly_branch": "巳"}
+    assert body["ten_gods"]["year"] == {"heavenly_stem": "伤官", "earthly_branch": "比肩"}
+    assert int(response.headers["content-length"]) == len(response.content)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试文件：测试跨进程共享缓存
+- 多个连接（模拟多个worker）之间共享读写、过期与淘汰
+- 排盘结果命中缓存时跳过排盘，响应不变
+- 报告命中缓存时直接回放，不调用模型
+- 写入在后台线程执行，数据库被锁住时读取很快按未命中返回
+"""
+
+import json
+import multiprocessing
+import sqlite3
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server.app as app_module
+from server.app import app
+from server.fate_owner import FateOwner
+from server.shared_cache import SharedCache
+
+BIRTH = {"year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 0, "gender": "male"}
+
+
+def _write_from_other_process(path: str) -> None:
+    cache = SharedCache(path, "chart", ttl=60)
+    cache.set_json("key", {"from": "worker"})
+    cache.flush()
+
+
+def report_text(body: str) -> str:
+    events = [json.loads(line[len("data: "):]) for line in body.splitlines() if line.startswith("data: ")]
+    return "".join(event.get("text", "") for event in events)
+
+
+@pytest.fixture
+def caches(tmp_path, monkeypatch):
+    """为应用开启基于临时文件的排盘和报告缓存"""
+    path = str(tmp_path / "cache.sqlite3")
+    chart_cache = SharedCache(path, "chart", ttl=60)
+    report_cache = SharedCache(path, "report", ttl=60)
+    monkeypatch.setattr(app_module, "chart_cache", chart_cache)
+    monkeypatch.setattr(app_module, "report_cache", report_cache)
+    return chart_cache, report_cache
+
+
+def test_shared_between_processes(tmp_path):
+    """另一个进程写入的条目可以读到；命名空间相互隔离，过期条目不返回且会被清理"""
+    path = str(tmp_path / "cache.sqlite3")
+    process = multiprocessing.get_context("spawn").Process(target=_write_from_other_process, args=(path,))
+    process.start()
+    process.join(30)
+
+    cache = SharedCache(path, "chart", ttl=60, max_entries=3)
+    assert cache.get_json("key") == {"from": "worker"}
+    assert SharedCache(path, "report", ttl=60).get("key") is None
+
+    for i in range(5):
+        cache.set(f"k{i}", b"v")
+    cache.flush()
+    assert cache.prune() == 3
+    assert cache.stats()["entries"] == 3 and cache.get("k4") == b"v"
+
+    expiring = SharedCache(path, "short", ttl=0.01)
+    expiring.set("k", b"v")
+    expiring.flush()
+    time.sleep(0.02)
+    assert expiring.get("k") is None
+    assert expiring.prune() == 1
+
+    disabled = SharedCache("", "chart", ttl=60)
+    disabled.set("k", b"v")
+    assert disabled.get("k") is None and disabled.stats()["entries"] == 0
+
+
+def test_chart_cache_hit_skips_charting(caches, monkeypatch):
+    """同一出生信息第二次请求命中缓存，不再排盘，响应与首次一致"""
+    calls = []
+    original = FateOwner.calculate_bazi
+    monkeypatch.setattr(FateOwner, "calculate_bazi", lambda self, engine=None: calls.append(1) or original(self, engine))
+    client = TestClient(app)
+
+    first = client.post("/api/calculate_bazi", json=BIRTH)
+    caches[0].flush()
+    second = client.post("/api/calculate_bazi", json=BIRTH)
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+    assert len(calls) == 1
+    assert caches[0].hits == 1
+
+
+def test_report_cache_replays_without_llm(caches, monkeypatch):
+    """报告生成一次后写入缓存，之后的相同请求直接回放，不再调用模型"""
+    client = TestClient(app)
+    first = client.post("/api/fate_report", json=BIRTH).text
+    caches[1].flush()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("命中缓存时不应调用模型")
+
+    monkeypatch.setattr(app_module, "get_chat_model", fail)
+    second = client.post("/api/fate_report", json=BIRTH).text
+    assert report_text(first) and report_text(first) == report_text(second)
+    assert '"cached": true' in second
+    assert caches[1].hits == 1
+
+
+def test_locked_database_does_not_block(tmp_path):
+    """数据库被其他进程锁住时，读取等锁不超过busy_timeout即按未命中返回；写入在后台线程等锁，解锁后写入"""
+    path = str(tmp_path / "cache.sqlite3")
+    holder = sqlite3.connect(path, isolation_level=None)
+    holder.execute("BEGIN EXCLUSIVE")
+
+    cache = SharedCache(path, "chart", ttl=60, busy_timeout=0.05)
+    started_at = time.perf_counter()
+    assert cache.get("key") is None
+    assert time.perf_counter() - started_at < 1
+    assert cache.busy == 1 and cache.errors == 0
+
+    started_at = time.perf_counter()
+    cache.set("key", b"v")
+    assert time.perf_counter() - started_at < 1
+    holder.execute("ROLLBACK")
+    cache.flush()
+    assert cache.get("key") == b"v"
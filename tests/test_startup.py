@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试文件：测试启动开销
+- 导入应用时不加载langchain及模型客户端
+- 提示词模板不依赖langchain
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+from server.prompt_templates import get_bazi_report_prompt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_app_import_is_lazy():
+    """导入server.app后langchain/openai/ollama均未加载，首次创建消息时才导入"""
+    code = (
+        "import json, sys\n"
+        "import server.app\n"
+        "before = sorted(m for m in sys.modules if m.split('.')[0] in ('langchain', 'langchain_core', 'langchain_openai', 'langchain_ollama', 'openai', 'ollama'))\n"
+        "from server.model import build_messages\n"
+        "messages = build_messages('测试')\n"
+        "print(json.dumps({'before': before, 'after': 'langchain_core' in sys.modules, 'type': type(messages[0]).__name__}))\n"
+    )
+    env = {**os.environ, "SHARED_CACHE_PATH": ""}
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    assert result == {"before": [], "after": True, "type": "HumanMessage"}
+
+
+def test_bazi_report_prompt():
+    """提示词按字段填充，未提供的字段为空"""
+    prompt = get_bazi_report_prompt({"gender": "female", "lunar_date": "农历1990年腊月初五 12:00", "bazi": "己巳 丙子 丙寅 甲午"})
+    assert "- 四柱八字: 己巳 丙子 丙寅 甲午" in prompt
+    assert "- 性别: 女" in prompt
+    assert "- 出生日期: 农历1990年腊月初五 12:00" in prompt
+    assert "- 当前大运：\n" in prompt
+    assert "{" not in prompt
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试文件：测试命盘与报告的持久化存储
+- 后台批量写入、压缩存储、按用户查询与翻页
+- 历史记录接口直接读取保存的结果，不排盘也不调用模型
+- 未配置数据库路径时不保存任何记录
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server.app as app_module
+from server.app import app
+from server.fate_owner import FateOwner
+from server.storage import ChartStore
+
+BIRTH = {"year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 0, "gender": "male"}
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = ChartStore(str(tmp_path / "charts.db"), batch_size=50, flush_interval=0.01)
+    monkeypatch.setattr(app_module, "chart_store", store)
+    return store
+
+
+def test_batched_writes_and_queries(store):
+    """写入在后台批量完成；同一用户的同一命盘只保留一行；报告压缩存储，按用户隔离"""
+    for i in range(3):
+        store.save_chart("alice", 100 + i, {"year": 2000 + i}, {"bazi": i})
+    store.save_chart("alice", 100, {"year": 1999}, {"bazi": "updated"})
+    store.save_chart("bob", 100, {"year": 1980}, {"bazi": "bob"})
+    store.save_report("alice", 100, "fate", "命" * 5000, "stub")
+    store.flush()
+    assert store.written == 6
+
+    charts = store.list_charts("alice")
+    assert [c["chart_code"] for c in charts] == [100, 102, 101]
+    assert charts[0]["birth"] == {"year": 1999} and charts[0]["reports"] == 1
+    assert [c["chart_code"] for c in store.list_charts("alice", limit=2, before=charts[1]["updated_at"])] == [101]
+
+    detail = store.get_chart("alice", charts[0]["chart_id"])
+    assert detail["bazi"] == {"bazi": "updated"}
+    assert detail["reports"][0]["content"] == "命" * 5000
+    assert store.get_chart("bob", charts[0]["chart_id"]) is None
+    assert store.get_chart("bob", store.list_charts("bob")[0]["chart_id"])["reports"] == []
+
+
+def test_history_api_reads_without_engine(store, monkeypatch):
+    """排盘和生成的报告保存到用户历史，查询时不经过排盘引擎和模型"""
+    client = TestClient(app)
+    headers = {"X-User-Id": "alice"}
+    chart = client.post("/api/calculate_bazi", json=BIRTH, headers=headers).json()
+    body = client.post("/api/fate_report", json=BIRTH, headers=headers).text
+    streamed = "".join(
+        json.loads(line[len("data: "):]).get("text", "") for line in body.splitlines() if line.startswith("data: ")
+    )
+    store.flush()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("查询历史记录时不应排盘或调用模型")
+
+    monkeypatch.setattr(FateOwner, "calculate_bazi", fail)
+    monkeypatch.setattr(app_module, "get_chat_model", fail)
+
+    history = client.get("/api/history", headers=headers).json()
+    assert len(history) == 1 and history[0]["reports"] == 1
+    assert history[0]["chart_code"] == chart["chart_code"] and history[0]["bazi"] == chart["bazi_string"]
+    detail = client.get(f"/api/history/{history[0]['chart_id']}", headers=headers).json()
+    assert detail["bazi"]["day_pillar"]["heavenly_stem"]
+    assert detail["reports"][0]["kind"] == "fate"
+    assert detail["reports"][0]["content"] == streamed
+
+    assert client.get("/api/history").status_code == 401
+    assert client.get(f"/api/history/{history[0]['chart_id']}", headers={"X-User-Id": "bob"}).status_code == 404
+
+
+def test_persistence_is_opt_in(tmp_path):
+    """未设置CHART_DB_PATH时关闭持久化，不在工作目录下创建数据库文件"""
+    env = {k: v for k, v in os.environ.items() if k != "CHART_DB_PATH"}
+    env["PYTHONPATH"] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = "from server.storage import chart_store; print(chart_store.enabled)"
+    proc = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env, capture_output=True, text=True, check=True)
+    assert proc.stdout.strip() == "False"
+    assert list(tmp_path.iterdir()) == []
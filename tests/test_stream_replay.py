@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试文件：测试可续传的报告流
+- 断线重连携带Last-Event-ID时从断点续传，不重新调用LLM
+- 环形缓冲区及基于时间、容量的淘汰策略
+"""
+
+import asyncio
+import re
+
+import pytest
+
+import server.app as server_app
+from server.stream_replay import ReportStream, ReportStreamRegistry, parse_event_id, report_streams
+from tests.test_llm_stream import StubChatModel, stream_fate_report, count_messages
+
+
+def event_ids(chunks):
+    """提取SSE事件ID"""
+    return [m.group(1) for chunk in chunks for m in re.finditer(r"^id: (.+)$", chunk, re.M)]
+
+
+async def finite_events(n: int):
+    for i in range(n):
+        yield "message", {"text": str(i)}
+
+
+def test_parse_event_id():
+    """事件ID解析"""
+    assert parse_event_id("abc123-42") == ("abc123", 42)
+    assert parse_event_id("abc123") is None
+    assert parse_event_id("abc123-x") is None
+    assert parse_event_id(None) is None
+
+
+def test_resume_with_last_event_id(monkeypatch):
+    """断线重连后从断点继续输出，且不重新调用LLM"""
+    model = StubChatModel(num_tokens=200, token_delay=0.01)
+    monkeypatch.setattr(server_app, "get_chat_model", lambda model_source: model)
+    monkeypatch.setattr(report_streams, "resume_grace", 5)
+
+    async def scenario():
+        first = await stream_fate_report(disconnect_after_events=10)
+        await asyncio.sleep(0.05)
+        second = await stream_fate_report(disconnect_after_events=10**6, last_event_id=event_ids(first)[-1])
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    ids = event_ids(first) + event_ids(second)
+    stream_ids = {parse_event_id(i)[0] for i in ids}
+    seqs = [parse_event_id(i)[1] for i in ids]
+
+    assert model.calls == 1
+    assert len(stream_ids) == 1
+    assert seqs == list(range(len(seqs)))
+    assert count_messages(first) + count_messages(second) == 200
+    assert "event: end" in second[-1]
+
+
+def test_unknown_last_event_id_starts_new_stream(monkeypatch):
+    """无法续传的Last-Event-ID按新请求处理"""
+    model = StubChatModel(num_tokens=5, token_delay=0)
+    monkeypatch.setattr(server_app, "get_chat_model", lambda model_source: model)
+
+    chunks = asyncio.run(stream_fate_report(disconnect_after_events=10**6, last_event_id="missing-3"))
+
+    assert model.calls == 1
+    assert count_messages(chunks) == 5
+    assert parse_event_id(event_ids(chunks)[0])[1] == 0
+
+
+def test_ring_buffer_drops_oldest_events():
+    """单个流只保留最近的max_events个事件，被覆盖的偏移量不可续传"""
+    async def scenario():
+        registry = ReportStreamRegistry(max_events=3)
+        stream = registry.create(finite_events(10))
+        await stream.task
+        return registry, stream
+
+    registry, stream = asyncio.run(scenario())
+    assert stream.finished
+    assert len(stream.events) == 3
+    assert stream.first_seq == 7
+    assert registry.resolve(f"{stream.stream_id}-6") is not None
+    assert registry.resolve(f"{stream.stream_id}-5") is None
+
+
+def test_slow_subscriber_receives_end():
+    """订阅者输出较慢时，流在输出期间结束，之后追加的事件（包括end）仍全部送达"""
+    async def events():
+        for i in range(50):
+            yield "message", {"text": str(i)}
+            await asyncio.sleep(0)
+        yield "end", {}
+
+    async def scenario():
+        registry = ReportStreamRegistry()
+        stream = registry.create(events())
+        received = []
+        async for text in stream.subscribe(-1):
+            received.append(text)
+            await asyncio.sleep(0.001)
+        return stream, received
+
+    stream, received = asyncio.run(scenario())
+    assert len(received) == stream.next_seq == 51
+    assert "event: end" in received[-1]
+
+
+def test_eviction_by_ttl_and_size():
+    """已结束的流超过TTL后淘汰（查找时也会淘汰）；流数量超过上限时优先淘汰最早结束的流"""
+    async def scenario():
+        registry = ReportStreamRegistry(max_streams=2, finished_ttl=60)
+        first = registry.create(finite_events(1))
+        await first.task
+        second = registry.create(finite_events(1))
+        await second.task
+        third = registry.create(finite_events(1))
+        await third.task
+        size_evicted = registry.get(first.stream_id) is None and registry.get(second.stream_id) is not None
+
+        # 不再创建新流时，查找也会淘汰过期的流
+        registry.finished_ttl = 0
+        looked_up = registry.resolve(f"{third.stream_id}-0")
+        return size_evicted, looked_up, len(registry)
+
+    size_evicted, looked_up, remaining = asyncio.run(scenario())
+    assert size_evicted
+    assert looked_up is None
+    assert remaining == 0
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试文件：测试本地桩模型（MODEL_SOURCE=stub）
+"""
+
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from server.app import app
+from server.model import get_chat_model
+from server.stub_model import StubChatModel, StubLLMError
+
+
+async def stream_timings(model: StubChatModel):
+    """返回(首token时间, 总时间, 输出文本, 最后一个块)"""
+    started_at = time.perf_counter()
+    ttft, chunks = None, []
+    async for chunk in model.astream("hi"):
+        if ttft is None:
+            ttft = time.perf_counter() - started_at
+        chunks.append(chunk)
+    return ttft, time.perf_counter() - started_at, "".join(c.content for c in chunks), chunks[-1]
+
+
+def test_stub_selected_by_model_source():
+    """MODEL_SOURCE=stub 返回桩模型"""
+    assert isinstance(get_chat_model("stub"), StubChatModel)
+
+
+def test_stub_streams_with_configured_latency():
+    """按配置的TTFT和tokens/s输出，并附带用量信息"""
+    model = get_chat_model("stub", text="甲乙丙丁戊己庚辛壬癸", time_to_first_token=0.1, tokens_per_second=100)
+    ttft, total, text, last = asyncio.run(stream_timings(model))
+
+    assert text == "甲乙丙丁戊己庚辛壬癸"
+    assert 0.1 <= ttft < 0.2
+    assert 0.19 <= total < 0.4
+    assert last.usage_metadata["output_tokens"] == 10
+    assert last.response_metadata["eval_count"] == 10
+
+
+def test_stub_error_injection_is_reproducible():
+    """相同种子下注入错误的序列一致"""
+    def outcomes(seed: int):
+        results = []
+        for _ in range(20):
+            model = StubChatModel(text="x", time_to_first_token=0, tokens_per_second=0, error_rate=0.5, seed=seed)
+            try:
+                model.invoke("hi")
+                results.append(True)
+            except StubLLMError:
+                results.append(False)
+        return results
+
+    from server import stub_model
+    first = outcomes(7)
+    stub_model._RANDOMS.pop(7)
+    second = outcomes(7)
+    assert first == second
+    assert True in first and False in first
+
+
+def test_basic_report_offline():
+    """报告接口可完全离线运行"""
+    client = TestClient(app)
+    response = client.post("/api/basic_report", json={
+        "year": 1990, "month": 1, "day": 1, "hour": 12, "minute": 0, "gender": "male"
+    })
+    assert response.status_code == 200
+    assert response.json()["reading"]
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
+
+
+def test_stub_prefix_cache():
+    """报告提示词的系统消息在前：相同前缀只计算一次，之后的请求只计算命主信息"""
+    from server.model import build_messages
+    from server.prompt_templates import BAZI_REPORT_SYSTEM_PROMPT, get_bazi_report_prompt
+
+    model = get_chat_model("stub", text="好", time_to_first_token=0, tokens_per_second=0, cache_slots=1)
+
+    def evaluated(bazi):
+        messages = build_messages(get_bazi_report_prompt({"gender": "male", "bazi": bazi}), system=BAZI_REPORT_SYSTEM_PROMPT)
+        assert messages[0].content == BAZI_REPORT_SYSTEM_PROMPT
+        last = list(model.stream(messages))[-1]
+        return last.response_metadata["prompt_eval_count"], last.usage_metadata["input_tokens"]
+
+    evaluated("甲子 乙丑 丙寅 丁卯")
+    count, total = evaluated("己巳 丙子 丙寅 甲午")
+    assert count < total - len(BAZI_REPORT_SYSTEM_PROMPT)
+    assert "藏干" not in get_bazi_report_prompt({"bazi": "己巳 丙子 丙寅 甲午"})